@@ -0,0 +1,106 @@
+# clean_io.py
+from __future__ import annotations
+import os
+from pathlib import Path
+from typing import Optional
+import pandas as pd
+
+import schema
+
+# Format för mellanfilerna i data/clean: "csv" (standard) eller "parquet" (typade kolumner,
+# kräver pyarrow). Väljs med SPBANK_CLEAN_FORMAT eller per skript med --format.
+CLEAN_FORMAT = os.getenv("SPBANK_CLEAN_FORMAT", "csv").lower()
+SUFFIXES = {"csv": ".csv", "parquet": ".parquet"}
+
+def _check_format(fmt: str) -> str:
+    fmt = (fmt or CLEAN_FORMAT).lower()
+    if fmt not in SUFFIXES:
+        raise ValueError(f"Okänt filformat: {fmt!r} (välj {' eller '.join(SUFFIXES)}).")
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("Parquet kräver pyarrow (pip install pyarrow), eller kör med format csv.") from None
+    return fmt
+
+
+def format_of(path) -> str:
+    return "parquet" if Path(path).suffix.lower() == ".parquet" else "csv"
+
+
+def clean_path(path, fmt: Optional[str] = None) -> Path:
+    """Samma sökväg med filändelse efter formatet (standard CLEAN_FORMAT)."""
+    return Path(path).with_suffix(SUFFIXES[_check_format(fmt)])
+
+
+def find_clean(path, fmt: Optional[str] = None) -> Path:
+    """
+    Mellanfilen att läsa: först i valt format, annars sökvägen som den är, annars något annat
+    format som finns. Finns ingen returneras sökvägen i valt format (så felet pekar på den).
+    """
+    preferred = Path(path).with_suffix(SUFFIXES.get((fmt or CLEAN_FORMAT).lower(), ".csv"))
+    candidates = [preferred, Path(path)] + [Path(path).with_suffix(s) for s in SUFFIXES.values()]
+    return next((p for p in candidates if p.exists()), preferred)
+
+
+def read_clean(path, columns=None) -> pd.DataFrame:
+    """Läser en mellanfil typad enligt schema.py (CSV och Parquet ger samma typer)."""
+    path = Path(path)
+    if format_of(path) == "parquet":
+        _check_format("parquet")
+        return schema.apply_types(pd.read_parquet(path, columns=columns))
+    return schema.read_csv(path, usecols=columns)
+
+
+def write_clean(df: pd.DataFrame, path) -> Path:
+    """Skriver efter filändelsen: CSV som tidigare, Parquet med typade kolumner (schema.py)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if format_of(path) == "parquet":
+        _check_format("parquet")
+        schema.apply_types(df).to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False, encoding="utf-8")
+    return path
+
+
+class CleanWriter:
+    """Skriver en mellanfil chunk för chunk (CSV: append, Parquet: en row group per chunk)."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        self.parquet = format_of(self.path) == "parquet"
+        if self.parquet:
+            _check_format("parquet")
+        self._writer = None
+        self._schema = None
+        self.rows = 0
+
+    def write(self, df: pd.DataFrame) -> None:
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            # Kategorier som text: varje chunk har egna kategorier, men filens schema är fast
+            df = schema.apply_types(df, categories=False)
+            df = df.astype({c: str for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)})
+            table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+            if self._writer is None:
+                self._schema = table.schema
+                self._writer = pq.ParquetWriter(self.tmp, self._schema)
+            self._writer.write_table(table)
+        else:
+            df.to_csv(self.tmp, mode="w" if self._writer is None else "a", header=self._writer is None,
+                      index=False, encoding="utf-8")
+            self._writer = True
+        self.rows += len(df)
+
+    def close(self, columns=None) -> Path:
+        """Avslutar och flyttar filen på plats; utan skrivna chunkar skrivs en tom fil med columns."""
+        if self._writer is None:
+            self.write(pd.DataFrame(columns=list(columns or [])))
+        if self.parquet:
+            self._writer.close()
+        self.tmp.replace(self.path)
+        return self.path
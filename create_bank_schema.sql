@@ -43,8 +43,33 @@ CREATE TABLE IF NOT EXISTS bank.flagged_transactions (
     amount NUMERIC(18,2)
 );
 
+-- Checkpoints för återupptagbar import (import_checkpoints.py)
+CREATE TABLE IF NOT EXISTS bank.import_checkpoints (
+    source TEXT NOT NULL,
+    file_hash VARCHAR(64) NOT NULL,
+    rows_done BIGINT NOT NULL DEFAULT 0,
+    total_rows BIGINT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (source, file_hash)
+);
+
+-- Vattenmärken för inkrementell import (import_watermarks.py)
+CREATE TABLE IF NOT EXISTS bank.import_watermarks (
+    source TEXT PRIMARY KEY,
+    max_timestamp TIMESTAMP,
+    rows_done BIGINT NOT NULL DEFAULT 0,
+    range_rows INTEGER NOT NULL,
+    range_hashes TEXT[],
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Indexer
 CREATE INDEX IF NOT EXISTS ix_accounts_customer_id ON bank.accounts(customer_id);
 CREATE INDEX IF NOT EXISTS ix_transactions_sender_account_id ON bank.transactions(sender_account_id);
 CREATE INDEX IF NOT EXISTS ix_transactions_receiver_account_id ON bank.transactions(receiver_account_id);
+-- Ping-pong-uppslag i SQL-motorn (risk_sql.py): retur B->A inom N dagar
+CREATE INDEX IF NOT EXISTS ix_transactions_pair_ts ON bank.transactions(sender_account_id, receiver_account_id, timestamp);
 CREATE INDEX IF NOT EXISTS ix_flagged_tx_id ON bank.flagged_transactions(transaction_id);
+-- En flagga per (transaktion, orsak, datum); används av ON CONFLICT i import_flagged_transactions.py
+CREATE UNIQUE INDEX IF NOT EXISTS ux_flagged_tx_reason_date
+    ON bank.flagged_transactions(transaction_id, reason, flagged_date) NULLS NOT DISTINCT;
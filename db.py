@@ -1,4 +1,5 @@
 
+import io
 import os
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
@@ -20,3 +21,25 @@ if "options=" not in DATABASE_URL:
 
 engine = create_engine(DATABASE_URL, echo=False, future=True)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+
+def copy_frame(conn, table: str, df, chunk_rows: int = 100_000) -> int:
+    """
+    COPY:ar df (kolumner i samma ordning som i tabellen) in i table via CSV-format.
+    Tomma strängar blir NULL. Körs i conn:s transaktion; kräver psycopg (3).
+    """
+    if engine.dialect.driver != "psycopg":
+        raise RuntimeError(f"COPY kräver drivrutinen psycopg (nu {engine.dialect.driver}); kör radvis i stället.")
+    cols = ", ".join(df.columns)
+    with conn.connection.driver_connection.cursor() as cur:
+        with cur.copy(f"COPY {table} ({cols}) FROM STDIN WITH (FORMAT csv)") as cp:
+            for start in range(0, len(df), chunk_rows):
+                buf = io.StringIO()
+                df.iloc[start:start + chunk_rows].to_csv(buf, index=False, header=False)
+                cp.write(buf.getvalue())
+    return len(df)
+
+
+def worker_engine(workers: int):
+    """Separat engine med en pool som rymmer en anslutning per worker (parallell import)."""
+    return create_engine(DATABASE_URL, echo=False, future=True, pool_size=max(1, workers), max_overflow=0)
@@ -1,5 +1,7 @@
 
 from prefect import flow, task
+from prefect.cache_policies import NO_CACHE
+import argparse
 import subprocess
 import sys
 import re
@@ -82,33 +84,86 @@ def init_schema_task():
 def run_validation_task():
     return run_and_capture([sys.executable, "validation.py"], "Kör validering")
 
-@task
-def import_customers_task():
-    out = run_and_capture([sys.executable, "import_customers.py"], "Import customers")
+def check_customers():
     counts = db_counts()
     print(f"🔎 DB efter customers/accounts → customers={counts.get('customers',0)}, accounts={counts.get('accounts',0)}")
     if counts.get('customers',0) == 0 or counts.get('accounts',0) == 0:
         print("⚠️ VARNING: Inga kunder eller konton insatta.")
-    return out
 
-@task
-def import_transactions_task():
-    out = run_and_capture([sys.executable, "import_transactions.py"], "Import transactions")
+def check_transactions():
     counts = db_counts()
     print(f"🔎 DB efter transactions → transactions={counts.get('transactions',0)}")
     if counts.get('transactions',0) == 0:
         print("⚠️ VARNING: Inga transaktioner insatta.")
-    return out
 
-@task
-def import_flagged_task():
-    out = run_and_capture([sys.executable, "import_flagged_transactions.py"], "Import flagged transactions")
+def check_flagged():
     counts = db_counts()
     print(f"🔎 DB efter flagged → flagged={counts.get('flagged',0)}")
     if counts.get('flagged',0) == 0:
         print("ℹ️ Info: flagged_transactions är tomt. Justera regler/trösklar och kör om validation.")
+
+@task
+def import_customers_task():
+    out = run_and_capture([sys.executable, "import_customers.py"], "Import customers")
+    check_customers()
     return out
 
+@task
+def import_transactions_task():
+    out = run_and_capture([sys.executable, "import_transactions.py"], "Import transactions")
+    check_transactions()
+    return out
+
+@task
+def import_flagged_task():
+    out = run_and_capture([sys.executable, "import_flagged_transactions.py"], "Import flagged transactions")
+    check_flagged()
+    return out
+
+# ---------- Sammanslaget läge: allt i en process, DataFrames skickas direkt mellan stegen ----------
+# (NO_CACHE: Prefect ska inte hasha DataFrame-argumenten)
+
+@task(cache_policy=NO_CACHE)
+def validate_in_process_task(keep_files: bool):
+    import validation
+    print("▶ Kör validering (i processen)")
+    customers = validation.clean_customers(write=keep_files)
+    transactions = validation.clean_transactions(write=keep_files)
+    return customers, transactions
+
+@task(cache_policy=NO_CACHE)
+def score_in_process_task(transactions, keep_files: bool):
+    import validation
+    print("▶ Flaggar transaktioner (i processen)")
+    return validation.flag_suspected_transactions(transactions, write=keep_files)
+
+@task(cache_policy=NO_CACHE)
+def load_customers_task(customers):
+    import import_customers
+    print("▶ Import customers (i processen)")
+    s = import_customers.load_customers(customers)
+    import_customers.print_summary(s)
+    check_customers()
+    return s
+
+@task(cache_policy=NO_CACHE)
+def load_transactions_task(transactions):
+    import import_transactions
+    print("▶ Import transactions (i processen)")
+    s = import_transactions.load_transactions(transactions)
+    import_transactions.print_summary(s)
+    check_transactions()
+    return s
+
+@task(cache_policy=NO_CACHE)
+def load_flagged_task(flagged):
+    import import_flagged_transactions
+    print("▶ Import flagged transactions (i processen)")
+    s = import_flagged_transactions.load_flagged(flagged)
+    import_flagged_transactions.print_summary(s)
+    check_flagged()
+    return s
+
 @task
 def reporting_task():
     print("\n🧾 Rapport: Flagged-transaktioner (översikt)\n" + "-"*60)
@@ -135,16 +190,30 @@ def reporting_task():
 
 
 @flow(name="ETL-bank-flow")
-def full_pipeline():
+def full_pipeline(mode: str = "fused", keep_files: bool = False):
+    """
+    mode="fused": validering, flaggning och laddning i samma process; DataFrames och summeringar
+                  skickas direkt mellan stegen (keep_files=True skriver ändå filerna i data/clean).
+    mode="subprocess": varje steg som eget skript, filer i data/clean och summering ur stdout.
+    """
     init_schema_task()
-    out1 = run_validation_task()
-    out2 = import_customers_task()
-    out3 = import_transactions_task()
-    out4 = import_flagged_task()
+    if mode == "subprocess":
+        out1 = run_validation_task()
+        out2 = import_customers_task()
+        out3 = import_transactions_task()
+        out4 = import_flagged_task()
+        s = extract_summary("\n".join([out1, out2, out3, out4]))
+    elif mode == "fused":
+        customers, transactions = validate_in_process_task(keep_files)
+        flagged = score_in_process_task(transactions, keep_files)
+        s = {}
+        s.update(load_customers_task(customers))
+        s.update(load_transactions_task(transactions))
+        s.update(load_flagged_task(flagged))
+    else:
+        raise ValueError(f"Okänt läge: {mode!r} (välj fused eller subprocess).")
 
     # Summering
-    all_out = "\n".join([out1, out2, out3, out4])
-    s = extract_summary(all_out)
     counts = db_counts()
 
     print("\n" + "="*72)
@@ -175,4 +244,10 @@ def full_pipeline():
     reporting_task()
 
 if __name__ == "__main__":
-    full_pipeline()
+    ap = argparse.ArgumentParser(description="Kör hela ETL-flödet (validering, import, flaggning, rapport).")
+    ap.add_argument("--subprocess", action="store_true",
+                    help="Kör varje steg som eget skript (tidigare läge) i stället för i samma process")
+    ap.add_argument("--keep-files", dest="keep_files", action="store_true",
+                    help="Skriv mellanfilerna i data/clean även i sammanslaget läge")
+    args = ap.parse_args()
+    full_pipeline(mode="subprocess" if args.subprocess else "fused", keep_files=args.keep_files)
@@ -0,0 +1,106 @@
+# import_checkpoints.py
+from __future__ import annotations
+import hashlib
+import time
+from pathlib import Path
+from typing import Callable, Optional
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from db import engine
+
+BATCH_ROWS = 100_000
+
+
+def file_hash(path, block: int = 1 << 20) -> str:
+    """blake2b av filinnehållet; en ändrad fil får en ny checkpoint i stället för att återupptas."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while chunk := f.read(block):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class Checkpoint:
+    """Antal committade rader per (källfil, filhash) i bank.import_checkpoints."""
+
+    def __init__(self, path):
+        self.source = str(Path(path).resolve())
+        self.file_hash = file_hash(path)
+        self._key = {"source": self.source, "file_hash": self.file_hash}
+
+    def rows_done(self, conn) -> int:
+        n = conn.execute(text(
+            "SELECT rows_done FROM bank.import_checkpoints WHERE source = :source AND file_hash = :file_hash"
+        ), self._key).scalar()
+        return int(n or 0)
+
+    def save(self, conn, rows_done: int, total_rows: int) -> None:
+        conn.execute(text("""
+            INSERT INTO bank.import_checkpoints (source, file_hash, rows_done, total_rows, updated_at)
+            VALUES (:source, :file_hash, :rows_done, :total_rows, now())
+            ON CONFLICT (source, file_hash)
+            DO UPDATE SET rows_done = EXCLUDED.rows_done, total_rows = EXCLUDED.total_rows, updated_at = now()
+        """), {**self._key, "rows_done": rows_done, "total_rows": total_rows})
+
+    def clear(self, conn) -> None:
+        # Klar import: nästa körning av samma fil (t.ex. mot en tömd databas) börjar om från rad 0
+        conn.execute(text(
+            "DELETE FROM bank.import_checkpoints WHERE source = :source AND file_hash = :file_hash"
+        ), self._key)
+
+
+class Progress:
+    """Skriver rader/s och beräknad återstående tid efter varje batch."""
+
+    def __init__(self, label: str, total: int, done: int = 0):
+        self.label, self.total, self.done = label, total, done
+        self.start_done = done
+        self.t0 = time.perf_counter()
+
+    def update(self, rows: int) -> None:
+        self.done += rows
+        elapsed = time.perf_counter() - self.t0
+        rate = (self.done - self.start_done) / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate > 0 else 0.0
+        print(f"[{self.label}] {self.done}/{self.total} rader ({rate:,.0f} rader/s, ETA {eta:,.0f} s)")
+
+
+def load_in_batches(frame: pd.DataFrame, load: Callable, batch_rows: Optional[int] = None,
+                    source=None, label: str = "import") -> list:
+    """
+    Kör load(batch, conn) batch för batch i filens ordning. Varje batch är en egen transaktion
+    och committas tillsammans med checkpointen (om source, källfilens sökväg), så en ny körning
+    av samma fil fortsätter efter senaste committade batch. batch_rows=None: allt i en
+    transaktion som tidigare. Returnerar resultaten från load för de batchar som kördes nu.
+
+    Checkpointen är en radposition i filen, så med source måste frame vara hela filen i
+    filens ordning (kolumnen ord = 0..n-1); rader som inte ska skickas filtreras i load.
+    """
+    total = len(frame)
+    batch_rows = batch_rows or max(total, 1)
+    checkpoint = Checkpoint(source) if source is not None else None
+    if checkpoint and not np.array_equal(frame["ord"].to_numpy(), np.arange(total)):
+        raise ValueError("load_in_batches med checkpoint kräver hela filen i filens ordning (ord = 0..n-1).")
+    start = 0
+    if checkpoint:
+        with engine.connect() as conn:
+            start = min(checkpoint.rows_done(conn), total)
+        if start:
+            print(f"[{label}] Återupptar {Path(source).name} från rad {start} av {total} (checkpoint).")
+    progress = Progress(label, total, start) if batch_rows < total else None
+
+    results = []
+    for lo in range(start, total, batch_rows):
+        batch = frame.iloc[lo:lo + batch_rows]
+        with engine.begin() as conn:
+            results.append(load(batch, conn))
+            if checkpoint:
+                checkpoint.save(conn, lo + len(batch), total)
+        if progress:
+            progress.update(len(batch))
+    if checkpoint:
+        with engine.begin() as conn:
+            checkpoint.clear(conn)
+    return results
@@ -1,20 +1,35 @@
+import argparse
+from typing import Optional
 
 import pandas as pd
 from sqlalchemy import text
-from db import engine
+from db import engine, copy_frame
+from clean_io import find_clean, read_clean
+from import_checkpoints import BATCH_ROWS, load_in_batches
+from import_workers import sum_counts
 
 CUSTOMERS_CSV = "data/clean/customers_clean.csv"
 
-def main():
-    df = pd.read_csv(CUSTOMERS_CSV, dtype=str, keep_default_na=False).rename(
-        columns={
-            "Customer":"customer",
-            "Personnummer":"personnummer",
-            "BankAccount":"account_number",
-            "Address":"address",
-            "Phone":"phone"
-        }
-    )
+RENAME = {
+    "Customer":"customer",
+    "Personnummer":"personnummer",
+    "BankAccount":"account_number",
+    "Address":"address",
+    "Phone":"phone"
+}
+
+def load_customers(df: pd.DataFrame, bulk: bool = True, batch_rows: Optional[int] = None, source=None) -> dict:
+    """
+    Laddar städade kunder (kolumnnamn som i customers_clean) till bank.customers/bank.accounts.
+    bulk=True: COPY till en stagingtabell och mängdbaserade INSERT (två satser i stället för
+    upp till tre rundresor per rad). bulk=False: radvis som tidigare. Samma antal i båda.
+    batch_rows: committa var batch_rows:e rad; source (källfil) ger checkpoint och återupptagning.
+    Returnerar {"customers": (inserted, skipped_existing), "accounts": (inserted, skipped_existing, missing_owner)}.
+    """
+    df = df.rename(columns=RENAME)
+    return _load_bulk(df, batch_rows, source) if bulk else _load_rowwise(df)
+
+def _load_rowwise(df: pd.DataFrame) -> dict:
     inserted_customers = skipped_customers = 0
     inserted_accounts = skipped_accounts = missing_owner = 0
 
@@ -60,8 +75,93 @@ def main():
                     if exists: skipped_accounts += 1
                     else: missing_owner += 1
 
-    print(f"[customers] inserted={inserted_customers}, skipped_existing={skipped_customers}")
-    print(f"[accounts ] inserted={inserted_accounts}, skipped_existing={skipped_accounts}, missing_owner={missing_owner}")
+    return {
+        "customers": (inserted_customers, skipped_customers),
+        "accounts": (inserted_accounts, skipped_accounts, missing_owner),
+    }
+
+STAGE_COLUMNS = ["ord", "customer", "personnummer", "address", "phone", "account_number"]
+
+# Första förekomsten per personnummer/kontonummer vinner, i filens ordning (som radvis)
+SQL_BULK_CUSTOMERS = text("""
+    WITH ins AS (
+        INSERT INTO bank.customers (customer, personnummer, address, phone)
+        SELECT customer, personnummer, address, phone
+        FROM (
+            SELECT DISTINCT ON (COALESCE(personnummer,''))
+                   ord, COALESCE(customer,'') AS customer, COALESCE(personnummer,'') AS personnummer,
+                   address, phone
+            FROM stage_customers
+            ORDER BY COALESCE(personnummer,''), ord
+        ) first_rows
+        ORDER BY ord
+        ON CONFLICT (personnummer) DO NOTHING
+        RETURNING 1
+    )
+    SELECT COUNT(*) FROM ins
+""")
+
+SQL_BULK_ACCOUNTS = text("""
+    WITH src AS (
+        SELECT s.ord, s.account_number, c.id AS customer_id
+        FROM stage_customers s
+        LEFT JOIN bank.customers c ON c.personnummer = COALESCE(s.personnummer,'')
+        WHERE s.account_number IS NOT NULL
+    ), ins AS (
+        INSERT INTO bank.accounts (account_number, customer_id, balance)
+        SELECT account_number, customer_id, 0
+        FROM (
+            SELECT DISTINCT ON (account_number) ord, account_number, customer_id
+            FROM src
+            WHERE customer_id IS NOT NULL
+            ORDER BY account_number, ord
+        ) first_rows
+        ORDER BY ord
+        ON CONFLICT (account_number) DO NOTHING
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM ins),
+           (SELECT COUNT(*) FROM src),
+           (SELECT COUNT(*) FROM src WHERE customer_id IS NULL)
+""")
+
+def _load_bulk(df: pd.DataFrame, batch_rows: Optional[int] = None, source=None) -> dict:
+    # Samma trimning som radvis, men på hela kolumner; tomma strängar blir NULL i COPY
+    stage = df.reindex(columns=STAGE_COLUMNS[1:], fill_value="").astype(str)
+    stage = stage.apply(lambda s: s.str.strip())
+    stage.insert(0, "ord", range(len(stage)))
+
+    results = load_in_batches(stage, _insert_stage, batch_rows, source, "customers")
+    return sum_counts(results, {"customers": (0, 0), "accounts": (0, 0, 0)})
+
+def _insert_stage(stage: pd.DataFrame, conn) -> dict:
+    conn.execute(text(
+        "CREATE TEMP TABLE stage_customers (ord BIGINT, customer TEXT, personnummer TEXT,"
+        " address TEXT, phone TEXT, account_number TEXT) ON COMMIT DROP"
+    ))
+    copy_frame(conn, "stage_customers", stage)
+    inserted_customers = conn.execute(SQL_BULK_CUSTOMERS).scalar_one()
+    inserted_accounts, account_rows, missing_owner = conn.execute(SQL_BULK_ACCOUNTS).one()
+    return {
+        "customers": (inserted_customers, len(stage) - inserted_customers),
+        "accounts": (inserted_accounts, account_rows - inserted_accounts - missing_owner, missing_owner),
+    }
+
+def print_summary(s: dict) -> None:
+    inserted, skipped = s["customers"]
+    print(f"[customers] inserted={inserted}, skipped_existing={skipped}")
+    inserted, skipped, missing_owner = s["accounts"]
+    print(f"[accounts ] inserted={inserted}, skipped_existing={skipped}, missing_owner={missing_owner}")
+
+def main(bulk: bool = True, batch_rows: Optional[int] = BATCH_ROWS):
+    # CSV eller Parquet (SPBANK_CLEAN_FORMAT); båda ger textkolumner här
+    path = find_clean(CUSTOMERS_CSV)
+    print_summary(load_customers(read_clean(path), bulk=bulk, batch_rows=batch_rows, source=path))
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser(description="Importera städade kunder och konton.")
+    ap.add_argument("--rowwise", action="store_true", help="En INSERT per rad i stället för COPY + mängd-INSERT")
+    ap.add_argument("--batch-size", type=int, default=BATCH_ROWS,
+                    help="Rader per commit (0 = allt i en transaktion); avbruten import återupptas")
+    args = ap.parse_args()
+    main(bulk=not args.rowwise, batch_rows=args.batch_size or None)
@@ -1,11 +1,17 @@
 
+import argparse
 import os
 import math
+import numpy as np
 import pandas as pd
 from datetime import datetime, date
+from typing import Optional
 from sqlalchemy import text, bindparam
 from sqlalchemy.types import String, Date, Numeric
-from db import engine
+from db import engine, copy_frame
+from clean_io import find_clean, read_clean
+from import_checkpoints import BATCH_ROWS, load_in_batches
+from import_workers import run_partitioned, sum_counts, worker_pool
 
 FLAGGED_CSV = "data/clean/flagged_transactions.csv"
 
@@ -22,6 +28,13 @@ def to_numeric_or_none(x):
         return None
 
 def to_date_or_none(x):
+    if x is None or x is pd.NaT:
+        return None
+    # Parquet ger redan date/Timestamp
+    if isinstance(x, datetime):
+        return x.date()
+    if isinstance(x, date):
+        return x
     if not x:
         return None
     s = str(x).strip()
@@ -37,20 +50,26 @@ def to_date_or_none(x):
     except Exception:
         return None
 
-def main():
-    if not os.path.exists(FLAGGED_CSV):
-        print(f"[flagged] CSV saknas: {FLAGGED_CSV}")
-        return
-
-    df = pd.read_csv(FLAGGED_CSV, dtype=str, keep_default_na=False)
-    print(f"[flagged] CSV-rader (exkl. header): {len(df)}")
-
+def load_flagged(df: pd.DataFrame, bulk: bool = True, batch_rows: Optional[int] = None, workers: int = 1,
+                 source=None) -> dict:
+    """
+    Laddar flaggade rader (transaction_id, reason, flagged_date, amount) till bank.flagged_transactions.
+    bulk=True: batchvis COPY till staging och INSERT ... ON CONFLICT DO NOTHING mot den unika
+    nyckeln (transaction_id, reason, flagged_date). Varje batch om batch_rows rader committas för
+    sig (med checkpoint om source, källfilens sökväg); batch_rows=None: allt i en transaktion,
+    som load_customers/load_transactions. En batch som fel räknas som failed_rows och resten fortsätter.
+    bulk=False: en INSERT ... WHERE NOT EXISTS per rad som tidigare.
+    workers > 1: delar på hash av transaction_id som laddas parallellt, en transaktion per del.
+    Returnerar {"flagged": (inserted, skipped_existing, missing_tx), "failed_rows": n, "errors": [...]}.
+    """
     if "transaction_id" not in df.columns:
         if "id" in df.columns:
             df = df.rename(columns={"id": "transaction_id"})
         else:
-            raise SystemExit("❌ flagged CSV saknar kolumnen 'transaction_id'.")
+            raise SystemExit("❌ Flaggade rader saknar kolumnen 'transaction_id'.")
+    return _load_bulk(df, batch_rows, workers, source) if bulk else _load_rowwise(df)
 
+def _load_rowwise(df: pd.DataFrame) -> dict:
     inserted = skipped_existing = missing_tx = failed_rows = 0
     errors = []
 
@@ -113,11 +132,110 @@ def main():
                 failed_rows += 1
                 errors.append(f"rad {i} (tid={tid}): {type(e).__name__}: {e}")
 
-    print(f"[flagged] inserted={inserted}, skipped_existing={skipped_existing}, missing_tx={missing_tx}, failed_rows={failed_rows}")
-    if errors:
+    return {"flagged": (inserted, skipped_existing, missing_tx), "failed_rows": failed_rows, "errors": errors}
+
+def _map_unique(s: pd.Series, fn) -> pd.Series:
+    # Radfunktionen körs en gång per unikt värde (få datum, samma tolkning som radvis)
+    uniq = pd.unique(s.astype(object))
+    return s.astype(object).map(dict(zip(uniq, map(fn, uniq))))
+
+def _amounts(s: pd.Series) -> pd.Series:
+    """Vektoriserad to_numeric_or_none: float, NaN där värdet saknas eller är ogiltigt/oändligt."""
+    if pd.api.types.is_numeric_dtype(s):
+        v = s.astype(float)
+    else:
+        text_s = s.astype(str).str.strip()
+        v = pd.to_numeric(text_s, errors="coerce")
+        retry = v.isna() & (text_s != "")
+        if retry.any():
+            v[retry] = _map_unique(text_s[retry], to_numeric_or_none).astype(float)
+    return v.where(np.isfinite(v))
+
+def prepare_flagged(df: pd.DataFrame) -> pd.DataFrame:
+    """Samma normalisering som radvis, kolumnvis: trimmat id, reason (max 500), datum och belopp."""
+    reason = df["reason"].astype(str).str.strip() if "reason" in df.columns else pd.Series("", index=df.index)
+    return pd.DataFrame({
+        "ord": np.arange(len(df)),
+        "transaction_id": df["transaction_id"].astype(str).str.strip(),
+        "reason": reason.where(reason != "", "unspecified").str.slice(0, 500),
+        "flagged_date": _map_unique(df["flagged_date"], to_date_or_none) if "flagged_date" in df.columns else None,
+        "amount": _amounts(df["amount"]) if "amount" in df.columns else np.nan,
+    }, index=df.index)
+
+SQL_MISSING_TX = text("""
+    SELECT s.ord, s.transaction_id FROM stage_flagged s
+    WHERE NOT EXISTS (SELECT 1 FROM bank.transactions t WHERE t.id = COALESCE(s.transaction_id,''))
+    ORDER BY s.ord
+""")
+
+SQL_BULK_FLAGGED = text("""
+    WITH ins AS (
+        INSERT INTO bank.flagged_transactions (transaction_id, reason, flagged_date, amount)
+        SELECT COALESCE(s.transaction_id,''), s.reason, s.flagged_date, s.amount
+        FROM stage_flagged s
+        WHERE EXISTS (SELECT 1 FROM bank.transactions t WHERE t.id = COALESCE(s.transaction_id,''))
+        ORDER BY s.ord
+        ON CONFLICT (transaction_id, reason, flagged_date) DO NOTHING
+        RETURNING 1
+    )
+    SELECT COUNT(*) FROM ins
+""")
+
+def _load_bulk(df: pd.DataFrame, batch_rows: Optional[int] = None, workers: int = 1, source=None) -> dict:
+    stage = prepare_flagged(df)
+    zero = {"flagged": (0, 0, 0), "failed_rows": 0, "errors": [], "missing": []}
+
+    def load(batch, conn):
+        return sum_counts(run_partitioned(batch, batch["transaction_id"], workers, _load_stage, conn, pool), zero)
+
+    # En worker-pool för hela importen, inte en per batch
+    with worker_pool(workers) as pool:
+        s = sum_counts(load_in_batches(stage, load, batch_rows, source, "flagged"), zero)
+    # Utskrifterna görs här, i filens ordning, även när delarna laddats parallellt
+    for _, tid in sorted(s.pop("missing")):
+        print(f"❗ Hoppar över: Transaktion ID {tid or ''} finns inte i databasen.")
+    return s
+
+def _load_stage(stage: pd.DataFrame, conn) -> dict:
+    """Laddar en batch/del på conn; fel i batchen rullas tillbaka till en savepoint och räknas."""
+    conn.execute(text(
+        "CREATE TEMP TABLE stage_flagged (ord BIGINT, transaction_id TEXT, reason TEXT,"
+        " flagged_date DATE, amount NUMERIC) ON COMMIT DROP"
+    ))
+    try:
+        with conn.begin_nested():
+            copy_frame(conn, "stage_flagged", stage)
+            missing = [tuple(m) for m in conn.execute(SQL_MISSING_TX).all()]
+            n = conn.execute(SQL_BULK_FLAGGED).scalar_one()
+    except Exception as e:
+        error = f"batch från rad {stage['ord'].iloc[0]} ({len(stage)} rader): {type(e).__name__}: {e}"
+        return {"flagged": (0, 0, 0), "failed_rows": len(stage), "errors": [error], "missing": []}
+    return {"flagged": (n, len(stage) - n - len(missing), len(missing)), "failed_rows": 0, "errors": [],
+            "missing": missing}
+
+def print_summary(s: dict) -> None:
+    inserted, skipped, missing_tx = s["flagged"]
+    print(f"[flagged] inserted={inserted}, skipped_existing={skipped}, missing_tx={missing_tx}, failed_rows={s['failed_rows']}")
+    if s["errors"]:
         print("[flagged] exempel på fel (max 5):")
-        for line in errors[:5]:
+        for line in s["errors"][:5]:
             print("   -", line)
 
+def main(bulk: bool = True, workers: int = 1, batch_rows: Optional[int] = BATCH_ROWS):
+    path = find_clean(FLAGGED_CSV)
+    if not os.path.exists(path):
+        print(f"[flagged] Fil saknas: {path}")
+        return
+
+    df = read_clean(path)
+    print(f"[flagged] Rader i {path.name} (exkl. header): {len(df)}")
+    print_summary(load_flagged(df, bulk=bulk, batch_rows=batch_rows, workers=workers, source=path))
+
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser(description="Importera flaggade transaktioner.")
+    ap.add_argument("--rowwise", action="store_true", help="En INSERT per rad i stället för COPY + ON CONFLICT")
+    ap.add_argument("--workers", type=int, default=1, help="Antal parallella anslutningar (delar på id-hash)")
+    ap.add_argument("--batch-size", type=int, default=BATCH_ROWS,
+                    help="Rader per commit (0 = allt i en transaktion); avbruten import återupptas")
+    args = ap.parse_args()
+    main(bulk=not args.rowwise, workers=args.workers, batch_rows=args.batch_size or None)
@@ -1,7 +1,16 @@
 
+import argparse
+from typing import Optional
+
+import numpy as np
 import pandas as pd
 from sqlalchemy import text
-from db import engine
+from db import engine, copy_frame
+from clean_io import find_clean, read_clean
+from import_checkpoints import BATCH_ROWS, load_in_batches
+from import_watermarks import Watermark, known_ids, row_hashes
+from import_workers import run_partitioned, sum_counts, worker_pool
+from seen_ids import hash_ids
 
 TX_CSV = "data/clean/transactions_clean.csv"
 
@@ -13,15 +22,32 @@ def to_dt(x):
     except Exception:
         return None
 
-def main():
-    df = pd.read_csv(TX_CSV, dtype=str, keep_default_na=False)
-
+def load_transactions(df: pd.DataFrame, bulk: bool = True, workers: int = 1,
+                      batch_rows: Optional[int] = None, source=None,
+                      incremental: bool = False, skip_known: bool = False) -> dict:
+    """
+    Laddar städade transaktioner till bank.transactions.
+    bulk=True: kontonummer -> id slås upp en gång i minnet, rader COPY:as till en stagingtabell
+    och läggs in med en INSERT ... SELECT. bulk=False: en INSERT per rad som tidigare.
+    workers > 1: raderna delas på hash av id och laddas parallellt över flera anslutningar
+    (import_workers.py); varje del är en egen transaktion.
+    batch_rows: committa var batch_rows:e rad; source (källfil) ger checkpoint och återupptagning.
+    incremental (kräver source): radblock som är oförändrade sedan senaste lyckade körning skickas
+    inte (import_watermarks.py). skip_known: id:n som redan finns i databasen filtreras bort här
+    (64-bitars hashar) i stället för av ON CONFLICT. Summeringen blir densamma som utan filter.
+    Returnerar {"transactions": (inserted, skipped_existing, missing_accounts)}.
+    """
     # Stöd både 'id' och 'transaction_id'
     if "id" not in df.columns and "transaction_id" in df.columns:
         df = df.rename(columns={"transaction_id":"id"})
-    # Timestamp -> datetime
-    if "timestamp" in df.columns:
-        df["timestamp"] = df["timestamp"].apply(to_dt)
+    if bulk:
+        return _load_bulk(df, workers, batch_rows, source, incremental, skip_known)
+    return _load_rowwise(df)
+
+def _load_rowwise(df: pd.DataFrame) -> dict:
+    # Timestamp -> datetime (Parquet har redan typen)
+    if "timestamp" in df.columns and not pd.api.types.is_datetime64_any_dtype(df["timestamp"]):
+        df = df.assign(timestamp=df["timestamp"].apply(to_dt))
 
     inserted = skipped_existing = missing_accounts = 0
 
@@ -68,7 +94,179 @@ def main():
                 else:
                     skipped_existing += 1
 
-    print(f"[transactions] inserted={inserted}, skipped_existing={skipped_existing}, missing_accounts={missing_accounts}")
+    return {"transactions": (inserted, skipped_existing, missing_accounts)}
+
+_TZ_SUFFIX = r"(?:Z|[+-]\d{2}:?\d{2})$"
+
+def parse_timestamps(s: pd.Series):
+    """
+    Vektoriserad to_dt: (naiva tider, tider med tidszon i UTC), båda NaT där värdet saknas,
+    inte går att tolka eller hör till den andra serien.
+    """
+    if pd.api.types.is_datetime64_any_dtype(s):
+        if s.dt.tz is None:
+            return s, pd.Series(pd.NaT, index=s.index, dtype="datetime64[ns, UTC]")
+        return pd.Series(pd.NaT, index=s.index, dtype="datetime64[ns]"), s.dt.tz_convert("UTC")
+    s = s.astype(str).str.strip()
+    aware = s.str.contains(_TZ_SUFFIX, regex=True)
+    naive = pd.to_datetime(s.where(~aware & (s != "")), errors="coerce", format="mixed")
+    utc = pd.to_datetime(s.where(aware), errors="coerce", format="mixed", utc=True)
+    return naive, utc
+
+def resolve_account_ids(conn, sender: pd.Series, receiver: pd.Series):
+    """Kontonummer -> bank.accounts.id för avsändare och mottagare (NA där kontot saknas)."""
+    accounts = pd.read_sql(text("SELECT account_number, id FROM bank.accounts"), conn)
+    index = pd.Index(accounts["account_number"])
+    ids = pd.array(accounts["id"], dtype="Int64")
+    # En uppslagning för båda kolumnerna, per unikt kontonummer
+    both = pd.Categorical(np.concatenate([sender.to_numpy(str), receiver.to_numpy(str)]))
+    per_cat = ids.take(index.get_indexer(both.categories), allow_fill=True)
+    resolved = per_cat.take(both.codes)
+    return resolved[:len(sender)], resolved[len(sender):]
+
+def _text(df: pd.DataFrame, *names: str) -> pd.Series:
+    # Första kolumnen som finns och inte är tom (som r.get(a) or r.get(b)), trimmad
+    out = pd.Series("", index=df.index)
+    for name in reversed(names):
+        if name in df.columns:
+            s = df[name].astype(str)
+            out = s.where(s != "", out)
+    return out.str.strip()
+
+STAGE_COLUMNS = ["ord", "id", "ts", "ts_tz", "amount", "currency", "notes",
+                 "sender_account_id", "receiver_account_id",
+                 "sender_country", "sender_municipality", "receiver_country", "receiver_municipality",
+                 "transaction_type"]
+
+# Första förekomsten per id vinner; missing räknas på raderna som inte lades in
+SQL_BULK_TRANSACTIONS = text("""
+    WITH ins AS (
+        INSERT INTO bank.transactions (
+            id, timestamp, amount, currency, notes,
+            sender_account_id, receiver_account_id,
+            sender_country, sender_municipality, receiver_country, receiver_municipality,
+            transaction_type
+        )
+        SELECT id, COALESCE(ts, ts_tz::timestamp), COALESCE(amount, 0), currency, notes,
+               sender_account_id, receiver_account_id,
+               sender_country, sender_municipality, receiver_country, receiver_municipality,
+               transaction_type
+        FROM (
+            SELECT DISTINCT ON (COALESCE(id,'')) ord, COALESCE(id,'') AS id, ts, ts_tz, amount, currency, notes,
+                   sender_account_id, receiver_account_id,
+                   sender_country, sender_municipality, receiver_country, receiver_municipality,
+                   transaction_type
+            FROM stage_transactions
+            ORDER BY COALESCE(id,''), ord
+        ) first_rows
+        ORDER BY ord
+        ON CONFLICT (id) DO NOTHING
+        RETURNING (sender_account_id IS NULL OR receiver_account_id IS NULL) AS missing
+    )
+    SELECT (SELECT COUNT(*) FROM ins),
+           (SELECT COUNT(*) FROM stage_transactions
+             WHERE sender_account_id IS NULL OR receiver_account_id IS NULL)
+           - (SELECT COUNT(*) FROM ins WHERE missing)
+""")
+
+def _load_bulk(df: pd.DataFrame, workers: int = 1, batch_rows: Optional[int] = None, source=None,
+               incremental: bool = False, skip_known: bool = False) -> dict:
+    naive, utc = parse_timestamps(df["timestamp"]) if "timestamp" in df.columns else (pd.NaT, pd.NaT)
+    amount = df["amount"] if "amount" in df.columns else pd.Series(0.0, index=df.index)
+    if not pd.api.types.is_numeric_dtype(amount):
+        amount = amount.astype(str).replace("", "0").astype(float)
+    stage = pd.DataFrame({
+        "ord": np.arange(len(df)),
+        "id": _text(df, "id"),
+        "ts": naive,
+        "ts_tz": utc,
+        "amount": amount,
+        "currency": _text(df, "currency"),
+        "notes": _text(df, "notes"),
+    }, index=df.index)
+    sender = _text(df, "sender_account", "sender_account_number")
+    receiver = _text(df, "receiver_account", "receiver_account_number")
+    for name in STAGE_COLUMNS[9:]:
+        stage[name] = _text(df, name)
+
+    # Kontonumren slås upp en gång; workers får färdiga id:n
+    with engine.connect() as conn:
+        stage["sender_account_id"], stage["receiver_account_id"] = resolve_account_ids(conn, sender, receiver)
+    zero = {"transactions": (0, 0, 0)}
+
+    # Rader som redan skickats skickas inte igen, men räknas som ON CONFLICT hade räknat dem
+    skip = np.zeros(len(stage), dtype=bool)
+    watermark = Watermark(source) if incremental and source is not None else None
+    if watermark or skip_known:
+        with engine.connect() as conn:
+            if watermark:
+                hashes = row_hashes(df)
+                skip |= watermark.unchanged(conn, hashes)
+            n_unchanged = int(skip.sum())
+            if skip_known:
+                skip |= known_ids(conn).contains(hash_ids(stage["id"]))
+        parts = []
+        if watermark:
+            previous = (watermark.previous or {}).get("max_timestamp")
+            parts.append(f"{n_unchanged} rader i oförändrade block (vattenmärke {previous})")
+        if skip_known:
+            parts.append(f"{int(skip.sum()) - n_unchanged} med kända id:n")
+        print(f"[transactions] Skickas inte: {', '.join(parts)}.")
+    stage["skip"] = skip
+
+    def load(batch, conn):
+        # Checkpointen räknar rader i hela filen; skip tillämpas per batch så att en ny körning
+        # (där fler id:n kan vara kända) återupptar på samma rad
+        skipped = batch["skip"].to_numpy()
+        missing = (batch["sender_account_id"].isna() | batch["receiver_account_id"].isna()).to_numpy()
+        counts = [{"transactions": (0, int((skipped & ~missing).sum()), int((skipped & missing).sum()))}]
+        sent = batch.loc[~skipped, STAGE_COLUMNS]
+        if len(sent):
+            counts += run_partitioned(sent, sent["id"], workers, _insert_stage, conn, pool)
+        return sum_counts(counts, zero)
+
+    # En worker-pool för hela importen, inte en per batch
+    with worker_pool(workers) as pool:
+        results = load_in_batches(stage, load, batch_rows, source, "transactions")
+    if watermark:
+        max_ts = pd.concat([stage["ts"], stage["ts_tz"].dt.tz_localize(None)]).max()
+        with engine.begin() as conn:
+            watermark.save(conn, hashes, max_ts)
+    return sum_counts(results, zero)
+
+def _insert_stage(stage: pd.DataFrame, conn) -> dict:
+    """COPY + INSERT av en del/batch på conn (anroparens transaktion)."""
+    conn.execute(text(
+        "CREATE TEMP TABLE stage_transactions (ord BIGINT, id TEXT, ts TIMESTAMP, ts_tz TIMESTAMPTZ,"
+        " amount NUMERIC, currency TEXT, notes TEXT, sender_account_id INTEGER, receiver_account_id INTEGER,"
+        " sender_country TEXT, sender_municipality TEXT, receiver_country TEXT, receiver_municipality TEXT,"
+        " transaction_type TEXT) ON COMMIT DROP"
+    ))
+    copy_frame(conn, "stage_transactions", stage)
+    inserted, missing_accounts = conn.execute(SQL_BULK_TRANSACTIONS).one()
+    return {"transactions": (inserted, len(stage) - inserted - missing_accounts, missing_accounts)}
+
+def print_summary(s: dict) -> None:
+    inserted, skipped, missing_accounts = s["transactions"]
+    print(f"[transactions] inserted={inserted}, skipped_existing={skipped}, missing_accounts={missing_accounts}")
+
+def main(bulk: bool = True, workers: int = 1, batch_rows: Optional[int] = BATCH_ROWS,
+         incremental: bool = False, skip_known: bool = False):
+    # CSV (text) eller Parquet (typade kolumner, SPBANK_CLEAN_FORMAT=parquet)
+    path = find_clean(TX_CSV)
+    print_summary(load_transactions(read_clean(path), bulk=bulk, workers=workers, batch_rows=batch_rows,
+                                    source=path, incremental=incremental, skip_known=skip_known))
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser(description="Importera städade transaktioner.")
+    ap.add_argument("--rowwise", action="store_true", help="En INSERT per rad i stället för COPY + mängd-INSERT")
+    ap.add_argument("--workers", type=int, default=1, help="Antal parallella anslutningar (delar på id-hash)")
+    ap.add_argument("--batch-size", type=int, default=BATCH_ROWS,
+                    help="Rader per commit (0 = allt i en transaktion); avbruten import återupptas")
+    ap.add_argument("--incremental", action="store_true",
+                    help="Skicka inte radblock som är oförändrade sedan senaste körningen (vattenmärke per fil)")
+    ap.add_argument("--skip-known", action="store_true",
+                    help="Filtrera bort id:n som redan finns i databasen innan raderna skickas")
+    args = ap.parse_args()
+    main(bulk=not args.rowwise, workers=args.workers, batch_rows=args.batch_size or None,
+         incremental=args.incremental, skip_known=args.skip_known)
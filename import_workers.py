@@ -0,0 +1,76 @@
+# import_workers.py
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, List
+import numpy as np
+import pandas as pd
+
+from db import engine, worker_engine
+from seen_ids import hash_ids
+
+
+def partition(keys: pd.Series, n: int) -> List[np.ndarray]:
+    """
+    Radpositioner per del, fördelade på hash av nyckeln. Samma id hamnar alltid i samma del,
+    så dubbletter och ON CONFLICT avgörs inom en del och delarna krockar inte med varandra.
+    Ordningen inom en del är filens ordning (första förekomsten vinner som tidigare).
+    """
+    if n <= 1 or len(keys) == 0:
+        return [np.arange(len(keys))]
+    part = (hash_ids(keys) % np.uint64(n)).astype(np.int64)
+    order = np.argsort(part, kind="stable")
+    bounds = np.searchsorted(part[order], np.arange(1, n))
+    return [p for p in np.split(order, bounds) if len(p)]
+
+
+@contextmanager
+def worker_pool(workers: int):
+    """Worker-engine för en hel import (None med workers <= 1); poolen stängs när importen är klar."""
+    if workers <= 1:
+        yield None
+        return
+    eng = worker_engine(workers)
+    try:
+        yield eng
+    finally:
+        eng.dispose()
+
+
+def run_partitioned(frame: pd.DataFrame, keys: pd.Series, workers: int, load: Callable, conn=None,
+                    pool=None) -> list:
+    """
+    Kör load(del, conn) för varje del, samtidigt i workers trådar med en anslutning och en
+    transaktion per del. Med workers <= 1 körs allt som en del på conn (eller en ny transaktion).
+    Delarna committas var för sig: fel i en del rullar inte tillbaka de andra.
+    pool: engine från worker_pool, så att batcharna delar en pool; saknas den skapas en för anropet.
+    """
+    parts = partition(keys, workers)
+    if len(parts) == 1:
+        if conn is not None:
+            return [load(frame.iloc[parts[0]], conn)]
+        with engine.begin() as own:
+            return [load(frame.iloc[parts[0]], own)]
+    if pool is None:
+        with worker_pool(len(parts)) as own_pool:
+            return run_partitioned(frame, keys, workers, load, pool=own_pool)
+
+    def run(p):
+        with pool.begin() as part_conn:
+            return load(frame.iloc[p], part_conn)
+
+    # COPY och INSERT väntar på databasen (psycopg släpper GIL), så trådar räcker
+    with ThreadPoolExecutor(max_workers=len(parts)) as ex:
+        return list(ex.map(run, parts))
+
+
+def sum_counts(results: list, zero: dict) -> dict:
+    """Summerar summeringar per del/batch: tupler elementvis, tal och listor med +."""
+    out = dict(zero)
+    for r in results:
+        for key, value in r.items():
+            if isinstance(value, tuple):
+                out[key] = tuple(a + b for a, b in zip(out[key], value))
+            else:
+                out[key] = out[key] + value
+    return out
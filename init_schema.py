@@ -6,6 +6,28 @@ def ensure_schema():
     with engine.begin() as conn:
         conn.execute(text("CREATE SCHEMA IF NOT EXISTS bank"))
     Base.metadata.create_all(bind=engine)
+    ensure_flagged_unique()
+
+def ensure_flagged_unique():
+    """
+    Unika nyckeln (transaction_id, reason, flagged_date) på tabeller skapade före den fanns.
+    Dubbletter enligt importens regel (NULL-datum lika) tas först bort; den äldsta raden behålls.
+    """
+    with engine.begin() as conn:
+        if conn.execute(text("SELECT to_regclass('bank.ux_flagged_tx_reason_date')")).scalar() is not None:
+            return
+        removed = conn.execute(text("""
+            DELETE FROM bank.flagged_transactions f
+            USING bank.flagged_transactions g
+            WHERE f.transaction_id = g.transaction_id AND f.reason = g.reason
+              AND f.flagged_date IS NOT DISTINCT FROM g.flagged_date AND f.id > g.id
+        """)).rowcount
+        if removed:
+            print(f"ℹ️ Tog bort {removed} dubbletter i flagged_transactions före unik nyckel.")
+        conn.execute(text("""
+            CREATE UNIQUE INDEX ux_flagged_tx_reason_date
+            ON bank.flagged_transactions (transaction_id, reason, flagged_date) NULLS NOT DISTINCT
+        """))
 
 if __name__ == "__main__":
     ensure_schema()
@@ -0,0 +1,125 @@
+# keyword_matcher.py
+from __future__ import annotations
+import re
+from collections import deque
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+
+def _is_word_char(ch: str) -> bool:
+    # Samma som \w i re (Unicode): bokstäver, siffror och understreck
+    return ch.isalnum() or ch == "_"
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick-automat för många nyckelord samtidigt: en passage över texten,
+    oberoende av antal ord (en stor alternations-regex blir långsam vid tusentals ord).
+      case_fold:  jämför med str.casefold() på både ord och text (t.ex. ß == ss, något bredare än re.IGNORECASE)
+      whole_word: träff bara om ordet inte har ordtecken (\\w) direkt före/efter sig
+    Skapa via compile_matcher() så att automaten cachas per ordlista.
+    """
+
+    def __init__(self, keywords: Iterable[str], case_fold: bool = True, whole_word: bool = False):
+        self.case_fold = case_fold
+        self.whole_word = whole_word
+        self.keywords: List[str] = list(dict.fromkeys(k for k in keywords if k))
+        self._goto: List[dict] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
+        folded = [self._fold(kw) for kw in self.keywords]
+        self._lengths = [len(w) for w in folded]
+        for idx, word in enumerate(folded):
+            self._add(word, idx)
+        self._link()
+
+    def _fold(self, text: str) -> str:
+        return text.casefold() if self.case_fold else text
+
+    def _add(self, word: str, idx: int) -> None:
+        node = 0
+        for ch in word:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            node = nxt
+        self._out[node] = self._out[node] + (idx,)
+
+    def _link(self) -> None:
+        # BFS: fail-länk = längsta äkta suffix som också är ett prefix; utdata ärvs längs länken.
+        # Rotens barn har fail = 0 och startar kön.
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+                queue.append(nxt)
+
+    def _iter(self, text: str):
+        """(start, slut, ordindex) för varje träff, i ordning efter slutposition."""
+        text = self._fold(text)
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for idx in out[node]:
+                start = i + 1 - self._lengths[idx]
+                if self.whole_word and (
+                    (start > 0 and _is_word_char(text[start - 1]))
+                    or (i + 1 < len(text) and _is_word_char(text[i + 1]))
+                ):
+                    continue
+                yield start, i + 1, idx
+
+    def search(self, text: str) -> Optional[str]:
+        """Första nyckelordet som träffar (tidigast slutposition), annars None."""
+        if not self.keywords or not isinstance(text, str):
+            return None
+        for _, _, idx in self._iter(text):
+            return self.keywords[idx]
+        return None
+
+    def find_all(self, text: str) -> List[str]:
+        """Alla nyckelord som förekommer i texten (unika, i träffordning)."""
+        if not self.keywords or not isinstance(text, str):
+            return []
+        return list(dict.fromkeys(self.keywords[idx] for _, _, idx in self._iter(text)))
+
+    def search_series(self, notes: pd.Series) -> pd.Series:
+        """Träffat nyckelord per rad (None = ingen träff). Varje unik text söks bara en gång."""
+        codes, uniq = pd.factorize(notes, use_na_sentinel=True)
+        found = np.array([self.search(t) for t in uniq] + [None], dtype=object)
+        return pd.Series(found[codes], index=notes.index, dtype=object)
+
+    def contains(self, notes: pd.Series) -> pd.Series:
+        return self.search_series(notes).notna()
+
+
+@lru_cache(maxsize=32)
+def _compile(keywords: Tuple[str, ...], case_fold: bool, whole_word: bool) -> AhoCorasick:
+    return AhoCorasick(keywords, case_fold=case_fold, whole_word=whole_word)
+
+
+def compile_matcher(keywords: Iterable[str], case_fold: bool = True, whole_word: bool = False) -> AhoCorasick:
+    """Kompilerad automat, cachad per (ordlista, case_fold, whole_word)."""
+    return _compile(tuple(keywords), case_fold, whole_word)
+
+
+def keyword_regex(keywords: Iterable[str], case_fold: bool = True, whole_word: bool = False) -> re.Pattern:
+    """Motsvarande alternations-regex (samma ordgränser som AhoCorasick med whole_word)."""
+    alt = "|".join(re.escape(w) for w in keywords if w)
+    if whole_word:
+        alt = rf"(?<!\w)(?:{alt})(?!\w)"
+    return re.compile(alt, flags=re.IGNORECASE if case_fold else 0)
@@ -1,6 +1,6 @@
 
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import String, Integer, Numeric, Text, DateTime, ForeignKey, MetaData
+from sqlalchemy import String, Integer, BigInteger, Numeric, Text, DateTime, ForeignKey, MetaData, Index, ARRAY, func
 
 # All tables live in schema "bank"
 metadata = MetaData(schema="bank")
@@ -38,6 +38,9 @@ class Transaction(Base):
     receiver_municipality: Mapped[str | None] = mapped_column(String(128), nullable=True)
     transaction_type: Mapped[str | None] = mapped_column(String(64), nullable=True)
 
+    # Ping-pong-uppslag i SQL-motorn (risk_sql.py)
+    __table_args__ = (Index("ix_transactions_pair_ts", "sender_account_id", "receiver_account_id", "timestamp"),)
+
 class FlaggedTransaction(Base):
     __tablename__ = "flagged_transactions"
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
@@ -45,3 +48,27 @@ class FlaggedTransaction(Base):
     reason: Mapped[str] = mapped_column(Text)
     flagged_date: Mapped["DateTime | None"] = mapped_column(DateTime, nullable=True)
     amount: Mapped[float | None] = mapped_column(Numeric(18,2), nullable=True)
+
+    # En flagga per (transaktion, orsak, datum); NULL-datum räknas som lika (som i importen).
+    # Ger ON CONFLICT DO NOTHING i import_flagged_transactions.py i stället för en NOT EXISTS per rad.
+    __table_args__ = (Index("ux_flagged_tx_reason_date", "transaction_id", "reason", "flagged_date",
+                            unique=True, postgresql_nulls_not_distinct=True),)
+
+class ImportCheckpoint(Base):
+    """Committade rader per källfil och filhash (import_checkpoints.py); raden tas bort när importen är klar."""
+    __tablename__ = "import_checkpoints"
+    source: Mapped[str] = mapped_column(Text, primary_key=True)
+    file_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    rows_done: Mapped[int] = mapped_column(BigInteger, default=0)
+    total_rows: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    updated_at: Mapped["DateTime | None"] = mapped_column(DateTime, server_default=func.now(), nullable=True)
+
+class ImportWatermark(Base):
+    """Vattenmärke per källfil (import_watermarks.py): största tidsstämpel och hash per radblock som skickats."""
+    __tablename__ = "import_watermarks"
+    source: Mapped[str] = mapped_column(Text, primary_key=True)
+    max_timestamp: Mapped["DateTime | None"] = mapped_column(DateTime, nullable=True)
+    rows_done: Mapped[int] = mapped_column(BigInteger, default=0)
+    range_rows: Mapped[int] = mapped_column(Integer)
+    range_hashes: Mapped[list[str] | None] = mapped_column(ARRAY(Text), nullable=True)
+    updated_at: Mapped["DateTime | None"] = mapped_column(DateTime, server_default=func.now(), nullable=True)
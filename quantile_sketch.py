@@ -0,0 +1,185 @@
+# quantile_sketch.py
+from __future__ import annotations
+import argparse
+import math
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+import pandas as pd
+
+import schema
+
+
+class KLLSketch:
+    """
+    Sammanfogbar kvantilskiss (KLL). Håller O(k) värden oavsett antal inlästa belopp.
+    Normaliserat rangfel ≈ 1.65 / k (med hög sannolikhet), se for_rank_error().
+    Värden på nivå h väger 2**h; en full nivå sorteras och varannan post flyttas upp.
+    """
+
+    def __init__(self, k: int = 1650, seed: Optional[int] = None):
+        if k < 8:
+            raise ValueError("k måste vara minst 8.")
+        self.k = int(k)
+        self.n = 0
+        self.levels: List[np.ndarray] = [np.empty(0, dtype=float)]
+        self._rng = np.random.default_rng(seed)
+
+    @classmethod
+    def for_rank_error(cls, eps: float, seed: Optional[int] = None) -> "KLLSketch":
+        return cls(k=max(8, math.ceil(1.65 / eps)), seed=seed)
+
+    @property
+    def rank_error(self) -> float:
+        return 1.65 / self.k
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def update(self, values: Iterable[float]) -> "KLLSketch":
+        arr = np.asarray(values, dtype=float).ravel()
+        arr = arr[~np.isnan(arr)]
+        if len(arr):
+            self.levels[0] = np.concatenate([self.levels[0], arr])
+            self.n += len(arr)
+            self._compress()
+        return self
+
+    def merge(self, other: "KLLSketch") -> "KLLSketch":
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0, dtype=float))
+        for h, buf in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], buf])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def _compress(self) -> None:
+        h = 0
+        while h < len(self.levels):
+            buf = self.levels[h]
+            if len(buf) > self._capacity(h):
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0, dtype=float))
+                buf = np.sort(buf)
+                keep = buf[:0]
+                if len(buf) % 2:  # udda antal: en post stannar kvar på nivån
+                    keep, buf = buf[-1:], buf[:-1]
+                offset = int(self._rng.integers(2))
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], buf[offset::2]])
+                self.levels[h] = keep
+            h += 1
+
+    def quantile(self, q: float) -> float:
+        """Linjär interpolation mellan rang floor/ceil av q*(n-1), som pandas quantile() (exakt så länge inget komprimerats)."""
+        if self.n == 0:
+            return float("nan")
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(b), 2 ** h, dtype=np.int64) for h, b in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        items, cum = items[order], np.cumsum(weights[order])
+        pos = q * (cum[-1] - 1)
+        lo, hi = math.floor(pos), math.ceil(pos)
+        idx = np.minimum(np.searchsorted(cum, [lo, hi], side="right"), len(items) - 1)
+        v_lo, v_hi = float(items[idx[0]]), float(items[idx[1]])
+        return v_lo + (v_hi - v_lo) * (pos - lo)
+
+    def to_dict(self) -> dict:
+        return {"k": self.k, "n": self.n, "levels": [b.tolist() for b in self.levels]}
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "KLLSketch":
+        sk = cls(k=d["k"])
+        sk.n = int(d["n"])
+        sk.levels = [np.asarray(b, dtype=float) for b in d["levels"]] or [np.empty(0, dtype=float)]
+        return sk
+
+
+class CurrencySketches:
+    """En KLLSketch per valuta. update() per chunk, merge() mellan processer, thresholds(p) som dict."""
+
+    def __init__(self, rank_error: float = 0.001, seed: Optional[int] = None):
+        self.rank_error = rank_error
+        self.seed = seed
+        self.sketches: Dict[str, KLLSketch] = {}
+
+    def _sketch(self, currency) -> KLLSketch:
+        sk = self.sketches.get(currency)
+        if sk is None:
+            sk = self.sketches[currency] = KLLSketch.for_rank_error(self.rank_error, seed=self.seed)
+        return sk
+
+    def update(self, df: pd.DataFrame) -> "CurrencySketches":
+        """Läser in kolumnerna 'currency' och 'amount' (NaN ignoreras)."""
+        for cur, amounts in df.groupby("currency", sort=False, observed=True)["amount"]:
+            self._sketch(cur).update(amounts.to_numpy(dtype=float, na_value=np.nan))
+        return self
+
+    def merge(self, other: "CurrencySketches") -> "CurrencySketches":
+        for cur, sk in other.sketches.items():
+            self._sketch(cur).merge(sk)
+        return self
+
+    def thresholds(self, p: float) -> dict:
+        return {cur: sk.quantile(p) for cur, sk in self.sketches.items() if sk.n}
+
+    def to_dict(self) -> dict:
+        return {"rank_error": self.rank_error,
+                "sketches": {cur: sk.to_dict() for cur, sk in self.sketches.items()}}
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "CurrencySketches":
+        cs = cls(rank_error=d["rank_error"])
+        cs.sketches = {cur: KLLSketch.from_dict(sk) for cur, sk in d["sketches"].items()}
+        return cs
+
+
+def compare_with_exact(df: pd.DataFrame, ps: Iterable[float] = (0.98,), rank_error: float = 0.001,
+                       chunksize: Optional[int] = None, seed: Optional[int] = None) -> pd.DataFrame:
+    """
+    Jämför skissens percentiler med exakta (groupby().quantile) per valuta.
+    rank_error i resultatet = hur långt (i andel rader) skissens värde ligger från p.
+    chunksize: mata skissen i bitar och slå ihop, som vid chunkad/parallell körning.
+    """
+    sketches = CurrencySketches(rank_error=rank_error, seed=seed)
+    if chunksize:
+        for start in range(0, len(df), chunksize):
+            sketches.merge(CurrencySketches(rank_error=rank_error, seed=seed).update(df.iloc[start:start + chunksize]))
+    else:
+        sketches.update(df)
+
+    rows = []
+    for cur, amounts in df.groupby("currency", sort=True, observed=True)["amount"]:
+        sorted_amounts = np.sort(amounts.dropna().to_numpy(dtype=float))
+        if len(sorted_amounts) == 0:
+            continue
+        for p in ps:
+            exact = float(amounts.quantile(p))
+            approx = sketches.sketches[cur].quantile(p)
+            rank = np.searchsorted(sorted_amounts, approx, side="right") / len(sorted_amounts)
+            rows.append({"currency": cur, "p": p, "n": len(sorted_amounts), "exact": exact,
+                         "sketch": approx, "abs_diff": abs(approx - exact), "rank_error": abs(rank - p)})
+    return pd.DataFrame(rows, columns=["currency", "p", "n", "exact", "sketch", "abs_diff", "rank_error"])
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Jämför kvantilskiss mot exakta percentiler per valuta.")
+    ap.add_argument("--in", dest="inp", default="data/clean/transactions_clean.csv", help="Infil (CSV)")
+    ap.add_argument("--p", dest="ps", type=float, nargs="+", default=[0.98], help="Percentiler, t.ex. 0.95 0.98")
+    ap.add_argument("--rank-error", dest="rank_error", type=float, default=0.001, help="Mål för rangfel (andel)")
+    ap.add_argument("--chunksize", type=int, default=None, help="Mata skissen i bitar och slå ihop")
+    args = ap.parse_args()
+
+    in_path = Path(args.inp)
+    if not in_path.exists():
+        raise SystemExit(f"Hittar inte {in_path}.")
+    df = schema.read_csv(in_path, usecols=["amount", "currency"], categories=False)
+
+    res = compare_with_exact(df, args.ps, rank_error=args.rank_error, chunksize=args.chunksize)
+    print(res.to_string(index=False))
+    print(f"\nMax rangfel: {res['rank_error'].max():.5f} (mål {args.rank_error})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+# risk_chunked.py
+from __future__ import annotations
+import re
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+from quantile_sketch import CurrencySketches
+from risk_rules import RiskConfig, _cap_per_reason
+from risk_engine import RiskEngine
+from threshold_store import ThresholdStore
+from clean_io import CleanWriter, format_of
+import schema
+
+_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+# Ungefärligt arbetsminne per rad i förhållande till rå CSV-data i pandas
+# (normaliserad kopia, masker, merge_asof/groupby i reglerna).
+_WORK_FACTOR = 8
+_PROBE_ROWS = 10_000
+_MIN_CHUNK_ROWS = 1_000
+
+# Tidshinkar för spill: börjar per dag, delas finare om en hink inte ryms i budgeten
+_BUCKET_FREQS = ("1D", "1h", "1min")
+_NAT_BUCKET = "nat"
+
+
+def parse_memory(value) -> int:
+    """'2G', '512M', '1.5GB', '1048576' -> antal byte."""
+    m = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*", str(value), flags=re.IGNORECASE)
+    if not m:
+        raise ValueError(f"Ogiltig minnesgräns: {value!r} (t.ex. '2G' eller '512M').")
+    return int(float(m.group(1)) * _UNITS[m.group(2).upper()])
+
+
+def _read_chunks(path: Path, rows: int, rename: Optional[dict] = None) -> Iterator[pd.DataFrame]:
+    if format_of(path) == "parquet":
+        import pyarrow.parquet as pq
+        chunks = (batch.to_pandas() for batch in pq.ParquetFile(path).iter_batches(batch_size=rows))
+    else:
+        chunks = schema.read_csv(path, typed=False, categories=False, chunksize=rows)
+    for chunk in chunks:
+        yield chunk.rename(columns=rename) if rename else chunk
+
+
+def _columns(path: Path) -> list:
+    if format_of(path) == "parquet":
+        import pyarrow.parquet as pq
+        return pq.read_schema(path).names
+    return list(pd.read_csv(path, dtype=str, nrows=0).columns)
+
+
+def _bytes_per_row(path: Path) -> float:
+    probe = next(_read_chunks(path, _PROBE_ROWS), pd.DataFrame())
+    return max(1.0, probe.memory_usage(deep=True).sum() / max(1, len(probe)))
+
+
+def _parse_ts(chunk: pd.DataFrame) -> pd.Series:
+    # Samma tolkning som risk_rules._normalize_columns
+    return pd.to_datetime(chunk["timestamp"], errors="coerce", utc=True)
+
+
+def _spill(chunks, out_dir: Path, freq: str, sketches: Optional[CurrencySketches] = None) -> Dict[str, Tuple[Path, int]]:
+    """
+    Skriver raderna till en CSV per tidshink (floor(timestamp, freq)) i out_dir.
+    Returnerar {hinknyckel: (fil, antal rader)}; nycklarna sorterar kronologiskt, NaT sist.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    buckets: Dict[str, Tuple[Path, int]] = {}
+    for chunk in chunks:
+        if sketches is not None:
+            sketches.update(pd.DataFrame({
+                "currency": chunk["currency"],
+                "amount": pd.to_numeric(chunk["amount"], errors="coerce"),
+            }))
+        ts = _parse_ts(chunk)
+        keys = ts.dt.floor(freq).dt.strftime("%Y%m%dT%H%M%S").fillna(_NAT_BUCKET)
+        for key, part in chunk.groupby(keys.to_numpy(), sort=False):
+            path, n = buckets.get(key, (out_dir / f"{key}.csv", 0))
+            part.to_csv(path, mode="a", header=(n == 0), index=False)
+            buckets[key] = (path, n + len(part))
+    return dict(sorted(buckets.items(), key=lambda kv: (kv[0] == _NAT_BUCKET, kv[0])))
+
+
+class _FlaggedWriter:
+    """Skriver flaggade rader löpande; med cap_per_reason hålls bara löpande topp-k per reason i minnet."""
+
+    def __init__(self, out_path: Path, cap: Optional[int]):
+        self.sink = CleanWriter(out_path)
+        self.cap = cap
+        self.kept: Optional[pd.DataFrame] = None
+
+    def add(self, flagged: pd.DataFrame) -> None:
+        if flagged.empty:
+            return
+        if self.cap:
+            both = flagged if self.kept is None else pd.concat([self.kept, flagged], ignore_index=True)
+            self.kept = _cap_per_reason(both, self.cap)
+            return
+        self.sink.write(flagged)
+
+    def close(self, columns) -> int:
+        if self.cap and self.kept is not None:
+            self.sink.write(self.kept)
+        self.sink.close(columns)
+        return self.sink.rows
+
+
+def _set_thresholds(engine: RiskEngine, sketches: CurrencySketches, cfg: RiskConfig) -> None:
+    # Skisserna ur pass 1; med cfg.threshold_store vinner lagrets trösklar där valutan finns
+    engine.thr_high = sketches.thresholds(cfg.high_amount_p)
+    engine.thr_x = sketches.thresholds(cfg.crossborder_p)
+    if cfg.threshold_store:
+        store = ThresholdStore.load(cfg.threshold_store)
+        engine.thr_high.update(store.thresholds(cfg.high_amount_p))
+        engine.thr_x.update(store.thresholds(cfg.crossborder_p))
+
+
+def score_and_flag_chunked(in_path, out_path, cfg: Optional[RiskConfig] = None, max_memory="2G",
+                           assume_sorted: bool = False, tmp_dir=None, rename: Optional[dict] = None) -> int:
+    """
+    Out-of-core-variant av score_and_flag för CSV-/Parquet-filer som inte ryms i minnet.
+
+    Pass 1 läser filen i bitar, bygger percentilskisser per valuta (globala trösklar) och
+    spillar raderna till tidshinkar på disk (hoppas över med assume_sorted=True om filen
+    redan är sorterad på timestamp). Pass 2 matar hinkarna i tidsordning genom en
+    RiskEngine, vars tillstånd bär velocity-/ping-pong-/motpartsfönstren över chunkgränserna.
+    Chunkstorleken räknas fram ur max_memory minus engine-tillståndets storlek.
+    Trösklarna kommer från skisserna (cfg.sketch_rank_error), oavsett threshold_method,
+    eller från cfg.threshold_store för valutor som finns där.
+    rename: kolumnmappning som appliceras på varje inläst chunk (spillfilerna behåller originalnamnen).
+    Flaggade rader skrivs löpande till out_path (CSV eller Parquet efter filändelsen).
+    Returnerar antal skrivna rader.
+    """
+    cfg = cfg or RiskConfig()
+    in_path, out_path = Path(in_path), Path(out_path)
+    if not in_path.exists():
+        raise FileNotFoundError(f"Hittar inte {in_path}.")
+
+    budget = parse_memory(max_memory)
+    work_per_row = _bytes_per_row(in_path) * _WORK_FACTOR
+    max_rows = max(_MIN_CHUNK_ROWS, int(budget // work_per_row))
+
+    engine = RiskEngine(cfg)
+    writer = _FlaggedWriter(out_path, cfg.cap_per_reason)
+    out_cols = ["transaction_id", "reason", "flagged_date", "amount"] + (["reason_mask"] if cfg.include_reason_mask else [])
+
+    def chunk_rows() -> int:
+        state = engine.velocity.memory_usage(deep=True).sum() + engine.pairs.memory_usage(deep=True).sum()
+        return max(_MIN_CHUNK_ROWS, int((budget - state) // work_per_row))
+
+    sketches = CurrencySketches(rank_error=cfg.sketch_rank_error)
+    spill_root = Path(tempfile.mkdtemp(prefix="spbank_spill_", dir=tmp_dir))
+    try:
+        has_ts = "timestamp" in _columns(in_path)
+        if assume_sorted or not has_ts:
+            for chunk in _read_chunks(in_path, max_rows, rename):
+                sketches.update(pd.DataFrame({"currency": chunk["currency"],
+                                              "amount": pd.to_numeric(chunk["amount"], errors="coerce")}))
+            _set_thresholds(engine, sketches, cfg)
+            for chunk in _read_chunks(in_path, chunk_rows(), rename):
+                writer.add(engine.update(chunk))
+        else:
+            buckets = _spill(_read_chunks(in_path, max_rows), spill_root / "0", _BUCKET_FREQS[0], sketches)
+            _set_thresholds(engine, sketches, cfg)
+            _score_buckets(engine, writer, buckets, 0, spill_root, chunk_rows, rename)
+    finally:
+        shutil.rmtree(spill_root, ignore_errors=True)
+
+    return writer.close(out_cols)
+
+
+def _score_buckets(engine: RiskEngine, writer: _FlaggedWriter, buckets: Dict[str, Tuple[Path, int]],
+                   level: int, spill_root: Path, chunk_rows, rename: Optional[dict]) -> None:
+    for key, (path, n) in buckets.items():
+        limit = chunk_rows()
+        if n > limit and key != _NAT_BUCKET and level + 1 < len(_BUCKET_FREQS):
+            # Hinken ryms inte: dela den i finare tidshinkar och fortsätt rekursivt
+            sub = _spill(_read_chunks(path, limit), spill_root / str(level + 1) / key, _BUCKET_FREQS[level + 1])
+            path.unlink()
+            _score_buckets(engine, writer, sub, level + 1, spill_root, chunk_rows, rename)
+            continue
+        if key == _NAT_BUCKET:
+            chunks = _read_chunks(path, limit)
+        elif n > limit:
+            # Finaste nivån och ändå för stor: extern sortering, så att engine får tidsordning
+            runs = _sorted_runs(path, limit, spill_root / "runs" / key)
+            chunks = _merge_runs(runs, max(1, limit // len(runs)))
+        else:
+            chunks = (_sort_by_ts(chunk) for chunk in _read_chunks(path, limit))
+        for chunk in chunks:
+            writer.add(engine.update(chunk.rename(columns=rename) if rename else chunk))
+        path.unlink()
+
+
+def _sort_by_ts(chunk: pd.DataFrame) -> pd.DataFrame:
+    # Stabil: lika tider behåller filordningen
+    return chunk.iloc[np.argsort(_parse_ts(chunk).array.asi8, kind="stable")]
+
+
+def _sorted_runs(path: Path, rows: int, run_dir: Path) -> list:
+    """Delar en hink i tidssorterade körningar om högst rows rader (i filordning)."""
+    run_dir.mkdir(parents=True, exist_ok=True)
+    runs = []
+    for i, chunk in enumerate(_read_chunks(path, rows)):
+        run = run_dir / f"{i}.csv"
+        _sort_by_ts(chunk).to_csv(run, index=False)
+        runs.append(run)
+    return runs
+
+
+def _merge_runs(runs: list, block: int) -> Iterator[pd.DataFrame]:
+    """
+    k-vägs merge av tidssorterade körningar, block rader åt gången per körning.
+    Rader med tid under minsta senast inlästa tid bland ofullständigt lästa körningar
+    skickas vidare; lika tider kommer i körningsordning (= filordning).
+    """
+    readers = [_read_chunks(run, block) for run in runs]
+    bufs = [None] * len(runs)
+    ts = [np.empty(0, dtype=np.int64)] * len(runs)
+    live = [True] * len(runs)
+
+    def refill(i: int) -> None:
+        chunk = next(readers[i], None)
+        if chunk is None:
+            live[i] = False
+            return
+        bufs[i] = chunk if bufs[i] is None else pd.concat([bufs[i], chunk])
+        ts[i] = np.concatenate([ts[i], _parse_ts(chunk).array.asi8])
+
+    for i in range(len(runs)):
+        refill(i)
+    while any(len(t) for t in ts):
+        lasts = [t[-1] for t, alive in zip(ts, live) if alive]
+        bound = min(lasts) if lasts else None
+        parts, part_ts = [], []
+        for i, t in enumerate(ts):
+            take = len(t) if bound is None else int(np.searchsorted(t, bound, side="left"))
+            if take:
+                parts.append(bufs[i].iloc[:take])
+                part_ts.append(t[:take])
+                bufs[i], ts[i] = bufs[i].iloc[take:], t[take:]
+        if parts:
+            yield pd.concat(parts).iloc[np.argsort(np.concatenate(part_ts), kind="stable")]
+        for i in range(len(runs)):
+            if live[i] and (not len(ts[i]) or ts[i][-1] == bound):
+                refill(i)
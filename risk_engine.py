@@ -0,0 +1,193 @@
+# risk_engine.py
+from __future__ import annotations
+from dataclasses import asdict
+from pathlib import Path
+from typing import Optional
+import numpy as np
+import pandas as pd
+
+from quantile_sketch import CurrencySketches
+from risk_rules import (
+    RiskConfig,
+    _prepare, _base_masks, _flag_frame, _thresholds,
+    _rule_velocity, _pingpong_hits, _rule_new_counterparty,
+)
+
+STATE_VERSION = 1
+
+
+def _empty_velocity_state() -> pd.DataFrame:
+    return pd.DataFrame({
+        "from_account": pd.Series(dtype=object),
+        "timestamp": pd.Series(dtype="datetime64[ns, UTC]"),
+    })
+
+
+def _empty_pair_state() -> pd.DataFrame:
+    return pd.DataFrame({
+        "from_account": pd.Series(dtype=object),
+        "to_account": pd.Series(dtype=object),
+        "last_ts": pd.Series(dtype="datetime64[ns, UTC]"),
+        "pingpong_hits": pd.Series(dtype="int64"),
+    })
+
+
+class RiskEngine:
+    """
+    Inkrementell flaggning ovanpå RiskConfig. Håller kompakt tillstånd mellan anrop
+    så att en ny batch kostar O(batch) i stället för O(hela historiken):
+
+      - velocity: tidsstämplar per from_account inom velocity-fönstret
+      - pairs:    senaste tid per riktat par A->B (räcker för både ping-pong,
+                  där B->A slås upp, och ny motpart) + antal ping-pong-träffar per par
+      - thr_high/thr_x: trösklar per valuta (via fit_thresholds, annars ur batchen)
+      - sketches: med threshold_method="sketch" och utan låsta trösklar byggs en
+                  kvantilskiss per valuta på över alla batcher och trösklarna läses ur den
+
+    Batcher förväntas komma i tidsordning; tillståndet behandlas som "före" batchen.
+    Egna regler i risk_rules.RULES körs på batchen (utan tillstånd mellan anropen).
+    Skillnad mot score_and_flag på hela historiken: med pingpong_min_pairs > 1 räknas
+    bara träffar fram till och med aktuell batch (senare retur flaggar inte om gamla rader),
+    och ett par utan A->B inom max(pingpong_days, new_counterparty_days) börjar om på 0 träffar.
+    """
+
+    def __init__(self, cfg: Optional[RiskConfig] = None):
+        self.cfg = cfg or RiskConfig()
+        self.velocity = _empty_velocity_state()
+        self.pairs = _empty_pair_state()
+        self.thr_high: dict | None = None
+        self.thr_x: dict | None = None
+        self.watermark: pd.Timestamp | None = None
+        self.sketches: CurrencySketches | None = None
+
+    # ---------- Uppsättning ----------
+
+    @classmethod
+    def from_history(cls, history: pd.DataFrame, cfg: Optional[RiskConfig] = None) -> "RiskEngine":
+        """Engångsuppvärmning: trösklar och tillstånd ur befintlig historik."""
+        engine = cls(cfg)
+        engine.fit_thresholds(history)
+        engine.update(history)
+        return engine
+
+    def fit_thresholds(self, history: pd.DataFrame) -> None:
+        """Låser percentiltrösklarna per valuta till historiken i stället för varje batch."""
+        self.thr_high, self.thr_x = _thresholds(_prepare(history, self.cfg), self.cfg)
+
+    # ---------- Flaggning ----------
+
+    def update(self, batch: pd.DataFrame) -> pd.DataFrame:
+        """Flaggar en ny batch mot sparat tillstånd och uppdaterar tillståndet. Samma utdata som score_and_flag."""
+        cfg = self.cfg
+        df = _prepare(batch, cfg).reset_index(drop=True)
+        thr_high, thr_x = self.thr_high, self.thr_x
+        if thr_high is None and cfg.threshold_method == "sketch":
+            if self.sketches is None:
+                self.sketches = CurrencySketches(rank_error=cfg.sketch_rank_error)
+            self.sketches.update(df)
+            thr_high = self.sketches.thresholds(cfg.high_amount_p)
+            thr_x = self.sketches.thresholds(cfg.crossborder_p)
+        base = _base_masks(df, cfg, thr_high, thr_x)
+
+        pairs_hist = self.pairs.rename(columns={"last_ts": "timestamp"})[["from_account", "to_account", "timestamp"]]
+        n_vel, n_pair = len(self.velocity), len(pairs_hist)
+
+        # Velocity: tidigare tidsstämplar i fönstret räknas in före batchen
+        vel_comb = pd.concat([self.velocity, df[["from_account", "timestamp"]]], ignore_index=True)
+        m_velocity = _rule_velocity(vel_comb, cfg.velocity_window_hours, cfg.velocity_min_tx).to_numpy()[n_vel:]
+
+        # Ping-pong och ny motpart: senaste A->B per par som syntetiska rader före batchen
+        pair_comb = pd.concat([pairs_hist, df[["from_account", "to_account", "timestamp"]]], ignore_index=True)
+        hits = _pingpong_hits(pair_comb, cfg.pingpong_days)[0][n_pair:]
+        pair_hits = self._pair_hits(df, hits)
+        m_pingpong = hits & (pair_hits >= cfg.pingpong_min_pairs) if cfg.pingpong_min_pairs > 1 else hits
+
+        high_comb = pd.Series(
+            np.concatenate([np.zeros(n_pair, dtype=bool), base["high_amount"]]),
+            index=pair_comb.index,
+        )
+        m_newcp = _rule_new_counterparty(
+            pair_comb, cfg.new_counterparty_days, cfg.require_high_for_new_counterparty, high_comb
+        ).to_numpy(dtype=bool)[n_pair:]
+
+        flagged = _flag_frame(df, {
+            **base,
+            "velocity": m_velocity,
+            "pingpong": m_pingpong,
+            "new_counterparty": m_newcp,
+        }, cfg)
+
+        self._advance(df, hits)
+        return flagged
+
+    def _pair_hits(self, df: pd.DataFrame, hits: np.ndarray) -> np.ndarray:
+        """Ping-pong-träffar per par: sparat antal + träffar i batchen (per rad)."""
+        tmp = pd.DataFrame({"from_account": df["from_account"], "to_account": df["to_account"], "hit": hits})
+        batch_hits = tmp.groupby(["from_account", "to_account"], sort=False)["hit"].transform("sum").to_numpy()
+        prior = tmp.merge(self.pairs, on=["from_account", "to_account"], how="left")["pingpong_hits"]
+        return batch_hits + prior.fillna(0).to_numpy(dtype=np.int64)
+
+    def _advance(self, df: pd.DataFrame, hits: np.ndarray) -> None:
+        """Lägg in batchen i tillståndet och släng det som inte kan påverka senare batcher."""
+        cfg = self.cfg
+        valid_ts = df["timestamp"].dropna()
+        if valid_ts.empty:
+            return
+        now = valid_ts.max()
+        if self.watermark is not None:
+            now = max(now, self.watermark)
+        self.watermark = now
+
+        vel = df.loc[df["timestamp"].notna(), ["from_account", "timestamp"]]
+        vel = pd.concat([self.velocity, vel], ignore_index=True)
+        # Fönstret är (t - h, t]; rader på exakt now - h kan inte räknas igen
+        self.velocity = vel[vel["timestamp"] > now - pd.Timedelta(hours=cfg.velocity_window_hours)].reset_index(drop=True)
+
+        batch_pairs = pd.DataFrame({
+            "from_account": df["from_account"],
+            "to_account": df["to_account"],
+            "last_ts": df["timestamp"],
+            "pingpong_hits": hits.astype(np.int64),
+        }).dropna(subset=["last_ts"])
+        pairs = (
+            pd.concat([self.pairs, batch_pairs], ignore_index=True)
+              .groupby(["from_account", "to_account"], sort=False, as_index=False)
+              .agg(last_ts=("last_ts", "max"), pingpong_hits=("pingpong_hits", "sum"))
+        )
+        # Äldre än båda fönstren => likvärdigt med att paret saknas (retur utom räckhåll,
+        # ny motpart ändå). Träffräkningen följer med paret och nollställs då, så tillståndet
+        # växer inte med historiken.
+        horizon = now - pd.Timedelta(days=max(cfg.pingpong_days, cfg.new_counterparty_days))
+        self.pairs = pairs[pairs["last_ts"] >= horizon].reset_index(drop=True)
+
+    # ---------- Persistens ----------
+
+    def save(self, path: str | Path) -> None:
+        """Sparar config, trösklar och tillstånd till en fil (pickle)."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        pd.to_pickle({
+            "version": STATE_VERSION,
+            "cfg": asdict(self.cfg),
+            "velocity": self.velocity,
+            "pairs": self.pairs,
+            "thr_high": self.thr_high,
+            "thr_x": self.thr_x,
+            "watermark": self.watermark,
+            "sketches": None if self.sketches is None else self.sketches.to_dict(),
+        }, path)
+
+    @classmethod
+    def load(cls, path: str | Path) -> "RiskEngine":
+        state = pd.read_pickle(Path(path))
+        if state.get("version") != STATE_VERSION:
+            raise ValueError(f"Okänd version på engine-tillstånd: {state.get('version')!r} (förväntade {STATE_VERSION}).")
+        engine = cls(RiskConfig(**state["cfg"]))
+        engine.velocity = state["velocity"]
+        engine.pairs = state["pairs"]
+        engine.thr_high = state["thr_high"]
+        engine.thr_x = state["thr_x"]
+        engine.watermark = state["watermark"]
+        if state.get("sketches") is not None:
+            engine.sketches = CurrencySketches.from_dict(state["sketches"])
+        return engine
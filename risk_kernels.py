@@ -0,0 +1,114 @@
+# risk_kernels.py
+from __future__ import annotations
+import os
+from typing import Optional
+import numpy as np
+
+# Valfri JIT: Numba används om det finns installerat (och inte är avstängt via SPBANK_NO_JIT=1),
+# annars körs de rena NumPy-varianterna. Båda ger exakt samma resultat.
+try:
+    if os.getenv("SPBANK_NO_JIT"):
+        raise ImportError
+    from numba import njit
+except ImportError:
+    njit = None
+
+HAVE_JIT = njit is not None
+
+
+# ---------------- NumPy (fallback) ----------------
+
+def _group_codes(offsets: np.ndarray) -> np.ndarray:
+    return np.repeat(np.arange(len(offsets) - 1, dtype=np.int64), np.diff(offsets))
+
+
+def _window_counts_numpy(ts: np.ndarray, offsets: np.ndarray, window: int) -> np.ndarray:
+    # Sammansatt nyckel (grupp, tidsrang) => en enda searchsorted för alla grupper
+    n = len(ts)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    g = _group_codes(offsets)
+    uniq = np.unique(ts)
+    stride = len(uniq) + 1
+    data_key = g * stride + np.searchsorted(uniq, ts, side="right")
+    start_key = g * stride + np.searchsorted(uniq, ts - window, side="right")
+    start = np.searchsorted(data_key, start_key, side="right")
+    return np.arange(n, dtype=np.int64) - start + 1
+
+
+def _gap_starts_numpy(ts: np.ndarray, offsets: np.ndarray, gap: int) -> np.ndarray:
+    new = np.ones(len(ts), dtype=bool)
+    if len(ts) > 1:
+        new[1:] = (ts[1:] - ts[:-1]) >= gap
+    new[offsets[:-1][np.diff(offsets) > 0]] = True
+    return new
+
+
+# ---------------- Numba ----------------
+
+if HAVE_JIT:
+    @njit(cache=True, nogil=True)
+    def _window_counts_jit(ts, offsets, window):
+        out = np.empty(len(ts), dtype=np.int64)
+        for g in range(len(offsets) - 1):
+            lo = offsets[g]
+            for i in range(offsets[g], offsets[g + 1]):
+                limit = ts[i] - window
+                while lo < i and ts[lo] <= limit:
+                    lo += 1
+                out[i] = i - lo + 1
+        return out
+
+    @njit(cache=True, nogil=True)
+    def _gap_starts_jit(ts, offsets, gap):
+        out = np.empty(len(ts), dtype=np.bool_)
+        for g in range(len(offsets) - 1):
+            start = offsets[g]
+            for i in range(start, offsets[g + 1]):
+                out[i] = i == start or ts[i] - ts[i - 1] >= gap
+        return out
+else:
+    _window_counts_jit = _gap_starts_jit = None
+
+
+def _use_jit(jit: Optional[bool]) -> bool:
+    if jit and not HAVE_JIT:
+        raise RuntimeError("Numba saknas (pip install numba) eller är avstängt via SPBANK_NO_JIT.")
+    return HAVE_JIT if jit is None else jit
+
+
+def window_counts(ts: np.ndarray, offsets: np.ndarray, window: int, jit: Optional[bool] = None) -> np.ndarray:
+    """
+    Antal rader i fönstret (t - window, t] inom samma grupp, fram till och med raden själv.
+    ts: int64, sorterad inom varje grupp; offsets: gruppstarter (längd antal grupper + 1).
+    jit: None = Numba om det finns, True/False = tvinga.
+    """
+    ts = np.ascontiguousarray(ts, dtype=np.int64)
+    offsets = np.ascontiguousarray(offsets, dtype=np.int64)
+    if _use_jit(jit):
+        return _window_counts_jit(ts, offsets, np.int64(window))
+    return _window_counts_numpy(ts, offsets, int(window))
+
+
+def gap_starts(ts: np.ndarray, offsets: np.ndarray, gap: int, jit: Optional[bool] = None) -> np.ndarray:
+    """
+    True för första raden i varje grupp och för rader där tiden sedan föregående rad
+    i gruppen är minst 'gap'. Samma indata som window_counts.
+    """
+    ts = np.ascontiguousarray(ts, dtype=np.int64)
+    offsets = np.ascontiguousarray(offsets, dtype=np.int64)
+    if _use_jit(jit):
+        return _gap_starts_jit(ts, offsets, np.int64(gap))
+    return _gap_starts_numpy(ts, offsets, int(gap))
+
+
+def sorted_groups(codes: np.ndarray, ts: np.ndarray):
+    """
+    Sorterar på (grupp, tid), stabilt så att lika tider behåller ursprungsordningen.
+    Returnerar (order, ts i sorterad ordning, offsets). codes: heltal >= 0.
+    """
+    order = np.lexsort((ts, codes))
+    sorted_codes = codes[order]
+    n_groups = int(sorted_codes[-1]) + 1 if len(sorted_codes) else 0
+    offsets = np.searchsorted(sorted_codes, np.arange(n_groups + 1), side="left").astype(np.int64)
+    return order, ts[order], offsets
@@ -0,0 +1,176 @@
+# risk_parallel.py
+from __future__ import annotations
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+from risk_rules import (
+    RiskConfig, RuleStats,
+    _prepare, _base_masks, _flag_frame,
+    _rule_velocity, _rule_pingpong, _rule_new_counterparty,
+)
+
+# Utdata-arrayer som workers skriver till (disjunkta rader per shard). Indata är
+# kontokoder, int64-tider och shard-permutationerna, så inga strängar eller DataFrames picklas.
+_SHARED_OUTPUTS = ("out_velocity", "out_newcp", "out_pingpong")
+
+
+class _SharedArrays:
+    """Numpy-arrayer i shared memory: create() i föräldern, attach() i worker via spec (namn, dtype, längd)."""
+
+    def __init__(self):
+        self.spec: Dict[str, Tuple[str, str, int]] = {}
+        self.arrays: Dict[str, np.ndarray] = {}
+        self._shms = []
+
+    @classmethod
+    def create(cls, arrays: Dict[str, np.ndarray]) -> "_SharedArrays":
+        obj = cls()
+        try:
+            for key, arr in arrays.items():
+                shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+                obj._shms.append(shm)
+                view = np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)
+                view[:] = arr
+                obj.arrays[key] = view
+                obj.spec[key] = (shm.name, arr.dtype.str, len(arr))
+        except Exception:
+            obj.close(unlink=True)
+            raise
+        return obj
+
+    @classmethod
+    def attach(cls, spec: Dict[str, Tuple[str, str, int]]) -> "_SharedArrays":
+        obj = cls()
+        obj.spec = spec
+        for key, (shm_name, dtype, length) in spec.items():
+            shm = shared_memory.SharedMemory(name=shm_name)
+            obj._shms.append(shm)
+            obj.arrays[key] = np.ndarray((length,), dtype=dtype, buffer=shm.buf)
+        return obj
+
+    def close(self, unlink: bool = False) -> None:
+        # Vyerna måste släppas innan minnet kan stängas
+        self.arrays = {}
+        for shm in self._shms:
+            shm.close()
+            if unlink:
+                shm.unlink()
+        self._shms = []
+
+
+def _shard_of_account(code: np.ndarray, shards: int) -> np.ndarray:
+    # Konton utan kod (-1) hamnar i shard 0; de hoppas ändå över av reglerna
+    return np.where(code < 0, 0, code % shards)
+
+
+def _shard_of_pair(a: np.ndarray, b: np.ndarray, shards: int) -> np.ndarray:
+    # Oordnat par => A->B och B->A hamnar i samma shard (krävs för ping-pong)
+    lo = np.minimum(a, b).astype(np.uint64)
+    hi = np.maximum(a, b).astype(np.uint64)
+    h = (lo * np.uint64(1_000_003) + hi) % np.uint64(shards)
+    return np.where((a < 0) | (b < 0), 0, h.astype(np.int64))
+
+
+def _codes_as_accounts(codes: np.ndarray) -> np.ndarray:
+    # -1 (saknat konto) => NaN så att reglerna behandlar raden som i score_and_flag
+    return np.where(codes < 0, np.nan, codes.astype(float))
+
+
+def _score_shard(spec: dict, kind: str, lo: int, hi: int, params: dict) -> int:
+    """Worker: kör kontolokala (kind="account") eller parlokala (kind="pair") regler på en shard."""
+    shared = _SharedArrays.attach(spec)
+    try:
+        return _score_rows(shared.arrays, kind, lo, hi, params)
+    finally:
+        shared.close()
+
+
+def _score_rows(a: Dict[str, np.ndarray], kind: str, lo: int, hi: int, params: dict) -> int:
+    rows = a["perm_account" if kind == "account" else "perm_pair"][lo:hi].copy()
+    df = pd.DataFrame({
+        "from_account": _codes_as_accounts(a["from_code"][rows]),
+        "to_account": _codes_as_accounts(a["to_code"][rows]),
+        "timestamp": pd.DatetimeIndex(a["ts"][rows].view("M8[ns]")).tz_localize("UTC"),
+    })
+    if kind == "account":
+        a["out_velocity"][rows] = _rule_velocity(df, params["velocity_window_hours"], params["velocity_min_tx"]).to_numpy()
+        a["out_newcp"][rows] = _rule_new_counterparty(df, params["new_counterparty_days"], False, None).to_numpy(dtype=bool)
+    else:
+        a["out_pingpong"][rows] = _rule_pingpong(df, params["pingpong_days"], params["pingpong_min_pairs"]).to_numpy()
+    return len(rows)
+
+
+def score_and_flag_parallel(trans: pd.DataFrame, cfg: RiskConfig, workers: Optional[int] = None,
+                            shards: Optional[int] = None, return_stats: bool = False):
+    """
+    Samma resultat som score_and_flag, men velocity, ny motpart och ping-pong körs per shard
+    i en ProcessPoolExecutor. Radlokala regler och percentiltrösklar räknas en gång i föräldern.
+      - velocity + ny motpart: hash på from_account
+      - ping-pong: hash på det oordnade paret {A, B}
+    Indata till workers går via shared memory (heltalskoder + int64-tider), inte pickle.
+    return_stats=True => (DF, RuleStats); de shardade reglerna har då gemensam tid i stages["shards"].
+    """
+    workers = workers or (cfg.workers if cfg.workers > 1 else os.cpu_count() or 1)
+    shards = shards or workers * 4
+
+    stats = RuleStats() if return_stats else None
+    df = _prepare(trans, cfg)
+    base = _base_masks(df, cfg, stats=stats)
+
+    n = len(df)
+    codes, _ = pd.factorize(np.concatenate([df["from_account"].to_numpy(), df["to_account"].to_numpy()]))
+    from_code, to_code = codes[:n].astype(np.int64), codes[n:].astype(np.int64)
+    ts = pd.DatetimeIndex(df["timestamp"]).as_unit("ns").asi8
+
+    acc_shard = _shard_of_account(from_code, shards)
+    pair_shard = _shard_of_pair(from_code, to_code, shards)
+    perm_account = np.argsort(acc_shard, kind="stable")
+    perm_pair = np.argsort(pair_shard, kind="stable")
+    acc_bounds = np.searchsorted(acc_shard[perm_account], np.arange(shards + 1))
+    pair_bounds = np.searchsorted(pair_shard[perm_pair], np.arange(shards + 1))
+
+    shared = _SharedArrays.create({
+        "from_code": from_code, "to_code": to_code, "ts": ts,
+        "perm_account": perm_account.astype(np.int64), "perm_pair": perm_pair.astype(np.int64),
+        **{key: np.zeros(n, dtype=bool) for key in _SHARED_OUTPUTS},
+    })
+    params = {
+        "velocity_window_hours": cfg.velocity_window_hours,
+        "velocity_min_tx": cfg.velocity_min_tx,
+        "new_counterparty_days": cfg.new_counterparty_days,
+        "pingpong_days": cfg.pingpong_days,
+        "pingpong_min_pairs": cfg.pingpong_min_pairs,
+    }
+    t0 = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = []
+            for kind, bounds in (("account", acc_bounds), ("pair", pair_bounds)):
+                for s in range(shards):
+                    lo, hi = int(bounds[s]), int(bounds[s + 1])
+                    if hi > lo:
+                        futures.append(pool.submit(_score_shard, shared.spec, kind, lo, hi, params))
+            for f in futures:
+                f.result()
+        m_velocity = shared.arrays["out_velocity"].copy()
+        m_newcp = shared.arrays["out_newcp"].copy()
+        m_pingpong = shared.arrays["out_pingpong"].copy()
+    finally:
+        shared.close(unlink=True)
+
+    if cfg.require_high_for_new_counterparty:
+        m_newcp &= base["high_amount"]
+
+    masks = {**base, "velocity": m_velocity, "pingpong": m_pingpong, "new_counterparty": m_newcp}
+    flagged = _flag_frame(df, masks, cfg)
+    if not return_stats:
+        return flagged
+    stats.stages["shards"] = time.perf_counter() - t0
+    for name in ("velocity", "pingpong", "new_counterparty"):
+        stats.add(name, float("nan"), n, int(masks[name].sum()))
+    return flagged, stats
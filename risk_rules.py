@@ -1,11 +1,15 @@
 # risk_rules.py
 from __future__ import annotations
-import re
-from dataclasses import dataclass
-from typing import Dict, Tuple, Iterable, Optional
+import time
+from dataclasses import dataclass, field, replace
+from typing import Callable, Dict, List, Tuple, Iterable, Optional
 import pandas as pd
 import numpy as np
 
+from keyword_matcher import compile_matcher, keyword_regex
+from quantile_sketch import CurrencySketches
+from risk_kernels import gap_starts, sorted_groups, window_counts
+
 
 @dataclass
 class RiskConfig:
@@ -18,6 +22,10 @@ class RiskConfig:
 
     # Nyckelord i notes
     keyword_list: Iterable[str] = ("crypto", "urgent")
+    # "regex" (en alternations-regex) eller "aho_corasick" (keyword_matcher, för långa bevakningslistor)
+    keyword_matcher: str = "regex"
+    keyword_whole_word: bool = False   # bara hela ord (inga ordtecken direkt före/efter)
+    keyword_case_fold: bool = True     # skiftlägesokänsligt
 
     # Kombinationslogik (för att minska brus)
     require_high_for_keyword: bool = True
@@ -40,11 +48,81 @@ class RiskConfig:
     # Failsafe (valfritt): cap per reason (None = ingen cap)
     cap_per_reason: Optional[int] = None  # t.ex. 3000
 
+    # Lägg till heltalskolumnen 'reason_mask' (en bit per regel, se REASON_*) i utdata
+    include_reason_mask: bool = False
+
+    # Antal processer för velocity/ping-pong/ny motpart (> 1 => risk_parallel, shardat per konto/par)
+    workers: int = 1
+
+    # Percentiltrösklar: "exact" (groupby().quantile) eller "sketch" (KLL per valuta,
+    # sammanfogbar mellan chunkar/processer) med rangfel ungefär sketch_rank_error
+    threshold_method: str = "exact"
+    sketch_rank_error: float = 0.001
+
+    # Tröskellager (threshold_store.py, JSON): trösklar läses därifrån i stället för ur batchen.
+    # Valutor som saknas i lagret räknas ur batchen enligt threshold_method.
+    threshold_store: Optional[str] = None
+
+    # Motor för basreglerna: "vectorized" (standard) eller "reference" (radvis apply,
+    # behålls för ekvivalenstester)
+    rule_engine: str = "vectorized"
+
+
+# ---------------- Reason-koder ----------------
+# En bit per regel i 'reason_mask'. Ordningen styr också ordningen i reason-texten.
+
+REASON_HIGH_AMOUNT     = 1 << 0
+REASON_CROSSBORDER     = 1 << 1
+REASON_STRUCTURING     = 1 << 2
+REASON_KEYWORD         = 1 << 3
+REASON_VELOCITY        = 1 << 4
+REASON_PINGPONG        = 1 << 5
+REASON_NEW_COUNTERPARTY = 1 << 6
+
+REASON_CODES = {
+    "high_amount": REASON_HIGH_AMOUNT,
+    "crossborder": REASON_CROSSBORDER,
+    "structuring": REASON_STRUCTURING,
+    "keyword": REASON_KEYWORD,
+    "velocity": REASON_VELOCITY,
+    "pingpong": REASON_PINGPONG,
+    "new_counterparty": REASON_NEW_COUNTERPARTY,
+}
+
+
+def _reason_text(mask: int, currency: str, cfg: RiskConfig) -> str:
+    """Bygger reason-texten för en bitmask (currency används bara för structuring), i bitordning."""
+    rlist = []
+    for rule in sorted(RULES.values(), key=lambda r: r.bit):
+        if mask & rule.bit:
+            text = rule.reason(cfg, currency)
+            if text:
+                rlist.append(text)
+    return ", ".join(rlist)
+
+
+def _cap_per_reason(flagged: pd.DataFrame, cap: int) -> pd.DataFrame:
+    """Behåll högst 'cap' rader per reason (störst amount först) utan att sortera hela ramen."""
+    pos = pd.Series(np.arange(len(flagged)), index=flagged["reason"].to_numpy())
+    sizes = pos.groupby(level=0, sort=False).transform("size").to_numpy()
+    keep = pos.to_numpy()[sizes <= cap]
+
+    over = sizes > cap
+    if over.any():
+        amounts = pd.Series(flagged["amount"].to_numpy()[over], index=pos.to_numpy()[over])
+        reasons = flagged["reason"].to_numpy()[over]
+        top = amounts.groupby(reasons, sort=False).nlargest(cap)
+        keep = np.concatenate([keep, top.index.get_level_values(-1).to_numpy()])
+
+    out = flagged.iloc[keep]
+    return out.sort_values("amount", ascending=False, kind="stable")
+
 
 # ---------------- Hjälpfunktioner ----------------
 
-def _ensure_numeric_amount(df: pd.DataFrame) -> pd.DataFrame:
-    out = df.copy()
+def _ensure_numeric_amount(df: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
+    # copy=False när df redan är en privat kopia (t.ex. direkt från _normalize_columns)
+    out = df.copy() if copy else df
     out["amount"] = pd.to_numeric(out["amount"], errors="coerce")
     out = out[out["amount"].notna()]
     return out
@@ -94,28 +172,106 @@ def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
     return out
 
 
+def _ts_ns(ts: pd.Series) -> np.ndarray:
+    """Tidsstämplar (utan NaT) som int64 nanosekunder sedan epoch (UTC)."""
+    return pd.DatetimeIndex(ts).as_unit("ns").asi8
+
+
 def _percentiles_per_currency(df: pd.DataFrame, p: float) -> dict:
     if df.empty:
         return {}
     return df.groupby("currency")["amount"].quantile(p).to_dict()
 
 
+def _stored_thresholds(df: pd.DataFrame, cfg: RiskConfig) -> Tuple[dict, dict]:
+    """Trösklar ur cfg.threshold_store; valutor som saknas där räknas ur df."""
+    from threshold_store import ThresholdStore
+    store = ThresholdStore.load(cfg.threshold_store)
+    thr_high = store.thresholds(cfg.high_amount_p)
+    thr_x = store.thresholds(cfg.crossborder_p)
+    missing = df["currency"].isin(set(df["currency"].dropna().unique()) - set(thr_high))
+    if missing.any():
+        local_high, local_x = _thresholds(df[missing], replace(cfg, threshold_store=None))
+        thr_high = {**local_high, **thr_high}
+        thr_x = {**local_x, **thr_x}
+    return thr_high, thr_x
+
+
+def _thresholds(df: pd.DataFrame, cfg: RiskConfig) -> Tuple[dict, dict]:
+    """(trösklar för high_amount_p, trösklar för crossborder_p) per valuta enligt cfg.threshold_method."""
+    if cfg.threshold_store:
+        return _stored_thresholds(df, cfg)
+    if cfg.threshold_method == "exact":
+        thr_high = _percentiles_per_currency(df, cfg.high_amount_p)
+        thr_x = thr_high if cfg.crossborder_p == cfg.high_amount_p else _percentiles_per_currency(df, cfg.crossborder_p)
+    elif cfg.threshold_method == "sketch":
+        sketches = CurrencySketches(rank_error=cfg.sketch_rank_error).update(df)
+        thr_high = sketches.thresholds(cfg.high_amount_p)
+        thr_x = thr_high if cfg.crossborder_p == cfg.high_amount_p else sketches.thresholds(cfg.crossborder_p)
+    else:
+        raise ValueError(f"Okänd threshold_method: {cfg.threshold_method!r} (förväntade 'exact' eller 'sketch').")
+    return thr_high, thr_x
+
+
 # ---------------- Regelmasker (enkla) ----------------
 
-def _rule_high_amount(df: pd.DataFrame, p: float) -> pd.Series:
-    thr = _percentiles_per_currency(df, p)
+def _amount_ge_threshold(df: pd.DataFrame, thr: dict) -> pd.Series:
+    """amount >= tröskel för radens valuta (saknad valuta i thr => inf => False)."""
+    if not thr or df.empty:
+        return pd.Series(False, index=df.index)
+    lim = df["currency"].map(thr).to_numpy(dtype=float, na_value=np.inf)
+    amt = df["amount"].to_numpy(dtype=float, na_value=np.nan)
+    return pd.Series(amt >= lim, index=df.index)
+
+
+def _rule_high_amount(df: pd.DataFrame, p: float, thr: dict | None = None) -> pd.Series:
+    if thr is None:
+        thr = _percentiles_per_currency(df, p)
+    return _amount_ge_threshold(df, thr)
+
+
+def _rule_crossborder_high(df: pd.DataFrame, p: float, thr: dict | None = None) -> pd.Series:
+    if thr is None:
+        thr = _percentiles_per_currency(df, p)
+    cross = df["sender_country"].astype(str).ne(df["receiver_country"].astype(str))
+    return cross & _amount_ge_threshold(df, thr)
+
+
+def _rule_structuring(df: pd.DataFrame, ranges: Dict[str, Tuple[float, float]] | None) -> pd.Series:
+    if not ranges or df.empty:
+        return pd.Series(False, index=df.index)
+    bands = {k: v for k, v in ranges.items() if v}
+    if not bands:
+        return pd.Series(False, index=df.index)
+
+    cur = df["currency"].astype(str)
+    lo = cur.map({k: v[0] for k, v in bands.items()}).to_numpy(dtype=float, na_value=np.nan)
+    hi = cur.map({k: v[1] for k, v in bands.items()}).to_numpy(dtype=float, na_value=np.nan)
+    amt = df["amount"].to_numpy(dtype=float, na_value=np.nan)
+    return pd.Series((amt >= lo) & (amt <= hi), index=df.index)
+
+
+# Referensimplementationer (radvis apply). Används av rule_engine="reference"
+# och i ekvivalenstesterna mot de vektoriserade varianterna ovan.
+
+def _rule_high_amount_reference(df: pd.DataFrame, p: float, thr: dict | None = None) -> pd.Series:
+    if thr is None:
+        thr = _percentiles_per_currency(df, p)
     if not thr:
         return pd.Series(False, index=df.index)
     return df.apply(lambda r: r["amount"] >= thr.get(r["currency"], np.inf), axis=1)
 
 
-def _rule_crossborder_high(df: pd.DataFrame, p: float) -> pd.Series:
-    thr = _percentiles_per_currency(df, p)
+def _rule_crossborder_high_reference(df: pd.DataFrame, p: float, thr: dict | None = None) -> pd.Series:
+    if thr is None:
+        thr = _percentiles_per_currency(df, p)
+    if not thr or df.empty:
+        return pd.Series(False, index=df.index)
     cross = df["sender_country"].astype(str).ne(df["receiver_country"].astype(str))
     return cross & df.apply(lambda r: r["amount"] >= thr.get(r["currency"], np.inf), axis=1)
 
 
-def _rule_structuring(df: pd.DataFrame, ranges: Dict[str, Tuple[float, float]] | None) -> pd.Series:
+def _rule_structuring_reference(df: pd.DataFrame, ranges: Dict[str, Tuple[float, float]] | None) -> pd.Series:
     if not ranges:
         return pd.Series(False, index=df.index)
 
@@ -129,10 +285,15 @@ def _rule_structuring(df: pd.DataFrame, ranges: Dict[str, Tuple[float, float]] |
     return df.apply(in_band, axis=1)
 
 
-def _rule_keyword(df: pd.DataFrame, keywords: Iterable[str]) -> pd.Series:
+def _rule_keyword(df: pd.DataFrame, keywords: Iterable[str], matcher: str = "regex",
+                  whole_word: bool = False, case_fold: bool = True) -> pd.Series:
     if not keywords:
         return pd.Series(False, index=df.index)
-    pattern = re.compile("|".join(re.escape(w) for w in keywords), flags=re.IGNORECASE)
+    if matcher == "aho_corasick":
+        return compile_matcher(keywords, case_fold=case_fold, whole_word=whole_word).contains(df["notes"])
+    if matcher != "regex":
+        raise ValueError(f"Okänd keyword_matcher: {matcher!r} (förväntade 'regex' eller 'aho_corasick').")
+    pattern = keyword_regex(keywords, case_fold=case_fold, whole_word=whole_word)
     return df["notes"].str.contains(pattern, na=False)
 
 
@@ -143,54 +304,49 @@ def _rule_velocity(df: pd.DataFrame, hours: int, min_tx: int) -> pd.Series:
     Flagga om ett konto (from_account) gör minst 'min_tx' transaktioner
     inom ett glidande fönster på 'hours' timmar.
     Kräver giltig 'timestamp' (timezone-aware) och 'from_account'.
+    Räknas i ett svep över alla konton (risk_kernels.window_counts, Numba om det finns) och
+    mappas tillbaka radvis via position, så dubblerade tidsstämplar flaggar bara rätt rad.
     """
     if "from_account" not in df.columns or df["timestamp"].isna().all():
         return pd.Series(False, index=df.index)
 
-    work = df[["from_account", "timestamp"]].copy()
-    work = work.dropna(subset=["from_account", "timestamp"]).sort_values(["from_account", "timestamp"])
-    flags = pd.Series(False, index=df.index)
+    valid = (df["from_account"].notna() & df["timestamp"].notna()).to_numpy()
+    pos = np.flatnonzero(valid)
+    codes, _ = pd.factorize(df["from_account"].to_numpy()[pos])
+    ts = _ts_ns(df["timestamp"].iloc[pos])
 
-    for acc, g in work.groupby("from_account", sort=False):
-        g = g.set_index("timestamp").sort_index()
-        ones = pd.Series(1, index=g.index)
-        # Viktigt: litet 'h' (framtidssäkert)
-        cnt = ones.rolling(f"{hours}h").sum().astype(int)
-        hit_idx = g.iloc[(cnt >= min_tx).values].index
-        mask = (df["from_account"] == acc) & (df["timestamp"].isin(hit_idx))
-        flags.loc[mask] = True
+    order, ts_sorted, offsets = sorted_groups(codes, ts)  # stabil: ursprungsordning vid lika tid
+    cnt = window_counts(ts_sorted, offsets, int(pd.Timedelta(hours=hours).value))
 
-    return flags
+    flags = np.zeros(len(df), dtype=bool)
+    flags[pos[order[cnt >= min_tx]]] = True
+    return pd.Series(flags, index=df.index)
 
 
-def _rule_pingpong(df: pd.DataFrame, days: int, min_pairs: int) -> pd.Series:
+def _pingpong_hits(df: pd.DataFrame, days: int) -> Tuple[np.ndarray, np.ndarray]:
     """
-    Flaggar transaktioner där det finns en retur (B->A) inom 'days' dagar
-    för den aktuella transaktionen (A->B).
+    Radvis träff (bool) om det finns en retur B->A inom 'days' dagar bakåt för A->B,
+    plus en heltalskod per riktat par (A, B) (-1 där konto/tid saknas).
+    Kontona kodas som heltal och radpositionen följer med genom merge_asof,
+    så träffarna mappas tillbaka direkt utan strängnycklar.
     """
-    if df["timestamp"].isna().all():
-        return pd.Series(False, index=df.index)
-    if "from_account" not in df.columns or "to_account" not in df.columns:
-        return pd.Series(False, index=df.index)
-
-    # A->B
-    left = (
-        df[["from_account", "to_account", "timestamp"]]
-        .dropna()
-        .rename(columns={"from_account": "A", "to_account": "B"})
-        .sort_values("timestamp")
-    )
+    hits = np.zeros(len(df), dtype=bool)
+    pair = np.full(len(df), -1, dtype=np.int64)
+    valid = (df["from_account"].notna() & df["to_account"].notna() & df["timestamp"].notna()).to_numpy()
+    pos = np.flatnonzero(valid)
+    n = len(pos)
+    if n == 0:
+        return hits, pair
+    codes, uniq = pd.factorize(np.concatenate([df["from_account"].to_numpy()[pos], df["to_account"].to_numpy()[pos]]))
+    a_code, b_code = codes[:n], codes[n:]
+    pair[pos] = a_code.astype(np.int64) * len(uniq) + b_code
+    ts = df["timestamp"].iloc[pos].to_numpy()
+
+    # A->B (med radposition)
+    left = pd.DataFrame({"A": a_code, "B": b_code, "timestamp": ts, "_pos": pos}).sort_values("timestamp", kind="stable")
+    # B->A (returer). Markörkolumn som överlever merge_asof.
+    right = pd.DataFrame({"B": a_code, "A": b_code, "timestamp": ts, "had_rev": 1}).sort_values("timestamp", kind="stable")
 
-    # B->A (returer). Lägg till markörkolumn som överlever merge_asof.
-    right = (
-        df[["from_account", "to_account", "timestamp"]]
-        .dropna()
-        .rename(columns={"from_account": "B", "to_account": "A"})
-        .sort_values("timestamp")
-        .assign(had_rev=1)
-    )
-
-    # merge_asof på tid och par-nycklar
     m = pd.merge_asof(
         left,
         right,
@@ -198,71 +354,278 @@ def _rule_pingpong(df: pd.DataFrame, days: int, min_pairs: int) -> pd.Series:
         by=["A", "B"],
         direction="backward",
         tolerance=pd.Timedelta(days=days),
-        suffixes=("", "_rev"),
     )
 
     # träff om markör finns (NaN => ingen träff)
-    has_rev = m["had_rev"].notna()
-
-    # Mappa tillbaka till ursprungsrader i df
-    idx = pd.Series(False, index=df.index)
-    if has_rev.any():
-        matched = m.loc[has_rev, ["A", "B", "timestamp"]]
-        key_df = (df["from_account"].astype(str) + "|" +
-                  df["to_account"].astype(str) + "|" +
-                  df["timestamp"].astype(str))
-        key_m  = (matched["A"].astype(str) + "|" +
-                  matched["B"].astype(str) + "|" +
-                  matched["timestamp"].astype(str))
-        idx.loc[key_df.isin(set(key_m))] = True
-
-    # Kräver fler än 1 retur? Filtrera bort par som inte når gränsen.
-    if min_pairs > 1 and idx.any():
-        pair_series = m.loc[has_rev, ["A", "B"]].astype(str).apply(tuple, axis=1)
-        counts = pair_series.value_counts()
-        poor_pairs = {pair for pair, cnt in counts.items() if cnt < min_pairs}
-        if poor_pairs:
-            kill_mask = (df["from_account"].astype(str) + "|" +
-                         df["to_account"].astype(str)).apply(
-                lambda s: tuple(s.split("|")) in poor_pairs
-            )
-            idx = idx & (~kill_mask)
-
-    return idx
+    hits[m["_pos"].to_numpy()[m["had_rev"].notna().to_numpy()]] = True
+    return hits, pair
+
+
+def _rule_pingpong(df: pd.DataFrame, days: int, min_pairs: int) -> pd.Series:
+    """
+    Flaggar transaktioner där det finns en retur (B->A) inom 'days' dagar
+    för den aktuella transaktionen (A->B).
+    """
+    if df["timestamp"].isna().all():
+        return pd.Series(False, index=df.index)
+    if "from_account" not in df.columns or "to_account" not in df.columns:
+        return pd.Series(False, index=df.index)
+
+    hits, pair = _pingpong_hits(df, days)
+
+    # Kräver fler än 1 retur? Antal träffar per par (A, B) via grupperad count.
+    if min_pairs > 1 and hits.any():
+        pair_hits = pd.Series(hits).groupby(pair, sort=False).transform("sum").to_numpy()
+        hits = hits & (pair_hits >= min_pairs)
+
+    return pd.Series(hits, index=df.index)
 
 from pandas.api.types import is_datetime64_any_dtype
 
 def _rule_new_counterparty(df: pd.DataFrame, days: int, require_high: bool, m_high: pd.Series) -> pd.Series:
+    """
+    Första A->B, eller A->B efter minst 'days' dagars uppehåll (per riktat par, i tidsordning,
+    lika tider i ursprungsordning). Rader utan konto räknas som första gången. Rader utan tid
+    sorteras sist i paret (som sort_values + shift): den första av dem räknas bara om paret
+    saknar giltiga tider, de följande alltid (föregående tid saknas).
+    Uppehållen räknas med risk_kernels.gap_starts på int64-tider och gruppoffsets.
+    """
     if df.empty:
         return pd.Series(False, index=df.index)
 
     # ✅ Korrekt dtype-koll även för timezone-aware timestamps
-    if not is_datetime64_any_dtype(df["timestamp"]):
-        df = df.copy()
-        df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce", utc=True)
-
-    d = df[["from_account", "to_account", "timestamp"]].copy()
-    d = d.sort_values("timestamp").copy()
-    d["timestamp_prev"] = d.groupby(["from_account", "to_account"])["timestamp"].shift(1)
-    d = d.reindex(df.index)
-
-    is_first = d["timestamp_prev"].isna()
-    gap_days = (d["timestamp"] - d["timestamp_prev"]).dt.total_seconds() / 86400.0
-    is_new_after_gap = gap_days >= float(days)
-    is_new_after_gap = is_new_after_gap.fillna(False)
-
-    mask = is_first | is_new_after_gap
+    ts_col = df["timestamp"]
+    if not is_datetime64_any_dtype(ts_col):
+        ts_col = pd.to_datetime(ts_col, errors="coerce", utc=True)
+
+    has_pair = (df["from_account"].notna() & df["to_account"].notna()).to_numpy()
+    has_ts = ts_col.notna().to_numpy()
+    mask = ~has_pair
+
+    pair = np.full(len(df), -1, dtype=np.int64)
+    a_code, _ = pd.factorize(df["from_account"].to_numpy()[has_pair])
+    b_code, b_uniq = pd.factorize(df["to_account"].to_numpy()[has_pair])
+    pair[has_pair], _ = pd.factorize(a_code.astype(np.int64) * max(1, len(b_uniq)) + b_code)
+
+    pos = np.flatnonzero(has_pair & has_ts)
+    if len(pos):
+        order, ts_sorted, offsets = sorted_groups(pair[pos], _ts_ns(ts_col.iloc[pos]))
+        mask[pos[order]] = gap_starts(ts_sorted, offsets, int(pd.Timedelta(days=days).value))
+
+    nat = np.flatnonzero(has_pair & ~has_ts)
+    if len(nat):
+        later = pd.Series(pair[nat]).duplicated().to_numpy()
+        mask[nat] = later | ~np.isin(pair[nat], pair[pos])
+
+    mask = pd.Series(mask, index=df.index)
     if require_high:
         mask = mask & m_high
 
     return mask.fillna(False)
 
 
-# ---------------- Huvudfunktion ----------------
+# ---------------- Regelregister ----------------
+
+@dataclass
+class Rule:
+    """
+    En regel i RULES. fn(df, cfg, ctx) -> bool-mask för raderna i df (ctx: trösklar m.m.).
+      requires:     regler som måste vara beräknade före denna (används av precondition)
+      precondition: (cfg, masks) -> bool-array över alla rader, eller None = alla rader.
+                    Regeln körs bara på kandidaterna; övriga rader blir False.
+      group_by:     för regler som behöver grannrader (t.ex. föregående A->B): kandidaterna
+                    utökas till hela sina grupper innan fn körs
+      reason:       (cfg, currency) -> reason-text (None/"" => ingen text)
+    """
+    name: str
+    bit: int
+    fn: Callable[[pd.DataFrame, RiskConfig, dict], pd.Series | np.ndarray]
+    reason: Callable[[RiskConfig, str], Optional[str]]
+    requires: Tuple[str, ...] = ()
+    precondition: Optional[Callable[[RiskConfig, Dict[str, np.ndarray]], Optional[np.ndarray]]] = None
+    group_by: Optional[Tuple[str, ...]] = None
+
+
+@dataclass
+class RuleStat:
+    name: str
+    seconds: float
+    rows: int   # antal rader regeln faktiskt kördes på
+    hits: int
+
+
+@dataclass
+class RuleStats:
+    """Tid, utvärderade rader och träffar per regel (plus tid för steg utanför reglerna, t.ex. trösklar)."""
+    rules: Dict[str, RuleStat] = field(default_factory=dict)
+    stages: Dict[str, float] = field(default_factory=dict)
+
+    def add(self, name: str, seconds: float, rows: int, hits: int) -> None:
+        self.rules[name] = RuleStat(name, seconds, rows, hits)
+
+    @property
+    def total_seconds(self) -> float:
+        return float(np.nansum([r.seconds for r in self.rules.values()])) + sum(self.stages.values())
+
+    def to_frame(self) -> pd.DataFrame:
+        frame = pd.DataFrame(
+            [(r.name, r.seconds, r.rows, r.hits) for r in self.rules.values()]
+            + [(name, sec, None, None) for name, sec in self.stages.items()],
+            columns=["rule", "seconds", "rows", "hits"],
+        )
+        return frame.astype({"rows": "Int64", "hits": "Int64"})
+
+    def __str__(self) -> str:
+        return self.to_frame().to_string(index=False)
+
+
+RULES: Dict[str, Rule] = {}
+
+
+def register_rule(rule: Rule, replace: bool = False) -> Rule:
+    """Lägger till en regel i registret (egen bit i reason_mask, beroenden måste redan finnas)."""
+    if rule.name in RULES and not replace:
+        raise ValueError(f"Regeln {rule.name!r} finns redan (använd replace=True).")
+    taken = {r.bit: r.name for r in RULES.values() if r.name != rule.name}
+    if rule.bit in taken or rule.bit <= 0 or rule.bit & (rule.bit - 1):
+        raise ValueError(f"Ogiltig eller upptagen bit {rule.bit} för {rule.name!r}.")
+    missing = [d for d in rule.requires if d not in RULES]
+    if missing:
+        raise ValueError(f"Regeln {rule.name!r} beror på okända regler: {missing}.")
+    RULES[rule.name] = rule
+    return rule
+
 
-def score_and_flag(trans: pd.DataFrame, cfg: RiskConfig) -> pd.DataFrame:
-    """Returnerar DF: transaction_id, reason, flagged_date, amount"""
+def unregister_rule(name: str) -> None:
+    for other in RULES.values():
+        if name in other.requires:
+            raise ValueError(f"Regeln {other.name!r} beror på {name!r}.")
+    RULES.pop(name, None)
 
+
+def _high_amount(df, cfg, ctx):
+    if cfg.rule_engine == "reference":
+        return _rule_high_amount_reference(df, cfg.high_amount_p, thr=ctx["thr_high"])
+    return _rule_high_amount(df, cfg.high_amount_p, thr=ctx["thr_high"])
+
+
+def _crossborder(df, cfg, ctx):
+    if cfg.rule_engine == "reference":
+        return _rule_crossborder_high_reference(df, cfg.crossborder_p, thr=ctx["thr_x"])
+    return _rule_crossborder_high(df, cfg.crossborder_p, thr=ctx["thr_x"])
+
+
+def _structuring(df, cfg, ctx):
+    if cfg.rule_engine == "reference":
+        return _rule_structuring_reference(df, cfg.structuring_by_currency)
+    return _rule_structuring(df, cfg.structuring_by_currency)
+
+
+def _structuring_reason(cfg, currency):
+    lo, hi = (cfg.structuring_by_currency or {}).get(currency, (None, None))
+    return f"Structuring band {lo:g}–{hi:g} {currency}" if lo is not None else None
+
+
+def _crossborder_candidates(cfg, masks):
+    # Kombinationslogik (enkel brusreduktion): kräver högt belopp och/eller ej structuring
+    cand = None
+    if cfg.require_high_for_crossborder:
+        cand = masks["high_amount"]
+    if cfg.exclude_structuring_from_crossborder:
+        cand = ~masks["structuring"] if cand is None else cand & ~masks["structuring"]
+    return cand
+
+
+for _rule in (
+    Rule("high_amount", REASON_HIGH_AMOUNT, _high_amount,
+         reason=lambda cfg, cur: "High amount vs p98 (per valuta)"),
+    Rule("structuring", REASON_STRUCTURING, _structuring, reason=_structuring_reason),
+    Rule("crossborder", REASON_CROSSBORDER, _crossborder,
+         reason=lambda cfg, cur: "High-value cross-border (strict)",
+         requires=("high_amount", "structuring"), precondition=_crossborder_candidates),
+    Rule("keyword", REASON_KEYWORD,
+         lambda df, cfg, ctx: _rule_keyword(df, cfg.keyword_list, cfg.keyword_matcher,
+                                            cfg.keyword_whole_word, cfg.keyword_case_fold),
+         reason=lambda cfg, cur: "Keyword + high amount" if cfg.require_high_for_keyword else "Keyword match in notes",
+         requires=("high_amount",),
+         precondition=lambda cfg, m: m["high_amount"] if cfg.require_high_for_keyword else None),
+    Rule("velocity", REASON_VELOCITY,
+         lambda df, cfg, ctx: _rule_velocity(df, cfg.velocity_window_hours, cfg.velocity_min_tx),
+         reason=lambda cfg, cur: f"High velocity ≥ {cfg.velocity_min_tx} tx/{cfg.velocity_window_hours}h"),
+    Rule("pingpong", REASON_PINGPONG,
+         lambda df, cfg, ctx: _rule_pingpong(df, cfg.pingpong_days, cfg.pingpong_min_pairs),
+         reason=lambda cfg, cur: f"Ping-pong (retur inom {cfg.pingpong_days}d)"),
+    Rule("new_counterparty", REASON_NEW_COUNTERPARTY,
+         lambda df, cfg, ctx: _rule_new_counterparty(df, cfg.new_counterparty_days, False, None),
+         reason=lambda cfg, cur: f"New counterparty (>{cfg.new_counterparty_days}d)"
+                                 + (" + high amount" if cfg.require_high_for_new_counterparty else ""),
+         requires=("high_amount",),
+         precondition=lambda cfg, m: m["high_amount"] if cfg.require_high_for_new_counterparty else None,
+         group_by=("from_account", "to_account")),
+):
+    register_rule(_rule)
+
+# Regler som behöver hela historiken/fönster över rader; RiskEngine och risk_parallel
+# räknar dem själva och tar bara resten ur registret via _base_masks.
+_WINDOW_RULES = ("velocity", "pingpong", "new_counterparty")
+
+
+def _rule_order(skip: Iterable[str] = ()) -> List[Rule]:
+    """Reglerna i registreringsordning, men alltid efter sina beroenden."""
+    order, done = [], set(skip)
+    pending = [r for r in RULES.values() if r.name not in done]
+    while pending:
+        rule = next((r for r in pending if all(d in done for d in r.requires)), None)
+        if rule is None:
+            raise ValueError(f"Cirkulära eller överhoppade beroenden: {[r.name for r in pending]}.")
+        order.append(rule)
+        done.add(rule.name)
+        pending.remove(rule)
+    return order
+
+
+def _as_bool(m, n: int) -> np.ndarray:
+    if isinstance(m, pd.Series):
+        return m.to_numpy(dtype=bool, na_value=False)
+    return np.asarray(m, dtype=bool).reshape(n)
+
+
+def _evaluate_rules(df: pd.DataFrame, cfg: RiskConfig, ctx: dict, skip: Iterable[str] = (),
+                    stats: Optional[RuleStats] = None) -> Dict[str, np.ndarray]:
+    """
+    Kör registrets regler i beroendeordning. En regel med precondition körs bara på
+    kandidatraderna (t.ex. keyword bara där high_amount träffat). Returnerar {namn: bool-array}.
+    """
+    n = len(df)
+    masks: Dict[str, np.ndarray] = {}
+    for rule in _rule_order(skip):
+        t0 = time.perf_counter()
+        cand = rule.precondition(cfg, masks) if rule.precondition else None
+        if cand is None:
+            evaluated = n
+            hit = _as_bool(rule.fn(df, cfg, ctx), n)
+        else:
+            cand = np.asarray(cand, dtype=bool)
+            rows = np.flatnonzero(cand)
+            if rule.group_by and 0 < len(rows) < n:
+                groups = df.groupby(list(rule.group_by), sort=False, dropna=False).ngroup().to_numpy()
+                rows = np.flatnonzero(np.isin(groups, groups[rows]))
+            evaluated = len(rows)
+            hit = np.zeros(n, dtype=bool)
+            if evaluated == n:
+                hit = _as_bool(rule.fn(df, cfg, ctx), n)
+            elif evaluated:
+                hit[rows] = _as_bool(rule.fn(df.iloc[rows], cfg, ctx), evaluated)
+            hit = hit & cand
+        masks[rule.name] = hit
+        if stats is not None:
+            stats.add(rule.name, time.perf_counter() - t0, evaluated, int(hit.sum()))
+    return masks
+
+
+# ---------------- Huvudfunktion ----------------
+
+def _apply_defaults(cfg: RiskConfig) -> None:
     # Defaults för structuring-band (smala → mindre brus)
     if cfg.structuring_by_currency is None:
         cfg.structuring_by_currency = {
@@ -271,70 +634,86 @@ def score_and_flag(trans: pd.DataFrame, cfg: RiskConfig) -> pd.DataFrame:
             "USD": (950, 999.99),
         }
 
-    df = _normalize_columns(trans)
-    df = _ensure_numeric_amount(df)
-
-    # Basmasker
-    m_high     = _rule_high_amount(df, cfg.high_amount_p)
-    m_xborder  = _rule_crossborder_high(df, cfg.crossborder_p)
-    m_struct   = _rule_structuring(df, cfg.structuring_by_currency)
-    m_keyword  = _rule_keyword(df, cfg.keyword_list)
 
-    # Kombinationslogik (enkel brusreduktion)
-    if cfg.require_high_for_keyword:
-        m_keyword = m_keyword & m_high
-    if cfg.require_high_for_crossborder:
-        m_xborder = m_xborder & m_high
-    if cfg.exclude_structuring_from_crossborder:
-        m_xborder = m_xborder & (~m_struct)
-
-    # Avancerade masker
-    m_velocity = _rule_velocity(df, cfg.velocity_window_hours, cfg.velocity_min_tx)
-    m_pingpong = _rule_pingpong(df, cfg.pingpong_days, cfg.pingpong_min_pairs)
-    m_newcp    = _rule_new_counterparty(df, cfg.new_counterparty_days, cfg.require_high_for_new_counterparty, m_high)
-
-    # Slutlig OR av alla
-    any_flag = m_high | m_xborder | m_struct | m_keyword | m_velocity | m_pingpong | m_newcp
-    if not any_flag.any():
-        return pd.DataFrame(columns=["transaction_id", "reason", "flagged_date", "amount"])
-
-    # Reason-texter per rad
-    reasons = []
-    for i in df.index:
-        if not any_flag.get(i, False):
-            reasons.append("")
-            continue
-        rlist = []
-        if bool(m_high.get(i, False)):
-            rlist.append("High amount vs p98 (per valuta)")
-        if bool(m_xborder.get(i, False)):
-            rlist.append("High-value cross-border (strict)")
-        if bool(m_struct.get(i, False)):
-            lo, hi = cfg.structuring_by_currency.get(str(df.at[i, "currency"]), (None, None))
-            if lo is not None:
-                rlist.append(f"Structuring band {lo:g}–{hi:g} {df.at[i,'currency']}")
-        if bool(m_keyword.get(i, False)):
-            rlist.append("Keyword + high amount" if cfg.require_high_for_keyword else "Keyword match in notes")
-        if bool(m_velocity.get(i, False)):
-            rlist.append(f"High velocity ≥ {cfg.velocity_min_tx} tx/{cfg.velocity_window_hours}h")
-        if bool(m_pingpong.get(i, False)):
-            rlist.append(f"Ping-pong (retur inom {cfg.pingpong_days}d)")
-        if bool(m_newcp.get(i, False)):
-            extra = " + high amount" if cfg.require_high_for_new_counterparty else ""
-            rlist.append(f"New counterparty (>{cfg.new_counterparty_days}d){extra}")
-
-        reasons.append(", ".join(rlist))
-
-    flagged = df.loc[any_flag].copy()
-    flagged["reason"] = [r for r in reasons if r]
+def _prepare(trans: pd.DataFrame, cfg: RiskConfig) -> pd.DataFrame:
+    _apply_defaults(cfg)
+    df = _normalize_columns(trans)
+    return _ensure_numeric_amount(df, copy=False)
+
+
+def _rule_context(df: pd.DataFrame, cfg: RiskConfig, thr_high: dict | None = None, thr_x: dict | None = None,
+                  stats: Optional[RuleStats] = None) -> dict:
+    """Trösklar per valuta för reglerna; färdiga thr_high/thr_x används som de är."""
+    t0 = time.perf_counter()
+    if thr_high is None:
+        if cfg.rule_engine == "reference":
+            thr_high = _percentiles_per_currency(df, cfg.high_amount_p)
+            thr_x = _percentiles_per_currency(df, cfg.crossborder_p)
+        elif cfg.rule_engine == "vectorized":
+            thr_high, thr_x = _thresholds(df, cfg)
+        else:
+            raise ValueError(f"Okänd rule_engine: {cfg.rule_engine!r} (förväntade 'vectorized' eller 'reference').")
+    if stats is not None:
+        stats.stages["thresholds"] = time.perf_counter() - t0
+    return {"thr_high": thr_high, "thr_x": thr_x}
+
+
+def _base_masks(df: pd.DataFrame, cfg: RiskConfig, thr_high: dict | None = None, thr_x: dict | None = None,
+                stats: Optional[RuleStats] = None) -> Dict[str, np.ndarray]:
+    """
+    Alla registrerade regler utom fönsterreglerna (_WINDOW_RULES), inkl. kombinationslogik.
+    thr_high/thr_x: färdiga trösklar per valuta; None => ur df enligt cfg.threshold_method.
+    """
+    ctx = _rule_context(df, cfg, thr_high, thr_x, stats)
+    return _evaluate_rules(df, cfg, ctx, skip=_WINDOW_RULES, stats=stats)
+
+
+def _flag_frame(df: pd.DataFrame, masks: Dict[str, pd.Series | np.ndarray], cfg: RiskConfig) -> pd.DataFrame:
+    """Slår ihop regelmasker (nyckel = regelnamn i RULES) till utdataramen med reason-texter."""
+    # Reason-bitmask per rad (0 = ej flaggad)
+    reason_mask = np.zeros(len(df), dtype=np.int64)
+    for name, m in masks.items():
+        reason_mask[_as_bool(m, len(df))] |= RULES[name].bit
+
+    out_cols = ["transaction_id", "reason", "flagged_date", "amount"]
+    if cfg.include_reason_mask:
+        out_cols.append("reason_mask")
+
+    rows = np.flatnonzero(reason_mask)
+    if len(rows) == 0:
+        return pd.DataFrame(columns=out_cols)
+
+    # Reason-texter: en gång per unik (bitmask, valuta) och mappa tillbaka.
+    # Valutan behövs bara för structuring-texten.
+    masks_ = reason_mask[rows]
+    cur = df["currency"].astype(str).to_numpy()[rows]
+    cur = np.where(masks_ & REASON_STRUCTURING, cur, "")
+    codes, uniq = pd.MultiIndex.from_arrays([masks_, cur]).factorize()
+    texts = np.array([_reason_text(int(m), c, cfg) for m, c in uniq], dtype=object)
+
+    flagged = df.iloc[rows][["transaction_id", "amount"]].copy()
+    flagged["reason"] = texts[codes]
     flagged["flagged_date"] = pd.Timestamp.today().date().isoformat()
-    flagged = flagged[["transaction_id", "reason", "flagged_date", "amount"]].drop_duplicates()
+    flagged["reason_mask"] = masks_
+    flagged = flagged[out_cols].drop_duplicates(subset=["transaction_id", "reason", "flagged_date", "amount"])
 
     if cfg.cap_per_reason:
-        flagged = (
-            flagged.sort_values("amount", ascending=False)
-                   .groupby("reason", group_keys=False)
-                   .head(cfg.cap_per_reason)
-        )
+        flagged = _cap_per_reason(flagged, cfg.cap_per_reason)
 
     return flagged
+
+
+def score_and_flag(trans: pd.DataFrame, cfg: RiskConfig, return_stats: bool = False):
+    """
+    Returnerar DF: transaction_id, reason, flagged_date, amount.
+    return_stats=True => (DF, RuleStats) med tid, utvärderade rader och träffar per regel.
+    """
+    if cfg.workers > 1:
+        from risk_parallel import score_and_flag_parallel
+        return score_and_flag_parallel(trans, cfg, return_stats=return_stats)
+
+    stats = RuleStats() if return_stats else None
+    df = _prepare(trans, cfg)
+    ctx = _rule_context(df, cfg, stats=stats)
+    flagged = _flag_frame(df, _evaluate_rules(df, cfg, ctx, stats=stats), cfg)
+    return (flagged, stats) if return_stats else flagged
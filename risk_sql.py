@@ -0,0 +1,236 @@
+# risk_sql.py
+from __future__ import annotations
+import re
+from typing import Dict, Tuple
+import pandas as pd
+from sqlalchemy import text
+
+from risk_rules import RiskConfig, RULES, score_and_flag, _apply_defaults
+from threshold_store import ThresholdStore
+
+# Regler som kan kompileras till SQL (egna regler i RULES går bara i pandas-motorn)
+_SQL_RULES = ("high_amount", "crossborder", "structuring", "keyword", "velocity", "pingpong", "new_counterparty")
+
+# Samma data som pandas-motorn läser i run_flagging_from_db.py. Ordningen (timestamp, id)
+# är tie-break för lika tider i velocity/ny motpart, precis som ORDER BY i SQL-varianten.
+SOURCE_SQL = """select
+  t.id as transaction_id,
+  t.timestamp,
+  t.amount,
+  t.currency,
+  sa.account_number as from_account,
+  ra.account_number as to_account,
+  t.sender_country,
+  t.receiver_country,
+  t.notes
+from bank.transactions t
+left join bank.accounts sa on sa.id = t.sender_account_id
+left join bank.accounts ra on ra.id = t.receiver_account_id
+order by t.timestamp, t.id
+"""
+
+
+def _like_escape(word: str) -> str:
+    return word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _regex_escape(word: str) -> str:
+    # ARE: backslash framför icke-alfanumeriskt tecken ger tecknet bokstavligt
+    return re.sub(r"([^0-9A-Za-z])", r"\\\1", word)
+
+
+def _keyword_sql(cfg: RiskConfig, params: dict) -> str:
+    words = [w for w in cfg.keyword_list if w]
+    if not words:
+        return "false"
+    if cfg.keyword_whole_word:
+        # Samma ordgräns som \w i pandas-motorn: inget ordtecken direkt före/efter
+        params["kw_re"] = "(^|[^[:alnum:]_])(" + "|".join(_regex_escape(w) for w in words) + ")($|[^[:alnum:]_])"
+        return f"s.notes {'~*' if cfg.keyword_case_fold else '~'} :kw_re"
+    params["kw_like"] = [f"%{_like_escape(w)}%" for w in words]
+    return f"s.notes {'ILIKE' if cfg.keyword_case_fold else 'LIKE'} ANY (CAST(:kw_like AS text[]))"
+
+
+def _bands_sql(cfg: RiskConfig, params: dict) -> str:
+    bands = {cur: band for cur, band in (cfg.structuring_by_currency or {}).items() if band}
+    if not bands:
+        return "SELECT NULL::text AS currency, NULL::float8 AS lo, NULL::float8 AS hi, NULL::text AS reason WHERE false"
+    rows = []
+    for i, (cur, (lo, hi)) in enumerate(bands.items()):
+        params.update({f"band_cur{i}": cur, f"band_lo{i}": float(lo), f"band_hi{i}": float(hi),
+                       f"band_reason{i}": RULES["structuring"].reason(cfg, cur)})
+        rows.append(f"(CAST(:band_cur{i} AS text), CAST(:band_lo{i} AS float8), "
+                    f"CAST(:band_hi{i} AS float8), CAST(:band_reason{i} AS text))")
+    return "VALUES " + ", ".join(rows)
+
+
+def _thr_sql(cfg: RiskConfig, params: dict) -> str:
+    # Med cfg.threshold_store gäller lagrets trösklar; övriga valutor räknas i databasen
+    if not cfg.threshold_store:
+        return "thr AS (SELECT * FROM thr_calc)"
+    store = ThresholdStore.load(cfg.threshold_store)
+    thr_high, thr_x = store.thresholds(cfg.high_amount_p), store.thresholds(cfg.crossborder_p)
+    if not thr_high:
+        return "thr AS (SELECT * FROM thr_calc)"
+    rows = []
+    for i, cur in enumerate(thr_high):
+        params.update({f"thr_cur{i}": cur, f"thr_high{i}": float(thr_high[cur]), f"thr_x{i}": float(thr_x[cur])})
+        rows.append(f"(CAST(:thr_cur{i} AS text), CAST(:thr_high{i} AS float8), CAST(:thr_x{i} AS float8))")
+    return f"""thr_store (currency, thr_high, thr_x) AS (VALUES {", ".join(rows)}),
+thr AS (
+    SELECT c.currency, COALESCE(st.thr_high, c.thr_high) AS thr_high, COALESCE(st.thr_x, c.thr_x) AS thr_x
+    FROM thr_calc c LEFT JOIN thr_store st ON st.currency = c.currency
+)"""
+
+
+def compile_flagging_sql(cfg: RiskConfig) -> Tuple[str, Dict[str, object]]:
+    """
+    Kompilerar RiskConfig till en SELECT över bank.transactions med samma kolumner som
+    score_and_flag (transaction_id, reason, flagged_date, amount). Returnerar (sql, parametrar).
+    Percentiler via percentile_cont (= pandas quantile) eller ur cfg.threshold_store, velocity/ny motpart via fönsterfunktioner
+    och ping-pong via EXISTS mot samma rader (sender_account_id, receiver_account_id, timestamp).
+    Rader utan belopp tas bort först, som i pandas-motorn.
+    """
+    extra = [name for name in RULES if name not in _SQL_RULES]
+    if extra:
+        raise ValueError(f"Regler utan SQL-motsvarighet: {extra} (kör pandas-motorn).")
+    if cfg.threshold_method != "exact":
+        raise ValueError("SQL-motorn räknar exakta percentiler (threshold_method='exact').")
+    _apply_defaults(cfg)
+
+    params: Dict[str, object] = {"high_p": float(cfg.high_amount_p), "x_p": float(cfg.crossborder_p)}
+    for name in ("high_amount", "crossborder", "keyword", "velocity", "pingpong", "new_counterparty"):
+        params[f"r_{name}"] = RULES[name].reason(cfg, "")
+
+    vel_hours = int(cfg.velocity_window_hours)
+    pp_days = int(cfg.pingpong_days)
+    ncp_days = int(cfg.new_counterparty_days)
+
+    m_xborder = "b.m_xborder_raw"
+    if cfg.require_high_for_crossborder:
+        m_xborder += " AND b.m_high"
+    if cfg.exclude_structuring_from_crossborder:
+        m_xborder += " AND NOT b.m_struct"
+    m_keyword = "b.m_keyword_raw" + (" AND b.m_high" if cfg.require_high_for_keyword else "")
+    m_pingpong = "b.pp_hit" + (f" AND b.pp_pair_hits >= {int(cfg.pingpong_min_pairs)}" if cfg.pingpong_min_pairs > 1 else "")
+    m_newcp = "b.ncp_new" + (" AND b.m_high" if cfg.require_high_for_new_counterparty else "")
+
+    capped = ""
+    if cfg.cap_per_reason:
+        capped = f"WHERE rn <= {int(cfg.cap_per_reason)}"
+
+    sql = f"""
+WITH src AS (
+    SELECT t.id AS transaction_id, t.timestamp AS ts, t.amount::float8 AS amount, t.amount AS amount_num,
+           t.currency, COALESCE(t.notes, '') AS notes,
+           t.sender_account_id AS from_account, t.receiver_account_id AS to_account,
+           t.sender_country, t.receiver_country
+    FROM bank.transactions t
+    WHERE t.amount IS NOT NULL  -- som _ensure_numeric_amount i pandas-motorn
+),
+thr_calc AS (
+    SELECT currency,
+           percentile_cont(CAST(:high_p AS float8)) WITHIN GROUP (ORDER BY amount) AS thr_high,
+           percentile_cont(CAST(:x_p AS float8)) WITHIN GROUP (ORDER BY amount) AS thr_x
+    FROM src GROUP BY currency
+),
+{_thr_sql(cfg, params)},
+bands (currency, lo, hi, reason) AS ({_bands_sql(cfg, params)}),
+base AS (
+    SELECT s.transaction_id, s.amount_num, s.from_account, s.to_account, s.ts,
+           COALESCE(s.amount >= th.thr_high, false) AS m_high,
+           COALESCE(s.sender_country IS DISTINCT FROM s.receiver_country AND s.amount >= th.thr_x, false) AS m_xborder_raw,
+           COALESCE(s.amount BETWEEN bd.lo AND bd.hi, false) AS m_struct,
+           bd.reason AS struct_reason,
+           {_keyword_sql(cfg, params)} AS m_keyword_raw,
+           -- (t - h, t] fram till och med raden själv: radnummer minus rader med tid <= t - h
+           row_number() OVER (PARTITION BY s.from_account ORDER BY s.ts, s.transaction_id)
+             - count(*) OVER (PARTITION BY s.from_account ORDER BY s.ts
+                              RANGE BETWEEN UNBOUNDED PRECEDING AND INTERVAL '{vel_hours} hours' PRECEDING) AS vel_cnt,
+           EXISTS (
+               SELECT 1 FROM src r
+               WHERE r.from_account = s.to_account AND r.to_account = s.from_account
+                 AND r.ts <= s.ts AND r.ts >= s.ts - INTERVAL '{pp_days} days'
+           ) AS pp_hit,
+           s.from_account IS NULL OR s.to_account IS NULL
+             OR COALESCE(s.ts - lag(s.ts) OVER (PARTITION BY s.from_account, s.to_account ORDER BY s.ts, s.transaction_id)
+                         >= INTERVAL '{ncp_days} days', true) AS ncp_new
+    FROM src s
+    LEFT JOIN thr th ON th.currency = s.currency
+    LEFT JOIN bands bd ON bd.currency = s.currency
+),
+pairs AS (
+    SELECT base.*, sum(pp_hit::int) OVER (PARTITION BY from_account, to_account) AS pp_pair_hits
+    FROM base
+),
+flags AS (
+    SELECT b.transaction_id, b.amount_num, b.struct_reason,
+           b.m_high AS high_amount,
+           {m_xborder} AS crossborder,
+           b.m_struct AS structuring,
+           {m_keyword} AS keyword,
+           b.from_account IS NOT NULL AND b.ts IS NOT NULL AND b.vel_cnt >= {int(cfg.velocity_min_tx)} AS velocity,
+           {m_pingpong} AS pingpong,
+           {m_newcp} AS new_counterparty
+    FROM pairs b
+),
+flagged AS (
+    SELECT transaction_id, amount_num AS amount,
+           concat_ws(', ',
+               CASE WHEN high_amount THEN CAST(:r_high_amount AS text) END,
+               CASE WHEN crossborder THEN CAST(:r_crossborder AS text) END,
+               CASE WHEN structuring THEN struct_reason END,
+               CASE WHEN keyword THEN CAST(:r_keyword AS text) END,
+               CASE WHEN velocity THEN CAST(:r_velocity AS text) END,
+               CASE WHEN pingpong THEN CAST(:r_pingpong AS text) END,
+               CASE WHEN new_counterparty THEN CAST(:r_new_counterparty AS text) END
+           ) AS reason
+    FROM flags
+    WHERE high_amount OR crossborder OR structuring OR keyword OR velocity OR pingpong OR new_counterparty
+),
+ranked AS (
+    SELECT flagged.*, row_number() OVER (PARTITION BY reason ORDER BY amount DESC, transaction_id) AS rn
+    FROM flagged
+)
+SELECT transaction_id, reason, CURRENT_DATE AS flagged_date, amount
+FROM ranked {capped}
+"""
+    return sql, params
+
+
+def select_flagged_sql(conn, cfg: RiskConfig) -> pd.DataFrame:
+    """Kör den kompilerade frågan och returnerar resultatet (utan att skriva något)."""
+    sql, params = compile_flagging_sql(cfg)
+    return pd.read_sql(text(sql + " ORDER BY amount DESC, transaction_id"), conn, params=params)
+
+
+def score_and_flag_sql(conn, cfg: RiskConfig) -> int:
+    """
+    Flaggar i databasen och skriver direkt till bank.flagged_transactions.
+    Rader som redan finns hoppas över via den unika nyckeln (transaction_id, reason,
+    flagged_date), som i import_flagged_transactions.py. Returnerar antal nya rader.
+    """
+    sql, params = compile_flagging_sql(cfg)
+    insert = f"""
+INSERT INTO bank.flagged_transactions (transaction_id, reason, flagged_date, amount)
+SELECT q.transaction_id, q.reason, q.flagged_date, q.amount
+FROM ({sql}) q
+ON CONFLICT (transaction_id, reason, flagged_date) DO NOTHING
+"""
+    return conn.execute(text(insert), params).rowcount
+
+
+def compare_with_pandas(conn, cfg: RiskConfig) -> pd.DataFrame:
+    """
+    Kör båda motorerna på samma data och returnerar raderna som skiljer
+    (kolumnen 'engine' = 'sql' eller 'pandas'). Tom DF => samma flaggor.
+    """
+    df = pd.read_sql(text(SOURCE_SQL), conn)
+    df["amount"] = pd.to_numeric(df["amount"], errors="coerce")
+    keys = ["transaction_id", "reason"]
+    py = score_and_flag(df, cfg)[keys]
+    sq = select_flagged_sql(conn, cfg)[keys]
+    diff = py.merge(sq, on=keys, how="outer", indicator=True)
+    diff = diff[diff["_merge"] != "both"]
+    diff["engine"] = diff["_merge"].map({"left_only": "pandas", "right_only": "sql"}).astype(str)
+    return diff.drop(columns="_merge").reset_index(drop=True)
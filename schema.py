@@ -0,0 +1,133 @@
+# schema.py
+from __future__ import annotations
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+# Opt-in: SPBANK_CSV_ENGINE=pyarrow ger flertrådad CSV-parsning (kräver pyarrow).
+# Chunkad läsning (chunksize) kör alltid pandas C-motor, som pyarrow-motorn inte stöder.
+CSV_ENGINE = os.getenv("SPBANK_CSV_ENGINE") or None
+
+
+@dataclass(frozen=True)
+class Col:
+    """
+    kind: "text", "category", "float", "datetime" eller "date".
+    formats: datumformat som provas i tur och ordning innan pandas gissar (format="mixed").
+    """
+    kind: str = "text"
+    formats: Tuple[str, ...] = ()
+
+
+_TS_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S")
+
+# Kolumner per namn; samma namn har samma typ i alla filer
+COLUMNS: Dict[str, Col] = {
+    # kunder
+    "Customer": Col(), "Address": Col(), "Phone": Col(), "Personnummer": Col(), "BankAccount": Col(),
+    "balance": Col("float"),
+    # transaktioner
+    "id": Col(), "transaction_id": Col(), "notes": Col(),
+    "timestamp": Col("datetime", _TS_FORMATS),
+    "amount": Col("float"),
+    "currency": Col("category"),
+    "sender_account": Col("category"), "receiver_account": Col("category"),
+    "sender_acc": Col("category"), "receiver_acc": Col("category"),
+    "from_account": Col("category"), "to_account": Col("category"),
+    "sender_country": Col("category"), "receiver_country": Col("category"),
+    "sender_municipality": Col("category"), "receiver_municipality": Col("category"),
+    "transaction_type": Col("category"),
+    # flaggade
+    "reason": Col("category"),
+    "flagged_date": Col("date", ("%Y-%m-%d",)),
+}
+
+# Förväntade kolumner per fil (övriga kolumner läses som text)
+DATASETS: Dict[str, Tuple[str, ...]] = {
+    "customers": ("Customer", "Address", "Phone", "Personnummer", "BankAccount"),
+    "transactions": ("transaction_id", "timestamp", "amount", "currency", "sender_account", "receiver_account",
+                     "sender_country", "sender_municipality", "receiver_country", "receiver_municipality",
+                     "transaction_type", "notes"),
+    "flagged": ("transaction_id", "reason", "flagged_date", "amount"),
+}
+
+
+def column(name: str) -> Col:
+    return COLUMNS.get(name, Col())
+
+
+def csv_dtypes(columns: Iterable[str], categories: bool = True) -> dict:
+    """dtype-mappning för read_csv: allt som text, utom kategorikolumner (om categories)."""
+    return {c: "category" if categories and column(c).kind == "category" else str for c in columns}
+
+
+def _parse_datetime(s: pd.Series, formats: Tuple[str, ...]) -> Optional[pd.Series]:
+    # Kända format först (snabbt), resten med format="mixed"; None om värdena har tidszonsoffset
+    s = s.astype(str)
+    out = pd.Series(pd.NaT, index=s.index, dtype="datetime64[ns]")
+    todo = (s.str.strip() != "").to_numpy().copy()
+    for fmt in formats:
+        if not todo.any():
+            break
+        parsed = pd.to_datetime(s[todo], format=fmt, errors="coerce")
+        hit = parsed.notna().to_numpy()
+        pos = np.flatnonzero(todo)[hit]
+        out.iloc[pos] = parsed.to_numpy()[hit]
+        todo[pos] = False
+    if todo.any():
+        try:
+            rest = pd.to_datetime(s[todo], errors="coerce", format="mixed")
+        except (ValueError, TypeError):
+            return None
+        if rest.dt.tz is not None:
+            return None
+        out.iloc[np.flatnonzero(todo)] = rest.to_numpy()
+    return out
+
+
+def apply_types(df: pd.DataFrame, categories: bool = True) -> pd.DataFrame:
+    """
+    Typar kolumnerna efter COLUMNS: float (NaN om ogiltigt), datetime (NaT), date (None)
+    och kategorier. Timestamps med tidszonsoffset lämnas som text, så att inget tolkas om.
+    """
+    df = df.copy()
+    for name in df.columns:
+        col, s = column(name), df[name]
+        if col.kind == "float" and not pd.api.types.is_numeric_dtype(s):
+            df[name] = pd.to_numeric(s, errors="coerce")
+        elif col.kind == "datetime" and not pd.api.types.is_datetime64_any_dtype(s):
+            ts = _parse_datetime(s, col.formats)
+            if ts is not None:
+                df[name] = ts
+        elif col.kind == "date" and (s.dtype == object or pd.api.types.is_string_dtype(s)
+                                     or isinstance(s.dtype, pd.CategoricalDtype)):
+            d = _parse_datetime(s, col.formats)
+            if d is not None:
+                df[name] = d.dt.date.where(d.notna(), None)
+        elif col.kind == "category" and categories and not isinstance(s.dtype, pd.CategoricalDtype):
+            df[name] = s.astype("category")
+    return df
+
+
+def read_csv(path, typed: bool = True, categories: bool = True, engine: Optional[str] = None,
+             usecols=None, chunksize: Optional[int] = None, nrows: Optional[int] = None):
+    """
+    Läser en CSV enligt schemat. typed=False ger råtext (som dtype=str, keep_default_na=False)
+    men med kategorikolumner; typed=True typar även belopp och datum (apply_types).
+    engine: None = CSV_ENGINE (standard pandas C-motor), "pyarrow" = flertrådad parsning.
+    Med chunksize returneras en iterator av DataFrames.
+    """
+    header = list(pd.read_csv(path, nrows=0).columns)
+    if usecols is not None:
+        header = [c for c in header if (usecols(c) if callable(usecols) else c in set(usecols))]
+    engine = engine or CSV_ENGINE
+    if chunksize or nrows is not None:
+        engine = None
+    reader = pd.read_csv(Path(path), dtype=csv_dtypes(header, categories), keep_default_na=False,
+                         usecols=header, engine=engine, chunksize=chunksize, nrows=nrows)
+    if chunksize:
+        return (apply_types(chunk, categories) if typed else chunk for chunk in reader)
+    return apply_types(reader, categories) if typed else reader
@@ -0,0 +1,58 @@
+# scripts/bench_kernels.py
+import argparse
+import time
+
+import numpy as np
+
+import risk_kernels as rk
+
+
+def _best_of(fn, repeat):
+    best = float("inf")
+    out = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Jämför Numba- och NumPy-kärnorna för fönsterreglerna.")
+    ap.add_argument("--rows", type=int, default=1_000_000, help="Antal rader (standard 1M)")
+    ap.add_argument("--groups", type=int, default=50_000, help="Antal konton/par")
+    ap.add_argument("--days", type=int, default=30, help="Tidsspann i dagar")
+    ap.add_argument("--repeat", type=int, default=3, help="Bästa av N körningar")
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    codes = rng.integers(0, args.groups, size=args.rows)
+    ts = rng.integers(0, args.days * 86400, size=args.rows).astype(np.int64) * 1_000_000_000
+    t0 = time.perf_counter()
+    _, ts_sorted, offsets = rk.sorted_groups(codes, ts)
+    print(f"rader={args.rows:,} grupper={args.groups:,}  sortering: {time.perf_counter() - t0:.3f}s")
+
+    window = 24 * 3600 * 10 ** 9
+    gap = 14 * 86400 * 10 ** 9
+    kernels = {
+        "window_counts": lambda jit: rk.window_counts(ts_sorted, offsets, window, jit=jit),
+        "gap_starts": lambda jit: rk.gap_starts(ts_sorted, offsets, gap, jit=jit),
+    }
+    if rk.HAVE_JIT:
+        for fn in kernels.values():
+            fn(True)  # kompilering (cachas på disk) räknas inte
+    else:
+        print("ℹ️ Numba saknas eller är avstängt (SPBANK_NO_JIT) – bara NumPy körs.")
+
+    for name, fn in kernels.items():
+        t_np, out_np = _best_of(lambda: fn(False), args.repeat)
+        line = f"{name:<14} numpy: {t_np:.3f}s"
+        if rk.HAVE_JIT:
+            t_jit, out_jit = _best_of(lambda: fn(True), args.repeat)
+            same = "samma" if np.array_equal(out_np, out_jit) else "OLIKA!"
+            line += f"  numba: {t_jit:.3f}s  ({t_np / t_jit:.1f}x, {same})"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,69 @@
 # scripts/run_flagging_from_clean.py
 import argparse
-from pathlib import Path
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
 import pandas as pd
 
 from risk_rules import score_and_flag, RiskConfig
+from clean_io import CLEAN_FORMAT, SUFFIXES, clean_path, find_clean, read_clean, write_clean
+
+RENAME_MAP = {
+    "id": "transaction_id",
+    "sender_acc": "from_account",
+    "receiver_acc": "to_account",
+    "from_acc": "from_account",
+    "to_acc": "to_account",
+}
 
 def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
-    rename_map = {
-        "id": "transaction_id",
-        "sender_acc": "from_account",
-        "receiver_acc": "to_account",
-        "from_acc": "from_account",
-        "to_acc": "to_account",
-    }
-    cols = {c: rename_map.get(c, c) for c in df.columns}
+    cols = {c: RENAME_MAP.get(c, c) for c in df.columns}
     df = df.rename(columns=cols)
     return df
 
 def main():
-    ap = argparse.ArgumentParser(description="Kör flaggning direkt från redan städad CSV.")
-    ap.add_argument("--in", dest="inp", default="data/clean/transactions_clean.csv", help="Infil (CSV)")
-    ap.add_argument("--out", dest="out", default="data/clean/flagged_transactions.csv", help="Utfil (CSV)")
+    ap = argparse.ArgumentParser(description="Kör flaggning direkt från redan städad CSV/Parquet.")
+    ap.add_argument("--in", dest="inp", default="data/clean/transactions_clean.csv",
+                    help="Infil (CSV eller Parquet; finns filen i --format används den)")
+    ap.add_argument("--out", dest="out", default="data/clean/flagged_transactions.csv",
+                    help="Utfil (filändelsen sätts efter --format)")
+    ap.add_argument("--format", dest="fmt", choices=sorted(SUFFIXES), default=CLEAN_FORMAT,
+                    help="Format för mellanfilerna (standard SPBANK_CLEAN_FORMAT eller csv)")
     ap.add_argument("--tz", dest="tz", default="Europe/Stockholm", help="Tidszon för flagged_date")
+    ap.add_argument("--thresholds", dest="thresholds", default=None,
+                    help="Tröskellager (JSON från threshold_store.py) i stället för percentiler ur indata")
+    ap.add_argument("--max-memory", dest="max_memory", default=None,
+                    help="Chunkad out-of-core-körning med minnesbudget, t.ex. 2G")
+    ap.add_argument("--sorted", dest="assume_sorted", action="store_true",
+                    help="Infilen är redan sorterad på timestamp (hoppar över spill till disk)")
+    ap.add_argument("--stats", action="store_true",
+                    help="Skriv ut tid, utvärderade rader och träffar per regel")
     args = ap.parse_args()
 
-    in_path = Path(args.inp)
-    out_path = Path(args.out)
+    in_path = find_clean(args.inp, args.fmt)
+    out_path = clean_path(args.out, args.fmt)
 
     if not in_path.exists():
         raise SystemExit(f"Hittar inte {in_path}.")
 
-    df = pd.read_csv(in_path, dtype=str, keep_default_na=False)
-    if "amount" in df.columns:
+    cfg = RiskConfig(threshold_store=args.thresholds)
+
+    if args.max_memory:
+        from risk_chunked import score_and_flag_chunked
+        n = score_and_flag_chunked(in_path, out_path, cfg, max_memory=args.max_memory,
+                                   assume_sorted=args.assume_sorted, rename=RENAME_MAP)
+        print(f"✅ Flaggade transaktioner sparade i {out_path} (antal={n}, chunkad, max {args.max_memory})")
+        return
+
+    df = read_clean(in_path)
+    if "amount" in df.columns and not pd.api.types.is_numeric_dtype(df["amount"]):
         df["amount"] = pd.to_numeric(df["amount"], errors="coerce")
 
     df = _normalize_columns(df)
 
-    cfg = RiskConfig()
-    flagged = score_and_flag(df, cfg)
+    flagged, stats = score_and_flag(df, cfg, return_stats=True)
+    if args.stats:
+        print(stats)
 
     if "flagged_date" not in flagged.columns:
         flagged["flagged_date"] = datetime.now(ZoneInfo(args.tz)).date().isoformat()
@@ -50,8 +73,7 @@ def main():
 
     cols = [c for c in ["transaction_id", "reason", "flagged_date", "amount"] if c in flagged.columns]
     flagged = flagged[cols].sort_values(["flagged_date", "amount"], ascending=[False, False])
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    flagged.to_csv(out_path, index=False, encoding="utf-8")
+    write_clean(flagged, out_path)
     print(f"✅ Flaggade transaktioner sparade i {out_path} (antal={len(flagged)})")
 
 if __name__ == "__main__":
@@ -0,0 +1,57 @@
+# seen_ids.py
+from __future__ import annotations
+from typing import List
+import numpy as np
+import pandas as pd
+
+
+def hash_ids(ids: pd.Series) -> np.ndarray:
+    """64-bitars hash (uint64) per id, deterministisk mellan körningar."""
+    return pd.util.hash_pandas_object(ids.astype(str), index=False).to_numpy(dtype=np.uint64)
+
+
+class SeenIds:
+    """
+    Kompakt mängd av redan sedda id:n, lagrade som 64-bitars hashar (8 byte per id i stället
+    för en Python-sträng per id). Hasharna ligger i sorterade körningar som slås ihop
+    binärräknare-vis, så antalet körningar är högst log2(n) och varje id sorteras om O(log n) gånger.
+    Hashkollisioner är möjliga men osannolika (ungefär n²/2^65, ~3e-4 vid 100 miljoner id:n).
+    """
+
+    def __init__(self):
+        self._runs: List[np.ndarray] = []
+
+    def __len__(self) -> int:
+        return sum(len(r) for r in self._runs)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(r.nbytes for r in self._runs)
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        found = np.zeros(len(hashes), dtype=bool)
+        for run in self._runs:
+            pos = np.searchsorted(run, hashes)
+            pos[pos == len(run)] = 0
+            found |= run[pos] == hashes
+        return found
+
+    def add(self, hashes: np.ndarray) -> None:
+        run = np.unique(np.asarray(hashes, dtype=np.uint64))
+        if not len(run):
+            return
+        while self._runs and len(self._runs[-1]) <= len(run):
+            run = np.union1d(self._runs.pop(), run)
+        self._runs.append(run)
+
+    def filter_new(self, ids: pd.Series) -> np.ndarray:
+        """
+        Mask för id:n som inte setts tidigare (första förekomsten inom ids räknas som ny),
+        och lägger in dem i mängden. Samma resultat som drop_duplicates(keep="first") över alla anrop.
+        """
+        hashes = hash_ids(ids)
+        new = ~pd.Series(hashes).duplicated().to_numpy()
+        if self._runs:
+            new &= ~self.contains(hashes)
+        self.add(hashes[new])
+        return new
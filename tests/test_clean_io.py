@@ -0,0 +1,130 @@
+import datetime as dt
+import importlib
+
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+import schema
+from clean_io import CleanWriter, clean_path, find_clean, read_clean, write_clean
+from risk_rules import RiskConfig
+from risk_chunked import score_and_flag_chunked
+from test_risk_rules_equivalence import _random_tx
+from test_validation_vectorized import _write_transactions
+
+pytest.importorskip("pyarrow")
+
+
+def test_parquet_roundtrip_is_typed(tmp_path):
+    df = pd.DataFrame({
+        "transaction_id": ["T1", "T2"],
+        "amount": ["100.5", "7"],
+        "timestamp": ["2025-01-01 10:00:00", ""],
+        "flagged_date": ["2025-10-05", ""],
+        "notes": ["", "urgent"],
+    })
+    path = write_clean(df, tmp_path / "x.parquet")
+    got = read_clean(path)
+
+    assert got["amount"].tolist() == [100.5, 7.0]
+    assert pd.api.types.is_datetime64_any_dtype(got["timestamp"])
+    assert got["timestamp"].iloc[0] == pd.Timestamp("2025-01-01 10:00:00") and pd.isna(got["timestamp"].iloc[1])
+    assert got["flagged_date"].tolist() == [dt.date(2025, 10, 5), None]
+    assert got["notes"].tolist() == ["", "urgent"]
+
+
+def test_timestamps_with_offsets_stay_text():
+    df = pd.DataFrame({"timestamp": ["2025-01-01 00:00:00+01:00", "2025-01-01 00:00:00"]})
+    assert schema.apply_types(df)["timestamp"].tolist() == df["timestamp"].tolist()
+
+
+def test_find_clean_prefers_format(tmp_path):
+    csv = tmp_path / "t.csv"
+    csv.write_text("a\n1\n", encoding="utf-8")
+    assert find_clean(csv, "parquet") == csv
+    pq = write_clean(pd.DataFrame({"a": ["1"]}), clean_path(csv, "parquet"))
+    assert find_clean(csv, "parquet") == pq
+    assert find_clean(csv, "csv") == csv
+
+
+@pytest.mark.parametrize("chunksize", [None, 1500])
+def test_validation_parquet_matches_csv(tmp_path, monkeypatch, chunksize):
+    validation = importlib.import_module("validation")
+    monkeypatch.setattr(validation, "OUT_DIR", tmp_path)
+    tx = tmp_path / "transactions.csv"
+    _write_transactions(tx, n=6000, seed=2)
+    monkeypatch.setattr(validation, "TX_IN", tx)
+
+    validation.clean_transactions(chunksize=chunksize, fmt="csv")
+    validation.clean_transactions(chunksize=chunksize, fmt="parquet")
+    from_csv = read_clean(tmp_path / "transactions_clean.csv")
+    from_pq = read_clean(tmp_path / "transactions_clean.parquet")
+
+    assert from_pq["amount"].dtype == "float64"
+    pd.testing.assert_frame_equal(from_pq, from_csv, check_dtype=False, check_categorical=False)
+
+
+def test_chunked_flagging_reads_and_writes_parquet(tmp_path):
+    df = _random_tx(n=2000, seed=5)
+    cfg = RiskConfig(velocity_min_tx=8, velocity_window_hours=48, high_amount_p=0.9)
+    write_clean(df, tmp_path / "tx.csv")
+    write_clean(df, tmp_path / "tx.parquet")
+
+    n_csv = score_and_flag_chunked(tmp_path / "tx.csv", tmp_path / "f.csv", cfg, max_memory="1M", tmp_dir=tmp_path)
+    n_pq = score_and_flag_chunked(tmp_path / "tx.parquet", tmp_path / "f.parquet", cfg, max_memory="1M",
+                                  tmp_dir=tmp_path)
+    got = read_clean(tmp_path / "f.parquet")
+    expected = read_clean(tmp_path / "f.csv")
+
+    assert n_csv == n_pq == len(got)
+    key = ["transaction_id", "reason"]
+    pd.testing.assert_frame_equal(got.sort_values(key, ignore_index=True),
+                                  expected.sort_values(key, ignore_index=True),
+                                  check_dtype=False, check_categorical=False)
+
+
+def test_clean_writer_empty(tmp_path):
+    out = CleanWriter(tmp_path / "e.parquet").close(["transaction_id", "amount"])
+    assert list(read_clean(out).columns) == ["transaction_id", "amount"]
+
+
+@pytest.mark.db
+@pytest.mark.integration
+def test_import_from_parquet(tmp_path, db_engine, ensure_db, monkeypatch):
+    import import_customers as ic
+    import import_transactions as itx
+    import import_flagged_transactions as ift
+    from init_schema import ensure_schema
+
+    write_clean(pd.DataFrame({"Customer": ["Pq Alice", "Pq Bob"], "Personnummer": ["850101-1230", "850202-2340"],
+                              "BankAccount": ["PQACC1", "PQACC2"], "Address": ["", "Gatan 2"],
+                              "Phone": ["+461234567", ""]}), tmp_path / "customers_clean.parquet")
+    write_clean(pd.DataFrame({"id": ["PQT1"], "timestamp": ["2025-01-01 12:30:00"], "amount": ["250.0"],
+                              "currency": ["SEK"], "sender_acc": ["PQACC1"], "receiver_acc": ["PQACC2"],
+                              "notes": [""]}), tmp_path / "transactions_clean.parquet")
+    write_clean(pd.DataFrame({"transaction_id": ["PQT1"], "reason": ["High amount"],
+                              "flagged_date": ["2025-10-05"], "amount": ["250.0"]}),
+                tmp_path / "flagged_transactions.parquet")
+
+    # Skripten pekar på .csv-namnen; find_clean hittar Parquet-filerna bredvid
+    monkeypatch.setattr(ic, "CUSTOMERS_CSV", str(tmp_path / "customers_clean.csv"))
+    monkeypatch.setattr(itx, "TX_CSV", str(tmp_path / "transactions_clean.csv"))
+    monkeypatch.setattr(ift, "FLAGGED_CSV", str(tmp_path / "flagged_transactions.csv"))
+
+    ensure_schema()
+    try:
+        ic.main()
+        itx.main()
+        ift.main()
+        with db_engine.begin() as conn:
+            row = conn.execute(text("SELECT timestamp, amount FROM bank.transactions WHERE id = 'PQT1'")).one()
+            assert row.timestamp == dt.datetime(2025, 1, 1, 12, 30) and float(row.amount) == 250.0
+            flagged = conn.execute(text(
+                "SELECT flagged_date FROM bank.flagged_transactions WHERE transaction_id = 'PQT1'")).one()
+            assert str(flagged.flagged_date)[:10] == "2025-10-05"
+    finally:
+        with db_engine.begin() as conn:
+            conn.execute(text("DELETE FROM bank.flagged_transactions WHERE transaction_id = 'PQT1'"))
+            conn.execute(text("DELETE FROM bank.transactions WHERE id = 'PQT1'"))
+            conn.execute(text("DELETE FROM bank.accounts WHERE account_number IN ('PQACC1', 'PQACC2')"))
+            conn.execute(text("DELETE FROM bank.customers WHERE personnummer IN ('850101-1230', '850202-2340')"))
@@ -0,0 +1,104 @@
+import contextlib
+import importlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+import flow_main
+
+
+def _pnr(i):
+    # Giltigt personnummer (datum och Luhn-kontrollsiffra) för kund i
+    body = f"7001{i + 1:02d}{100 + i:03d}"
+    total = sum((int(c) * w) // 10 + (int(c) * w) % 10 for c, w in zip(body, [2, 1] * 5))
+    return f"{body[:6]}-{body[6:]}{(10 - total % 10) % 10}"
+
+
+def _write_inputs(data_dir, n_customers=20, n_tx=400, seed=3):
+    rng = np.random.default_rng(seed)
+    customers = pd.DataFrame({
+        "Customer": [f"Fused Kund {i}" for i in range(n_customers)],
+        "Address": "Gatan 1",
+        "Phone": "+46701234567",
+        "Personnummer": [_pnr(i) for i in range(n_customers)],
+        "BankAccount": [f"FUSEDACC{i}" for i in range(n_customers)],
+    })
+    customers.to_csv(data_dir / "customers.csv", index=False)
+    acc = customers["BankAccount"].to_numpy()
+    tx = pd.DataFrame({
+        "transaction_id": [f"FUSEDT{i}" for i in range(n_tx)],
+        "timestamp": (pd.Timestamp("2025-03-01") + pd.to_timedelta(rng.integers(0, 30 * 86400, n_tx), unit="s"))
+        .strftime("%Y-%m-%d %H:%M:%S"),
+        "amount": np.round(rng.lognormal(6, 1.2, n_tx), 2),
+        "currency": rng.choice(["SEK", "EUR"], n_tx),
+        "sender_account": rng.choice(acc, n_tx),
+        "receiver_account": rng.choice(acc, n_tx),
+        "sender_country": "Sweden",
+        "receiver_country": rng.choice(["Sweden", "Norway"], n_tx),
+        "transaction_type": "outgoing",
+        "notes": "",
+    })
+    tx.to_csv(data_dir / "transactions.csv", index=False)
+
+
+def _cleanup(conn):
+    conn.execute(text("DELETE FROM bank.flagged_transactions WHERE transaction_id LIKE 'FUSEDT%'"))
+    conn.execute(text("DELETE FROM bank.transactions WHERE id LIKE 'FUSEDT%'"))
+    conn.execute(text("DELETE FROM bank.accounts WHERE account_number LIKE 'FUSEDACC%'"))
+    conn.execute(text("DELETE FROM bank.customers WHERE customer LIKE 'Fused Kund%'"))
+
+
+@pytest.mark.db
+@pytest.mark.integration
+def test_fused_mode_loads_same_rows_as_file_mode(tmp_path, db_engine, ensure_db, monkeypatch):
+    validation = importlib.import_module("validation")
+    import import_customers as ic
+    import import_transactions as itx
+    import import_flagged_transactions as ift
+
+    _write_inputs(tmp_path)
+    monkeypatch.setattr(validation, "CUSTOMERS_IN", tmp_path / "customers.csv")
+    monkeypatch.setattr(validation, "TX_IN", tmp_path / "transactions.csv")
+    monkeypatch.setattr(validation, "OUT_DIR", tmp_path)
+    monkeypatch.setattr(ic, "CUSTOMERS_CSV", str(tmp_path / "customers_clean.csv"))
+    monkeypatch.setattr(itx, "TX_CSV", str(tmp_path / "transactions_clean.csv"))
+    monkeypatch.setattr(ift, "FLAGGED_CSV", str(tmp_path / "flagged_transactions.csv"))
+
+    flow_main.ensure_schema()
+    with db_engine.begin() as conn:
+        _cleanup(conn)
+    try:
+        # Sammanslaget läge: inga filer skrivs, summeringen kommer direkt från laddarna
+        customers, transactions = flow_main.validate_in_process_task.fn(keep_files=False)
+        flagged = flow_main.score_in_process_task.fn(transactions, keep_files=False)
+        assert not list(tmp_path.glob("*_clean.csv")) and not (tmp_path / "flagged_transactions.csv").exists()
+        assert len(flagged) > 0
+
+        s = {}
+        s.update(flow_main.load_customers_task.fn(customers))
+        s.update(flow_main.load_transactions_task.fn(transactions))
+        s.update(flow_main.load_flagged_task.fn(flagged))
+        assert s["customers"] == (20, 0)
+        assert s["accounts"] == (20, 0, 0)
+        assert s["transactions"] == (400, 0, 0)
+        assert s["flagged"] == (len(flagged), 0, 0)
+
+        # Filläget på samma indata ska se exakt samma rader (nu redan inlästa)
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            validation.clean_customers()
+            validation.flag_suspected_transactions(validation.clean_transactions())
+            ic.main()
+            itx.main()
+            ift.main()
+        file_s = flow_main.extract_summary(out.getvalue())
+        assert file_s["customers"] == (0, 20)
+        assert file_s["accounts"] == (0, 20, 0)
+        assert file_s["transactions"] == (0, 400, 0)
+        assert file_s["flagged"] == (0, len(flagged), 0)
+    finally:
+        with db_engine.begin() as conn:
+            _cleanup(conn)
@@ -0,0 +1,206 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+from import_workers import partition
+from init_schema import ensure_schema
+
+
+def test_partition_keeps_ids_together_and_in_order():
+    keys = pd.Series([f"T{i % 700}" for i in range(2000)])
+    parts = partition(keys, 4)
+    assert len(parts) == 4
+    assert np.array_equal(np.sort(np.concatenate(parts)), np.arange(len(keys)))
+    assert all((np.diff(p) > 0).all() for p in parts)
+    owner = {k: i for i, p in enumerate(parts) for k in keys.iloc[p]}
+    assert all(owner[k] == i for i, p in enumerate(parts) for k in keys.iloc[p])
+    assert len(partition(keys.iloc[:0], 4)) == 1
+
+
+def _customers():
+    # Dubbletter av personnummer och konto, blanksteg, tomma fält och en rad som redan finns
+    return pd.DataFrame([
+        ("Bulk A", "BULK-PNR-1", "BULKACC1", "Gatan 1", "+4670111"),
+        ("Bulk B", " BULK-PNR-2 ", "BULKACC2 ", "", ""),
+        ("Bulk A igen", "BULK-PNR-1", "BULKACC3", "Gatan 3", "+4670333"),
+        ("Bulk C", "BULK-PNR-3", "BULKACC2", "Gatan 4", "+4670444"),
+        ("Bulk D", "BULK-PNR-4", "", "Gatan 5", "+4670555"),
+        ("Bulk Finns", "BULK-PNR-0", "BULKACC0", "Gatan 0", ""),
+    ], columns=["Customer", "Personnummer", "BankAccount", "Address", "Phone"])
+
+
+def _transactions():
+    # Dubblett-id, en transaktion som redan finns, okänt konto, tidszon, tomma fält och datum utan klockslag
+    rows = [
+        ("BULKT1", "2025-01-01 10:00:00", "100.5", "SEK", "BULKACC1", "BULKACC2", "Sweden", "Stockholm", "urgent"),
+        ("BULKT2", "2025-01-02T11:30:00+01:00", "20", "EUR", "BULKACC2", "BULKACC1", "Norway", "", ""),
+        ("BULKT1", "2025-01-03 10:00:00", "5", "SEK", "BULKACC1", "BULKACC2", "Sweden", "", "dubblett"),
+        ("BULKT3", "2025-01-04 09:00:00", "7.25", "USD", "BULKACC1", "BULKACC-SAKNAS", "", "", ""),
+        ("BULKT0", "2025-01-05 09:00:00", "1", "SEK", "BULKACC1", "BULKACC3", "", "", "finns redan"),
+        ("BULKT4", "2025-01-06", "", " GBP ", "BULKACC3", "BULKACC1", "", "", ""),
+        ("BULKT4", "2025-01-06 09:00:00", "2", "SEK", "BULKACC-SAKNAS", "BULKACC1", "", "", "dubblett, okänt konto"),
+    ]
+    df = pd.DataFrame(rows, columns=["transaction_id", "timestamp", "amount", "currency", "sender_account",
+                                     "receiver_account", "sender_country", "sender_municipality", "notes"])
+    df["transaction_type"] = "outgoing"
+    return df
+
+
+def _flagged():
+    # Dubblett, redan inläst flagga, okänd transaktion, saknat datum (två gånger), tom orsak, ogiltigt belopp
+    return pd.DataFrame([
+        ("BULKT1", "High amount", "2025-10-05", "100.5"),
+        ("BULKT2", "Ping-pong", "2025-10-05", "20"),
+        ("BULKT1", "High amount", "2025-10-05", "100.5"),
+        ("BULKT1", "High amount", "2025-10-06", "abc"),
+        ("BULKT0", "Structuring", "2025-10-05", "1"),
+        ("BULKT-SAKNAS", "High amount", "2025-10-05", "5"),
+        (" BULKT3 ", "", "", "inf"),
+        ("BULKT3", "unspecified", "", "7.25"),
+    ], columns=["transaction_id", "reason", "flagged_date", "amount"])
+
+
+def _cleanup(conn):
+    conn.execute(text("DELETE FROM bank.flagged_transactions WHERE transaction_id LIKE 'BULKT%'"))
+    conn.execute(text("DELETE FROM bank.transactions WHERE id LIKE 'BULKT%'"))
+    conn.execute(text("DELETE FROM bank.accounts WHERE account_number LIKE 'BULKACC%'"))
+    conn.execute(text("DELETE FROM bank.customers WHERE personnummer LIKE 'BULK-PNR%'"))
+
+
+def _snapshot(conn):
+    customers = conn.execute(text(
+        "SELECT customer, personnummer, address, phone FROM bank.customers"
+        " WHERE personnummer LIKE 'BULK-PNR%' ORDER BY id")).all()
+    accounts = conn.execute(text(
+        "SELECT a.account_number, c.personnummer, a.balance FROM bank.accounts a"
+        " JOIN bank.customers c ON c.id = a.customer_id WHERE a.account_number LIKE 'BULKACC%' ORDER BY a.id")).all()
+    return customers, accounts
+
+
+@pytest.mark.db
+@pytest.mark.integration
+def test_bulk_customers_match_rowwise(db_engine, ensure_db):
+    import import_customers as ic
+
+    ensure_schema()
+    df = _customers()
+    results = {}
+    try:
+        for bulk in (False, True):
+            with db_engine.begin() as conn:
+                _cleanup(conn)
+            ic.load_customers(df.tail(1), bulk=False)  # redan inläst kund med konto
+            summary = ic.load_customers(df, bulk=bulk)
+            with db_engine.begin() as conn:
+                results[bulk] = (summary, _snapshot(conn))
+    finally:
+        with db_engine.begin() as conn:
+            _cleanup(conn)
+
+    assert results[True] == results[False]
+    summary, (customers, accounts) = results[True]
+    assert summary == {"customers": (4, 2), "accounts": (3, 2, 0)}
+    assert [c.personnummer for c in customers] == ["BULK-PNR-0", "BULK-PNR-1", "BULK-PNR-2", "BULK-PNR-3", "BULK-PNR-4"]
+    assert customers[2].address is None and customers[2].phone is None
+
+
+def _tx_snapshot(conn):
+    return conn.execute(text("""
+        SELECT t.id, t.timestamp, t.amount, t.currency, t.notes, s.account_number, r.account_number,
+               t.sender_country, t.sender_municipality, t.receiver_country, t.transaction_type
+        FROM bank.transactions t
+        LEFT JOIN bank.accounts s ON s.id = t.sender_account_id
+        LEFT JOIN bank.accounts r ON r.id = t.receiver_account_id
+        WHERE t.id LIKE 'BULKT%' ORDER BY t.id""")).all()
+
+
+@pytest.mark.db
+@pytest.mark.integration
+@pytest.mark.parametrize("workers", [1, 3])
+def test_bulk_transactions_match_rowwise(db_engine, ensure_db, workers):
+    import import_customers as ic
+    import import_transactions as itx
+
+    ensure_schema()
+    df = _transactions()
+    results = {}
+    try:
+        with db_engine.begin() as conn:
+            _cleanup(conn)
+        ic.load_customers(_customers(), bulk=True)
+        for bulk in (False, True):
+            with db_engine.begin() as conn:
+                conn.execute(text("DELETE FROM bank.transactions WHERE id LIKE 'BULKT%'"))
+            itx.load_transactions(df[df["transaction_id"] == "BULKT0"], bulk=False)
+            summary = itx.load_transactions(df, bulk=bulk, workers=workers if bulk else 1)
+            with db_engine.begin() as conn:
+                results[bulk] = (summary, _tx_snapshot(conn))
+    finally:
+        with db_engine.begin() as conn:
+            _cleanup(conn)
+
+    assert results[True] == results[False]
+    summary, rows = results[True]
+    # Inlagda: T1, T2, T3, T4; överhoppade: T1-dubbletten och T0; okänt konto bland de överhoppade: T4-dubbletten
+    assert summary == {"transactions": (4, 2, 1)}
+    assert str(rows[4].timestamp) == "2025-01-06 00:00:00" and rows[4].amount == 0 and rows[4].currency == "GBP"
+
+
+def _flagged_snapshot(conn):
+    return conn.execute(text(
+        "SELECT transaction_id, reason, flagged_date, amount FROM bank.flagged_transactions"
+        " WHERE transaction_id LIKE 'BULKT%' ORDER BY transaction_id, reason, flagged_date")).all()
+
+
+@pytest.fixture
+def bulk_transactions(db_engine, ensure_db):
+    import import_customers as ic
+    import import_transactions as itx
+
+    ensure_schema()
+    with db_engine.begin() as conn:
+        _cleanup(conn)
+    ic.load_customers(_customers())
+    itx.load_transactions(_transactions())
+    yield
+    with db_engine.begin() as conn:
+        _cleanup(conn)
+
+
+@pytest.mark.db
+@pytest.mark.integration
+@pytest.mark.parametrize("workers", [1, 3])
+def test_bulk_flagged_matches_rowwise(db_engine, bulk_transactions, capsys, workers):
+    import import_flagged_transactions as ift
+
+    df = _flagged()
+    results = {}
+    for bulk in (False, True):
+        with db_engine.begin() as conn:
+            conn.execute(text("DELETE FROM bank.flagged_transactions WHERE transaction_id LIKE 'BULKT%'"))
+        ift.load_flagged(df[df["transaction_id"] == "BULKT0"], bulk=False)
+        summary = ift.load_flagged(df, bulk=bulk, batch_rows=3, workers=workers if bulk else 1)
+        with db_engine.begin() as conn:
+            skipped = [line for line in capsys.readouterr().out.splitlines() if line.startswith("❗")]
+            results[bulk] = (summary, _flagged_snapshot(conn), skipped)
+
+    assert results[True] == results[False]
+    summary, rows, skipped = results[True]
+    assert summary == {"flagged": (4, 3, 1), "failed_rows": 0, "errors": []}
+    assert skipped == ["❗ Hoppar över: Transaktion ID BULKT-SAKNAS finns inte i databasen."]
+    assert rows[-1].flagged_date is None and rows[-1].amount is None
+
+
+@pytest.mark.db
+@pytest.mark.integration
+def test_bulk_flagged_failed_batch_does_not_stop_others(db_engine, bulk_transactions):
+    import import_flagged_transactions as ift
+
+    # Beloppet får inte plats i NUMERIC(18,2) => första batchen (två rader) misslyckas
+    df = pd.DataFrame({"transaction_id": ["BULKT1", "BULKT3", "BULKT2"], "reason": "r",
+                       "flagged_date": "2025-10-05", "amount": ["1", "1e20", "1"]})
+    s = ift.load_flagged(df, batch_rows=2)
+    assert s["flagged"] == (1, 0, 0) and s["failed_rows"] == 2 and len(s["errors"]) == 1
+    with db_engine.begin() as conn:
+        assert [r.transaction_id for r in _flagged_snapshot(conn)] == ["BULKT2"]
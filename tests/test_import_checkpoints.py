@@ -0,0 +1,155 @@
+import pytest
+from sqlalchemy import text
+
+from import_checkpoints import Checkpoint, load_in_batches
+from init_schema import ensure_schema
+from test_import_bulk import _cleanup, _customers, _transactions, _tx_snapshot
+
+
+@pytest.fixture
+def tx_file(tmp_path, db_engine, ensure_db):
+    import import_customers as ic
+
+    ensure_schema()
+    with db_engine.begin() as conn:
+        _cleanup(conn)
+    ic.load_customers(_customers())
+    path = tmp_path / "transactions_clean.csv"
+    _transactions().to_csv(path, index=False)
+    yield path
+    with db_engine.begin() as conn:
+        _cleanup(conn)
+
+
+def _rows_done(db_engine, path):
+    with db_engine.connect() as conn:
+        return Checkpoint(path).rows_done(conn)
+
+
+def _fail_on_second_batch(monkeypatch, itx):
+    """Låter andra anropet av _insert_stage fallera; returnerar originalet."""
+    calls = []
+    insert_stage = itx._insert_stage
+
+    def failing(stage, conn):
+        calls.append(len(stage))
+        if len(calls) == 2:
+            raise RuntimeError("avbruten")
+        return insert_stage(stage, conn)
+
+    monkeypatch.setattr(itx, "_insert_stage", failing)
+    return insert_stage
+
+
+@pytest.mark.db
+@pytest.mark.integration
+def test_interrupted_import_resumes_from_last_batch(tx_file, db_engine, monkeypatch, capsys):
+    import import_transactions as itx
+    from clean_io import read_clean
+
+    # Facit: samma fil i ett svep
+    itx.load_transactions(read_clean(tx_file))
+    with db_engine.begin() as conn:
+        expected = _tx_snapshot(conn)
+        conn.execute(text("DELETE FROM bank.transactions WHERE id LIKE 'BULKT%'"))
+
+    # Andra batchen fallerar: första batchen är committad och checkpointad
+    insert_stage = _fail_on_second_batch(monkeypatch, itx)
+    with pytest.raises(RuntimeError):
+        itx.load_transactions(read_clean(tx_file), batch_rows=2, source=tx_file)
+    assert _rows_done(db_engine, tx_file) == 2
+    with db_engine.connect() as conn:
+        assert [r.id for r in _tx_snapshot(conn)] == ["BULKT1", "BULKT2"]
+
+    # Ny körning fortsätter på rad 2 och räknar bara resten
+    monkeypatch.setattr(itx, "_insert_stage", insert_stage)
+    capsys.readouterr()
+    s = itx.load_transactions(read_clean(tx_file), batch_rows=2, source=tx_file)
+    out = capsys.readouterr().out
+    assert "från rad 2 av 7" in out and "rader/s" in out
+    assert s == {"transactions": (3, 1, 1)}
+    assert _rows_done(db_engine, tx_file) == 0  # klar => checkpointen borttagen
+    with db_engine.connect() as conn:
+        assert _tx_snapshot(conn) == expected
+
+
+@pytest.mark.db
+@pytest.mark.integration
+def test_interrupted_skip_known_import_resumes_on_file_rows(tx_file, db_engine, monkeypatch, capsys):
+    import import_transactions as itx
+    from clean_io import read_clean
+
+    itx.load_transactions(read_clean(tx_file))
+    with db_engine.begin() as conn:
+        expected = _tx_snapshot(conn)
+        conn.execute(text("DELETE FROM bank.transactions WHERE id LIKE 'BULKT%'"))
+
+    insert_stage = _fail_on_second_batch(monkeypatch, itx)
+    with pytest.raises(RuntimeError):
+        itx.load_transactions(read_clean(tx_file), batch_rows=2, source=tx_file, skip_known=True)
+    assert _rows_done(db_engine, tx_file) == 2
+
+    # BULKT1 och BULKT2 är nu kända: checkpointen gäller ändå filens rader, inte de som skickas
+    monkeypatch.setattr(itx, "_insert_stage", insert_stage)
+    capsys.readouterr()
+    s = itx.load_transactions(read_clean(tx_file), batch_rows=2, source=tx_file, skip_known=True)
+    assert "från rad 2 av 7" in capsys.readouterr().out
+    assert s == {"transactions": (3, 1, 1)}
+    assert _rows_done(db_engine, tx_file) == 0
+    with db_engine.connect() as conn:
+        assert _tx_snapshot(conn) == expected
+
+
+@pytest.mark.db
+@pytest.mark.integration
+def test_parallel_batches_share_one_worker_pool(tx_file, db_engine, monkeypatch):
+    import import_transactions as itx
+    import import_workers
+    from clean_io import read_clean
+
+    created = []
+    worker_engine = import_workers.worker_engine
+
+    def counting(workers):
+        created.append(workers)
+        return worker_engine(workers)
+
+    monkeypatch.setattr(import_workers, "worker_engine", counting)
+    s = itx.load_transactions(read_clean(tx_file), workers=3, batch_rows=2, source=tx_file)
+    assert s == {"transactions": (5, 1, 1)}
+    assert created == [3]  # en pool för fyra batchar
+
+
+@pytest.mark.db
+@pytest.mark.integration
+def test_changed_file_starts_over(tx_file, db_engine):
+    with db_engine.begin() as conn:
+        Checkpoint(tx_file).save(conn, 5, 7)
+    old = Checkpoint(tx_file)
+    tx_file.write_text(tx_file.read_text(encoding="utf-8") + "BULKT9,2025-01-07 09:00:00,3,SEK,,,,,,outgoing\n",
+                       encoding="utf-8")
+    try:
+        assert Checkpoint(tx_file).file_hash != old.file_hash
+        assert _rows_done(db_engine, tx_file) == 0
+    finally:
+        with db_engine.begin() as conn:
+            old.clear(conn)
+
+
+def test_checkpoint_requires_unfiltered_file_order(tmp_path):
+    # En offset i en filtrerad frame pekar på fel rad när filtret ändras mellan körningarna
+    path = tmp_path / "transactions_clean.csv"
+    _transactions().to_csv(path, index=False)
+    stage = _transactions().assign(ord=range(7))
+    with pytest.raises(ValueError, match="filens ordning"):
+        load_in_batches(stage.iloc[[0, 2, 3]], lambda batch, conn: {}, batch_rows=2, source=path)
+
+
+def test_loaders_default_to_one_transaction():
+    # Fused flow anropar laddarna med standardvärden: samma commit-beteende för alla tre
+    import inspect
+    import import_customers, import_flagged_transactions, import_transactions
+
+    loaders = (import_customers.load_customers, import_transactions.load_transactions,
+               import_flagged_transactions.load_flagged)
+    assert [inspect.signature(f).parameters["batch_rows"].default for f in loaders] == [None] * 3
@@ -0,0 +1,88 @@
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+import import_watermarks
+from init_schema import ensure_schema
+from test_import_bulk import _cleanup, _customers, _transactions, _tx_snapshot
+
+
+def _more():
+    # Nya rader efter förra körningen: en ny, en okänd mottagare och en dubblett av en gammal
+    df = _transactions().iloc[:3].copy()
+    df["transaction_id"] = ["BULKT7", "BULKT8", "BULKT2"]
+    df["receiver_account"] = ["BULKACC2", "BULKACC-SAKNAS", "BULKACC1"]
+    return df
+
+
+@pytest.fixture
+def load(tmp_path, db_engine, ensure_db, monkeypatch):
+    import import_customers as ic
+    import import_transactions as itx
+    from clean_io import read_clean
+
+    monkeypatch.setattr(import_watermarks, "RANGE_ROWS", 3)
+    path = tmp_path / "transactions_clean.csv"
+    ensure_schema()
+
+    def reset():
+        with db_engine.begin() as conn:
+            _cleanup(conn)
+            conn.execute(text("DELETE FROM bank.import_watermarks WHERE source LIKE :p"), {"p": f"{tmp_path}%"})
+        ic.load_customers(_customers())
+
+    def run(df, **kw):
+        df.to_csv(path, index=False)
+        return itx.load_transactions(read_clean(path), source=path, **kw)
+
+    reset()
+    yield reset, run
+    reset()
+
+
+@pytest.mark.db
+@pytest.mark.integration
+def test_incremental_sends_only_new_blocks_with_same_summary(load, db_engine, capsys):
+    reset, run = load
+    first, second = _transactions(), pd.concat([_transactions(), _more()], ignore_index=True)
+
+    run(first)
+    full = run(second)
+    with db_engine.connect() as conn:
+        expected = _tx_snapshot(conn)
+
+    reset()
+    run(first, incremental=True)
+    capsys.readouterr()
+    inc = run(second, incremental=True)
+    # Rad 0-6 är oförändrade (sista blocket var en rad); bara de nya raderna skickas
+    assert "Skickas inte: 7 rader i oförändrade block" in capsys.readouterr().out
+    assert inc == full
+    with db_engine.connect() as conn:
+        assert _tx_snapshot(conn) == expected
+
+
+@pytest.mark.db
+@pytest.mark.integration
+def test_changed_block_is_sent_again(load, capsys):
+    reset, run = load
+    run(_transactions(), incremental=True)
+    changed = _transactions()
+    changed.loc[4, "notes"] = "ändrad"
+    capsys.readouterr()
+    s = run(changed, incremental=True)
+    # Block 3-5 skickas om, block 0-2 och rad 6 inte
+    assert "Skickas inte: 4 rader i oförändrade block" in capsys.readouterr().out
+    assert s == {"transactions": (0, 5, 2)}
+
+
+@pytest.mark.db
+@pytest.mark.integration
+def test_skip_known_ids_gives_same_summary(load, capsys):
+    reset, run = load
+    run(_transactions())
+    full = run(_transactions())
+    capsys.readouterr()
+    filtered = run(_transactions(), skip_known=True)
+    assert "7 med kända id:n" in capsys.readouterr().out
+    assert filtered == full == {"transactions": (0, 5, 2)}
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from keyword_matcher import compile_matcher, keyword_regex
+from risk_rules import RiskConfig, score_and_flag
+from test_risk_rules_equivalence import _random_tx
+
+
+def _watchlist_and_notes(seed=5, n_terms=2000, n_notes=3000):
+    rng = np.random.default_rng(seed)
+    alphabet = list("abcdeé _-ÅÄÖ")
+    words = ["".join(rng.choice(alphabet, size=rng.integers(2, 7))).strip() for _ in range(n_terms)]
+    notes = ["".join(rng.choice(alphabet, size=rng.integers(0, 40))) for _ in range(n_notes)]
+    return [w for w in words if w], pd.Series(notes)
+
+
+@pytest.mark.parametrize("whole_word", [False, True])
+@pytest.mark.parametrize("case_fold", [False, True])
+def test_matches_alternation_regex(whole_word, case_fold):
+    words, notes = _watchlist_and_notes()
+    ac = compile_matcher(words, case_fold=case_fold, whole_word=whole_word).contains(notes)
+    rx = notes.str.contains(keyword_regex(words, case_fold=case_fold, whole_word=whole_word), na=False)
+    pd.testing.assert_series_equal(ac, rx, check_names=False)
+
+
+def test_reports_which_keyword_hit():
+    m = compile_matcher(["crypto", "urgent", "he", "she", "hers"], whole_word=True)
+    assert m.search("URGENT: pay now") == "urgent"
+    assert m.search("cryptocurrency") is None
+    assert m.search("so she said") == "she"
+    assert compile_matcher(["he", "she", "hers"]).find_all("ushers") == ["she", "he", "hers"]
+    hits = m.search_series(pd.Series(["crypto!", "", None, "rent"]))
+    assert hits.tolist() == ["crypto", None, None, None]
+
+
+def test_compiled_once_per_keyword_set():
+    assert compile_matcher(["a", "b"]) is compile_matcher(("a", "b"))
+    assert compile_matcher(["a", "b"]) is not compile_matcher(["a", "b"], whole_word=True)
+
+
+def test_selectable_from_config():
+    df = _random_tx(n=1000, seed=41)
+    base = dict(high_amount_p=0.8, require_high_for_keyword=False)
+    pd.testing.assert_frame_equal(
+        score_and_flag(df, RiskConfig(keyword_matcher="aho_corasick", **base)),
+        score_and_flag(df, RiskConfig(**base)),
+    )
+    with pytest.raises(ValueError):
+        score_and_flag(df, RiskConfig(keyword_matcher="nope", **base))
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from quantile_sketch import KLLSketch, CurrencySketches, compare_with_exact
+from risk_rules import RiskConfig, score_and_flag
+from test_risk_rules_equivalence import _random_tx
+
+
+def _amounts(n, seed=0):
+    return np.random.default_rng(seed).lognormal(mean=6, sigma=1.5, size=n)
+
+
+@pytest.mark.parametrize("q", [0.5, 0.9, 0.98, 0.999])
+def test_sketch_rank_error_is_bounded(q):
+    values = _amounts(200_000)
+    sk = KLLSketch.for_rank_error(0.002, seed=1).update(values)
+    rank = np.searchsorted(np.sort(values), sk.quantile(q), side="right") / len(values)
+    assert abs(rank - q) <= 0.002
+    assert sum(len(b) for b in sk.levels) < 10_000
+
+
+def test_merged_chunks_match_single_pass_within_error():
+    values = _amounts(100_000, seed=2)
+    merged = KLLSketch.for_rank_error(0.002, seed=3)
+    for chunk in np.array_split(values, 7):
+        merged.merge(KLLSketch.for_rank_error(0.002, seed=4).update(chunk))
+    assert merged.n == len(values)
+    rank = np.searchsorted(np.sort(values), merged.quantile(0.98), side="right") / len(values)
+    assert abs(rank - 0.98) <= 0.002
+
+
+def test_currency_sketches_merge_per_currency():
+    # Chunkar med olika valutablandning (EUR saknas i vissa) slås ihop valuta för valuta
+    rng = np.random.default_rng(7)
+    df = pd.DataFrame({"currency": rng.choice(["SEK", "EUR", "USD"], size=60_000, p=[0.6, 0.3, 0.1]),
+                       "amount": _amounts(60_000, seed=8)})
+    df.loc[df.index[:20_000][df["currency"].iloc[:20_000] == "EUR"], "currency"] = "SEK"
+    merged = CurrencySketches(rank_error=0.002, seed=9)
+    for lo in range(0, len(df), 12_000):
+        merged.merge(CurrencySketches(rank_error=0.002, seed=10).update(df.iloc[lo:lo + 12_000]))
+    assert {cur: sk.n for cur, sk in merged.sketches.items()} == df["currency"].value_counts().to_dict()
+    thr = merged.thresholds(0.98)
+    for cur, amounts in df.groupby("currency")["amount"]:
+        rank = np.searchsorted(np.sort(amounts.to_numpy()), thr[cur], side="right") / len(amounts)
+        assert abs(rank - 0.98) <= 0.002
+
+
+def test_compare_with_exact_reports_per_currency():
+    df = pd.DataFrame({"currency": np.repeat(["SEK", "EUR"], 20_000), "amount": _amounts(40_000, seed=5)})
+    res = compare_with_exact(df, ps=(0.9, 0.98), rank_error=0.002, chunksize=6_000, seed=6)
+    assert set(res["currency"]) == {"SEK", "EUR"}
+    assert (res["rank_error"] <= 0.002).all()
+
+
+def test_score_and_flag_with_sketch_thresholds():
+    df = _random_tx(n=3000, seed=8)
+    exact = score_and_flag(df, RiskConfig(high_amount_p=0.9))
+    approx = score_and_flag(df, RiskConfig(high_amount_p=0.9, threshold_method="sketch", sketch_rank_error=0.0005))
+    high = lambda f: set(f.loc[f["reason"].str.contains("High amount"), "transaction_id"])
+    assert high(approx) == high(exact)
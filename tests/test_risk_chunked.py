@@ -0,0 +1,60 @@
+import pandas as pd
+import pytest
+
+from risk_rules import RiskConfig, score_and_flag
+from risk_chunked import score_and_flag_chunked, parse_memory
+from test_risk_rules_equivalence import _random_tx
+
+
+def _pairs(flagged):
+    return set(zip(flagged["transaction_id"], flagged["reason"]))
+
+
+def test_parse_memory():
+    assert parse_memory("2G") == 2 * 1024 ** 3
+    assert parse_memory("512m") == 512 * 1024 ** 2
+    assert parse_memory("1.5GB") == int(1.5 * 1024 ** 3)
+    with pytest.raises(ValueError):
+        parse_memory("mycket")
+
+
+@pytest.mark.parametrize("assume_sorted,dense", [(False, False), (True, False), (False, True)])
+def test_chunked_matches_in_memory(tmp_path, assume_sorted, dense):
+    df = _random_tx(n=3000, seed=31)
+    if dense:
+        # Alla rader inom två dygn => dagshinkarna ryms inte och delas per timme
+        ts = pd.to_datetime(df["timestamp"], utc=True)
+        df["timestamp"] = (ts.min() + (ts - ts.min()) / 15).astype(str)
+    if assume_sorted:
+        df = df.sort_values("timestamp", kind="stable")
+    in_csv = tmp_path / "transactions_clean.csv"
+    df.to_csv(in_csv, index=False)
+
+    cfg = RiskConfig(velocity_min_tx=8, velocity_window_hours=48, high_amount_p=0.9, sketch_rank_error=0.0005)
+    expected = score_and_flag(df, RiskConfig(velocity_min_tx=8, velocity_window_hours=48, high_amount_p=0.9))
+
+    out_csv = tmp_path / "flagged.csv"
+    n = score_and_flag_chunked(in_csv, out_csv, cfg, max_memory="1M", assume_sorted=assume_sorted, tmp_dir=tmp_path)
+    got = pd.read_csv(out_csv, dtype=str, keep_default_na=False)
+
+    assert n == len(got)
+    assert _pairs(got) == _pairs(expected)
+    assert not any(p.name.startswith("spbank_spill_") for p in tmp_path.iterdir())
+
+
+def test_bucket_larger_than_budget_at_finest_level_is_time_ordered(tmp_path):
+    # Alla rader inom samma minut i slumpad filordning: minuthinken ryms inte och sorteras externt
+    df = _random_tx(n=4000, seed=32)
+    ts = pd.to_datetime(df["timestamp"], utc=True)
+    df["timestamp"] = (ts.min() + (ts - ts.min()) / (60 * 24 * 30)).dt.floor("s").astype(str)  # många lika tider
+    df = df.sample(frac=1, random_state=33)
+    in_csv = tmp_path / "transactions_clean.csv"
+    df.to_csv(in_csv, index=False)
+
+    cfg = RiskConfig(velocity_min_tx=8, velocity_window_hours=1, high_amount_p=0.9, sketch_rank_error=0.0005)
+    expected = score_and_flag(df, RiskConfig(velocity_min_tx=8, velocity_window_hours=1, high_amount_p=0.9))
+
+    out_csv = tmp_path / "flagged.csv"
+    score_and_flag_chunked(in_csv, out_csv, cfg, max_memory="1M", tmp_dir=tmp_path)
+    got = pd.read_csv(out_csv, dtype=str, keep_default_na=False)
+    assert _pairs(got) == _pairs(expected)
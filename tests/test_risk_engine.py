@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from risk_rules import RiskConfig, score_and_flag
+from risk_engine import RiskEngine
+from test_risk_rules_equivalence import _random_tx
+
+
+def _pairs(flagged):
+    return set(zip(flagged["transaction_id"], flagged["reason"]))
+
+
+@pytest.fixture
+def history():
+    df = _random_tx(n=3000, seed=11)
+    ts = pd.to_datetime(df["timestamp"], utc=True)
+    return df.iloc[np.argsort(ts.to_numpy(), kind="stable")].reset_index(drop=True)
+
+
+def _split_by_time(df, parts):
+    ts = pd.to_datetime(df["timestamp"], utc=True)
+    cuts = ts.quantile(np.linspace(0, 1, parts + 1)[1:-1]).to_list()
+    edges = [ts.min() - pd.Timedelta(1, "s")] + cuts + [ts.max()]
+    return [df[(ts > lo) & (ts <= hi)] for lo, hi in zip(edges[:-1], edges[1:])]
+
+
+def test_incremental_batches_match_full_rescan(history):
+    cfg = RiskConfig(velocity_min_tx=8, velocity_window_hours=48, pingpong_days=3, high_amount_p=0.9)
+    full = score_and_flag(history, cfg)
+
+    engine = RiskEngine(cfg)
+    engine.fit_thresholds(history)
+    got = set()
+    for batch in _split_by_time(history, 4):
+        got |= _pairs(engine.update(batch))
+
+    assert got == _pairs(full)
+
+
+def test_state_survives_save_and_load(history, tmp_path):
+    cfg = RiskConfig(velocity_min_tx=8, velocity_window_hours=48, high_amount_p=0.9)
+    first, second = _split_by_time(history, 2)
+
+    engine = RiskEngine(cfg)
+    engine.fit_thresholds(history)
+    engine.update(first)
+    engine.save(tmp_path / "engine.pkl")
+
+    restored = RiskEngine.load(tmp_path / "engine.pkl")
+    assert _pairs(restored.update(second)) == _pairs(engine.update(second))
+
+
+def _pingpong_batch(day, n_pairs=10):
+    # Nya konton varje dag, varje par skickar fram och tillbaka två gånger
+    t0 = pd.Timestamp("2025-01-01", tz="UTC") + pd.Timedelta(days=day)
+    rows = []
+    for p in range(n_pairs):
+        a, b = f"D{day}A{p}", f"D{day}B{p}"
+        for k, (src, dst) in enumerate([(a, b), (b, a), (a, b), (b, a)]):
+            rows.append((f"PP{day}-{p}-{k}", str(t0 + pd.Timedelta(hours=k)), 100.0, src, dst))
+    df = pd.DataFrame(rows, columns=["transaction_id", "timestamp", "amount", "from_account", "to_account"])
+    return df.assign(currency="SEK", sender_country="Sweden", receiver_country="Sweden", notes="")
+
+
+def test_pair_state_stays_bounded_with_pingpong_hits():
+    cfg = RiskConfig(pingpong_days=3, pingpong_min_pairs=2, new_counterparty_days=3)
+    engine = RiskEngine(cfg)
+    sizes, flagged = [], 0
+    for day in range(60):
+        out = engine.update(_pingpong_batch(day))
+        flagged += out["reason"].str.contains("Ping-pong").sum()
+        sizes.append(len(engine.pairs))
+    assert flagged > 0
+    # Bara paren inom fönstret (4 dagar à 20 riktade par) finns kvar, oavsett antal batcher
+    assert max(sizes) <= 4 * 20
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import risk_kernels as rk
+import risk_rules as rr
+from test_risk_rules_equivalence import _random_tx
+
+
+def _random_groups(n=20000, groups=300, seed=61):
+    rng = np.random.default_rng(seed)
+    codes = rng.integers(0, groups, size=n)
+    ts = rng.integers(0, 10 ** 6, size=n) * 1_000_000_000  # många lika tider
+    return rk.sorted_groups(codes, ts)
+
+
+@pytest.mark.parametrize("jit", [False, pytest.param(True, marks=pytest.mark.skipif(not rk.HAVE_JIT, reason="Numba saknas"))])
+def test_kernels_match_reference_loops(jit):
+    _, ts, offsets = _random_groups()
+    window, gap = 3600 * 10 ** 9, 7200 * 10 ** 9
+    exp_cnt = np.empty(len(ts), dtype=np.int64)
+    exp_new = np.empty(len(ts), dtype=bool)
+    for g in range(len(offsets) - 1):
+        lo, hi = offsets[g], offsets[g + 1]
+        for i in range(lo, hi):
+            exp_cnt[i] = i + 1 - np.searchsorted(ts[lo:i + 1], ts[i] - window, side="right") - lo
+            exp_new[i] = i == lo or ts[i] - ts[i - 1] >= gap
+    np.testing.assert_array_equal(rk.window_counts(ts, offsets, window, jit=jit), exp_cnt)
+    np.testing.assert_array_equal(rk.gap_starts(ts, offsets, gap, jit=jit), exp_new)
+
+
+def _new_counterparty_shift(df, days):
+    # Tidigare implementation (sortering + groupby().shift) som facit
+    d = df[["from_account", "to_account", "timestamp"]].sort_values("timestamp", kind="stable")
+    d["timestamp_prev"] = d.groupby(["from_account", "to_account"])["timestamp"].shift(1)
+    d = d.reindex(df.index)
+    gap_days = (d["timestamp"] - d["timestamp_prev"]).dt.total_seconds() / 86400.0
+    return (d["timestamp_prev"].isna() | (gap_days >= float(days)).fillna(False)).fillna(False)
+
+
+@pytest.mark.parametrize("days", [1, 3, 14])
+def test_new_counterparty_matches_shift_reference(days):
+    df = _random_tx(n=3000, seed=62)
+    df.loc[df.index[::41], "to_account"] = np.nan
+    df = rr._ensure_numeric_amount(rr._normalize_columns(df))
+    df.loc[df.index[::67], "timestamp"] = pd.NaT
+    pd.testing.assert_series_equal(
+        rr._rule_new_counterparty(df, days, False, None),
+        _new_counterparty_shift(df, days),
+        check_names=False,
+    )
+
+
+@pytest.mark.parametrize("jit", [False, pytest.param(True, marks=pytest.mark.skipif(not rk.HAVE_JIT, reason="Numba saknas"))])
+def test_new_counterparty_with_several_nat_rows_per_pair(jit, monkeypatch):
+    monkeypatch.setattr(rk, "HAVE_JIT", jit)
+    t0 = pd.Timestamp("2025-01-01", tz="UTC")
+    df = pd.DataFrame({
+        "from_account": ["a", "a", "a", "a", "c", "c", "c"],
+        "to_account": ["b", "b", "b", "b", "d", "d", "d"],
+        "timestamp": [t0, t0 + pd.Timedelta(hours=1), pd.NaT, pd.NaT, pd.NaT, pd.NaT, pd.NaT],
+    })
+    got = rr._rule_new_counterparty(df, 7, False, None)
+    # Första tid-lösa raden har en giltig föregångare (a->b) eller ingen alls (c->d)
+    assert got.tolist() == [True, False, False, True, True, True, True]
+    pd.testing.assert_series_equal(got, _new_counterparty_shift(df, 7), check_names=False)
+
+    # Få konton och många rader utan tid => flera per par
+    rnd = rr._ensure_numeric_amount(rr._normalize_columns(_random_tx(n=2000, seed=63)))
+    rnd.loc[rnd.index[::3], "timestamp"] = pd.NaT
+    rnd.loc[rnd.index[::97], "from_account"] = np.nan
+    pd.testing.assert_series_equal(
+        rr._rule_new_counterparty(rnd, 3, False, None),
+        _new_counterparty_shift(rnd, 3),
+        check_names=False,
+    )
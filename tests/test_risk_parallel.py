@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from risk_rules import RiskConfig, score_and_flag
+from risk_parallel import score_and_flag_parallel
+from test_risk_rules_equivalence import _random_tx
+
+
+@pytest.mark.parametrize("min_pairs", [1, 2])
+def test_parallel_matches_serial(min_pairs):
+    df = _random_tx(n=3000, seed=21)
+    df.loc[df.index[::97], "to_account"] = np.nan  # rader utan motpart ska bete sig likadant
+    cfg = RiskConfig(velocity_min_tx=8, velocity_window_hours=48, pingpong_min_pairs=min_pairs,
+                     high_amount_p=0.9, include_reason_mask=True)
+    serial = score_and_flag(df, cfg)
+    parallel = score_and_flag_parallel(df, cfg, workers=2, shards=5)
+    pd.testing.assert_frame_equal(serial, parallel)
+
+
+def test_workers_in_config_dispatches_to_parallel():
+    df = _random_tx(n=500, seed=22)
+    serial = score_and_flag(df, RiskConfig(high_amount_p=0.9))
+    parallel = score_and_flag(df, RiskConfig(high_amount_p=0.9, workers=2))
+    pd.testing.assert_frame_equal(serial, parallel)
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import risk_rules as rr
+from test_risk_rules_equivalence import _random_tx
+
+
+def _eager_masks(df, cfg):
+    # Gamla flödet: alla regler på alla rader, kombinationslogik i efterhand
+    m_high = rr._rule_high_amount(df, cfg.high_amount_p)
+    m_struct = rr._rule_structuring(df, cfg.structuring_by_currency)
+    m_xborder = rr._rule_crossborder_high(df, cfg.crossborder_p) & m_high & ~m_struct
+    m_keyword = rr._rule_keyword(df, cfg.keyword_list) & m_high
+    return {
+        "high_amount": m_high,
+        "structuring": m_struct,
+        "crossborder": m_xborder,
+        "keyword": m_keyword,
+        "velocity": rr._rule_velocity(df, cfg.velocity_window_hours, cfg.velocity_min_tx),
+        "pingpong": rr._rule_pingpong(df, cfg.pingpong_days, cfg.pingpong_min_pairs),
+        "new_counterparty": rr._rule_new_counterparty(df, cfg.new_counterparty_days, True, m_high),
+    }
+
+
+def test_lazy_registry_matches_eager_evaluation():
+    cfg = rr.RiskConfig(high_amount_p=0.9, velocity_min_tx=8, velocity_window_hours=48)
+    df = rr._prepare(_random_tx(n=3000, seed=31), cfg)
+    stats = rr.RuleStats()
+    lazy = rr._evaluate_rules(df, cfg, rr._rule_context(df, cfg), stats=stats)
+    for name, expected in _eager_masks(df, cfg).items():
+        np.testing.assert_array_equal(lazy[name], expected.to_numpy(dtype=bool), err_msg=name)
+
+    # keyword körs bara där high_amount träffat; ny motpart på paren som har sådana rader
+    high = int(lazy["high_amount"].sum())
+    assert stats.rules["keyword"].rows == high
+    assert high <= stats.rules["new_counterparty"].rows < len(df)
+    assert stats.rules["velocity"].rows == len(df)
+    assert all(stats.rules[name].hits == int(m.sum()) for name, m in lazy.items())
+
+
+def test_return_stats_keeps_flagged_frame():
+    df = _random_tx(n=500, seed=32)
+    cfg = rr.RiskConfig(high_amount_p=0.9)
+    flagged, stats = rr.score_and_flag(df, cfg, return_stats=True)
+    pd.testing.assert_frame_equal(flagged, rr.score_and_flag(df, cfg))
+    frame = stats.to_frame()
+    assert set(rr.RULES) <= set(frame["rule"])
+    assert "thresholds" in stats.stages
+    assert stats.total_seconds > 0
+
+
+def test_custom_rule_is_pluggable():
+    rule = rr.Rule(
+        "round_amount", 1 << 10,
+        lambda df, cfg, ctx: df["amount"].to_numpy() % 1000 == 0,
+        reason=lambda cfg, cur: "Round amount",
+        requires=("high_amount",),
+        precondition=lambda cfg, m: m["high_amount"],
+    )
+    rr.register_rule(rule)
+    try:
+        with pytest.raises(ValueError):
+            rr.register_rule(rule)
+        df = pd.DataFrame({
+            "transaction_id": ["A", "B", "C"],
+            "amount": [5000.0, 10.0, 10.0],
+            "currency": ["SEK"] * 3,
+        })
+        flagged, stats = rr.score_and_flag(df, rr.RiskConfig(high_amount_p=0.9), return_stats=True)
+        assert flagged.loc[flagged["transaction_id"] == "A", "reason"].str.contains("Round amount").all()
+        assert stats.rules["round_amount"].rows == 1
+    finally:
+        rr.unregister_rule("round_amount")
+    assert "round_amount" not in rr.RULES
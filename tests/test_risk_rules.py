@@ -75,4 +75,54 @@ def test_new_counterparty_plus_high_amount():
     cfg = RiskConfig(new_counterparty_days=14, require_high_for_new_counterparty=True, high_amount_p=0.5, crossborder_p=0.99)
     flagged = score_and_flag(df, cfg)
     assert "N1" in set(flagged["transaction_id"])
-    assert any("New counterparty" in r for r in flagged["reason"].unique())
\ No newline at end of file
+    assert any("New counterparty" in r for r in flagged["reason"].unique())
+
+
+def test_velocity_flags_only_the_row_that_reaches_the_limit():
+    now = pd.Timestamp("2025-01-01", tz="UTC")
+    rows = [{
+        "transaction_id": f"V{i}",
+        "timestamp": (now + pd.Timedelta(minutes=i)).isoformat(),
+        "amount": 1.0, "currency": "SEK", "from_account": "X", "to_account": "Y",
+        "sender_country": "SE", "receiver_country": "SE", "notes": "",
+    } for i in range(20)]
+    # Samma tidsstämpel som V19: bara den senare raden når 21 tx i fönstret
+    rows.append({**rows[-1], "transaction_id": "V20"})
+    df = pd.DataFrame(rows)
+    cfg = RiskConfig(velocity_min_tx=21, high_amount_p=1.0, crossborder_p=1.0,
+                     require_high_for_new_counterparty=True)
+    flagged = score_and_flag(df, cfg)
+    velocity = flagged[flagged["reason"].str.contains("High velocity")]
+    assert set(velocity["transaction_id"]) == {"V20"}
+
+def test_reason_mask_matches_reason_text():
+    from risk_rules import REASON_STRUCTURING, REASON_PINGPONG
+    now = pd.Timestamp("2025-01-01", tz="UTC")
+    df = pd.DataFrame([
+        {"transaction_id":"R1","timestamp": now.isoformat(), "amount":9600,"currency":"SEK","from_account":"A","to_account":"B","sender_country":"SE","receiver_country":"SE","notes":""},
+        {"transaction_id":"R2","timestamp": (now + pd.Timedelta(days=1)).isoformat(), "amount":10,"currency":"SEK","from_account":"B","to_account":"A","sender_country":"SE","receiver_country":"SE","notes":""},
+        {"transaction_id":"R3","timestamp": (now + pd.Timedelta(days=2)).isoformat(), "amount":100000,"currency":"SEK","from_account":"C","to_account":"D","sender_country":"SE","receiver_country":"SE","notes":""},
+    ])
+    cfg = RiskConfig(include_reason_mask=True, high_amount_p=1.0, crossborder_p=1.0,
+                     structuring_by_currency={"SEK": (9500, 9999.99)})
+    flagged = score_and_flag(df, cfg).set_index("transaction_id")
+    assert list(flagged.columns) == ["reason", "flagged_date", "amount", "reason_mask"]
+    assert flagged.loc["R1", "reason_mask"] == REASON_STRUCTURING
+    assert flagged.loc["R1", "reason"] == "Structuring band 9500–9999.99 SEK"
+    assert flagged.loc["R2", "reason_mask"] == REASON_PINGPONG
+    assert "reason_mask" not in score_and_flag(df, RiskConfig(high_amount_p=1.0)).columns
+
+def test_cap_per_reason_keeps_largest_amounts():
+    now = pd.Timestamp("2025-01-01", tz="UTC")
+    df = pd.DataFrame([{
+        "transaction_id": f"S{i}", "timestamp": (now + pd.Timedelta(days=i)).isoformat(),
+        "amount": 9500 + i, "currency": "SEK", "from_account": f"A{i}", "to_account": f"B{i}",
+        "sender_country": "SE", "receiver_country": "SE", "notes": "",
+    } for i in range(10)] + [{
+        "transaction_id": "BIG", "timestamp": now.isoformat(), "amount": 100000, "currency": "SEK",
+        "from_account": "C", "to_account": "D", "sender_country": "SE", "receiver_country": "SE", "notes": "",
+    }])
+    cfg = RiskConfig(cap_per_reason=3, high_amount_p=1.0, crossborder_p=1.0,
+                     structuring_by_currency={"SEK": (9500, 9999.99)})
+    flagged = score_and_flag(df, cfg)
+    assert list(flagged["transaction_id"]) == ["BIG", "S9", "S8", "S7"]
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import risk_rules as rr
+
+
+def _random_tx(n=2000, seed=7):
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp("2025-01-01", tz="UTC")
+    accounts = [f"ACC{i}" for i in range(40)]
+    currencies = ["SEK", "EUR", "USD", "GBP", "NOK"]
+    countries = ["Sweden", "Norway", "Denmark"]
+    amount = rng.lognormal(mean=6, sigma=1.5, size=n).round(2)
+    # Lägg in belopp i structuring-banden
+    amount[::25] = 9600.0
+    amount[1::25] = 975.0
+    return pd.DataFrame({
+        "transaction_id": [f"T{i}" for i in range(n)],
+        "timestamp": (start + pd.to_timedelta(rng.integers(0, 60 * 24 * 30, size=n), unit="min")).astype(str),
+        "amount": amount,
+        "currency": rng.choice(currencies, size=n),
+        "from_account": rng.choice(accounts, size=n),
+        "to_account": rng.choice(accounts, size=n),
+        "sender_country": rng.choice(countries, size=n),
+        "receiver_country": rng.choice(countries, size=n),
+        "notes": rng.choice(["", "crypto", "Urgent payment", "rent"], size=n),
+    })
+
+
+@pytest.fixture(scope="module")
+def norm_df():
+    df = rr._normalize_columns(_random_tx())
+    return rr._ensure_numeric_amount(df)
+
+
+@pytest.mark.parametrize("p", [0.5, 0.9, 0.98])
+def test_high_amount_matches_reference(norm_df, p):
+    pd.testing.assert_series_equal(
+        rr._rule_high_amount(norm_df, p),
+        rr._rule_high_amount_reference(norm_df, p),
+        check_names=False,
+    )
+
+
+@pytest.mark.parametrize("p", [0.5, 0.98])
+def test_crossborder_matches_reference(norm_df, p):
+    pd.testing.assert_series_equal(
+        rr._rule_crossborder_high(norm_df, p),
+        rr._rule_crossborder_high_reference(norm_df, p),
+        check_names=False,
+    )
+
+
+def test_structuring_matches_reference(norm_df):
+    bands = {"SEK": (9500, 9999.99), "EUR": (950, 999.99), "USD": (950, 999.99), "NOK": ()}
+    pd.testing.assert_series_equal(
+        rr._rule_structuring(norm_df, bands),
+        rr._rule_structuring_reference(norm_df, bands),
+        check_names=False,
+    )
+
+
+def test_score_and_flag_same_output_for_both_engines():
+    df = _random_tx()
+    ref = rr.score_and_flag(df, rr.RiskConfig(rule_engine="reference"))
+    vec = rr.score_and_flag(df, rr.RiskConfig(rule_engine="vectorized"))
+    pd.testing.assert_frame_equal(ref.reset_index(drop=True), vec.reset_index(drop=True))
+
+
+def _velocity_rolling_per_account(df, hours, min_tx):
+    # Fristående facit: rolling per konto, mappat tillbaka via radposition
+    work = df[["from_account", "timestamp"]].dropna().sort_values(["from_account", "timestamp"], kind="stable")
+    hit = pd.Series(False, index=df.index)
+    for _, g in work.groupby("from_account", sort=False):
+        cnt = pd.Series(1, index=pd.DatetimeIndex(g["timestamp"])).rolling(f"{hours}h").sum()
+        hit.loc[g.index[(cnt >= min_tx).to_numpy()]] = True
+    return hit
+
+
+@pytest.mark.parametrize("hours,min_tx", [(24, 3), (72, 5), (1, 2)])
+def test_velocity_matches_rolling_per_account(norm_df, hours, min_tx):
+    pd.testing.assert_series_equal(
+        rr._rule_velocity(norm_df, hours, min_tx),
+        _velocity_rolling_per_account(norm_df, hours, min_tx),
+        check_names=False,
+    )
+
+
+def _pingpong_brute_force(df, days, min_pairs):
+    a = df["from_account"].to_numpy()
+    b = df["to_account"].to_numpy()
+    t = df["timestamp"].to_numpy()
+    tol = np.timedelta64(pd.Timedelta(days=days))
+    hit = np.array([
+        bool(((a == b[i]) & (b == a[i]) & (t <= t[i]) & (t >= t[i] - tol)).any())
+        for i in range(len(df))
+    ])
+    pairs = pd.Series(list(zip(a, b)))
+    per_pair = pd.Series(hit).groupby(pairs).transform("sum").to_numpy()
+    return pd.Series(hit & (per_pair >= min_pairs), index=df.index)
+
+
+@pytest.mark.parametrize("days,min_pairs", [(7, 1), (2, 1), (7, 2), (30, 2)])
+def test_pingpong_matches_brute_force(days, min_pairs):
+    df = rr._ensure_numeric_amount(rr._normalize_columns(_random_tx(n=400, seed=3)))
+    pd.testing.assert_series_equal(
+        rr._rule_pingpong(df, days, min_pairs),
+        _pingpong_brute_force(df, days, min_pairs),
+        check_names=False,
+    )
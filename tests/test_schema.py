@@ -0,0 +1,53 @@
+import pandas as pd
+import pytest
+
+import schema
+from risk_rules import RiskConfig, score_and_flag
+from test_risk_rules_equivalence import _random_tx
+from test_validation_vectorized import _write_transactions
+
+
+@pytest.fixture
+def tx(tmp_path):
+    path = tmp_path / "transactions.csv"
+    _write_transactions(path, n=5000)
+    return path
+
+
+def test_typed_columns_follow_schema(tx):
+    df = schema.read_csv(tx)
+    assert isinstance(df["currency"].dtype, pd.CategoricalDtype)
+    assert df["amount"].dtype == "float64"
+    assert df["transaction_id"].dtype != "category"
+    raw = schema.read_csv(tx, typed=False, categories=False)
+    assert raw.equals(pd.read_csv(tx, dtype=str, keep_default_na=False))
+
+
+def test_categories_use_less_memory(tx):
+    plain = schema.read_csv(tx, typed=False, categories=False).memory_usage(deep=True).sum()
+    cat = schema.read_csv(tx, typed=False).memory_usage(deep=True).sum()
+    assert cat < plain
+
+
+def test_pyarrow_engine_matches_c_engine(tx):
+    pytest.importorskip("pyarrow")
+    for typed in (False, True):
+        pd.testing.assert_frame_equal(schema.read_csv(tx, typed=typed, engine="pyarrow"),
+                                      schema.read_csv(tx, typed=typed), check_dtype=False)
+
+
+def test_chunks_match_whole_file(tx):
+    chunks = pd.concat(schema.read_csv(tx, typed=False, categories=False, chunksize=700), ignore_index=True)
+    assert chunks.equals(schema.read_csv(tx, typed=False, categories=False))
+
+
+def test_flagging_same_with_categories(tmp_path):
+    path = tmp_path / "tx.csv"
+    _random_tx(n=3000, seed=5).to_csv(path, index=False)
+    cfg = RiskConfig(velocity_min_tx=8, velocity_window_hours=48, high_amount_p=0.9)
+    key = ["transaction_id", "reason"]
+    cat = score_and_flag(schema.read_csv(path, typed=False), cfg).astype(str)
+    plain = score_and_flag(schema.read_csv(path, typed=False, categories=False), cfg).astype(str)
+    assert len(plain) > 0
+    pd.testing.assert_frame_equal(cat.sort_values(key, ignore_index=True),
+                                  plain.sort_values(key, ignore_index=True))
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from risk_rules import RiskConfig, score_and_flag
+from threshold_store import ThresholdStore
+from test_risk_rules_equivalence import _random_tx
+
+
+def test_build_then_refresh_tracks_exact_percentiles():
+    df = _random_tx(n=20000, seed=71)
+    df = df.iloc[np.argsort(pd.to_datetime(df["timestamp"]).to_numpy(), kind="stable")]
+    half = len(df) // 2
+    store = ThresholdStore.build(df.iloc[:half], period="W", rank_error=0.002)
+    assert store.refresh(df.iloc[half:]) == len(df) - half
+    assert store.refresh(df) == 0  # allt redan inläst (<= watermark)
+
+    for cur, thr in store.thresholds(0.98).items():
+        amounts = df.loc[df["currency"] == cur, "amount"]
+        assert amounts.quantile(0.976) <= thr <= amounts.quantile(0.984)
+
+
+def test_lookback_limits_periods():
+    df = pd.DataFrame({
+        "timestamp": ["2025-01-10", "2025-02-10", "2025-03-10"],
+        "amount": [1000.0, 10.0, 20.0],
+        "currency": ["SEK"] * 3,
+    })
+    store = ThresholdStore.build(df, period="M", lookback=2)
+    assert store.thresholds(1.0)["SEK"] == 20.0
+    assert store.thresholds(1.0, as_of="2025-02-28")["SEK"] == 1000.0
+
+
+def test_small_batch_uses_stored_thresholds(tmp_path):
+    history = _random_tx(n=5000, seed=72)
+    path = tmp_path / "thr.json"
+    ThresholdStore.build(history).save(path)
+    assert ThresholdStore.load(path) is ThresholdStore.load(path)  # cachad tills filen ändras
+
+    batch = history.iloc[:3].assign(amount=[5.0, 6.0, 7.0], notes="", currency=["SEK", "SEK", "XYZ"])
+    cfg = RiskConfig(velocity_min_tx=100, require_high_for_new_counterparty=True)
+    # Ur batchen själv blir högsta SEK-beloppet "p98"; mot historiken är inget högt.
+    # XYZ saknas i lagret och räknas ur batchen.
+    alone = score_and_flag(batch, cfg)
+    stored = score_and_flag(batch, RiskConfig(velocity_min_tx=100, threshold_store=str(path)))
+    assert set(alone["transaction_id"]) == set(batch["transaction_id"].iloc[1:])
+    assert set(stored["transaction_id"]) == {batch["transaction_id"].iloc[2]}
+
+
+def test_load_rejects_unknown_version(tmp_path):
+    path = tmp_path / "thr.json"
+    path.write_text('{"version": 99}', encoding="utf-8")
+    with pytest.raises(ValueError):
+        ThresholdStore.load(path)
@@ -0,0 +1,51 @@
+import importlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from seen_ids import SeenIds
+from test_validation_vectorized import _printed_counts, _write_transactions
+
+
+@pytest.fixture
+def validation(tmp_path, monkeypatch):
+    mod = importlib.import_module("validation")
+    monkeypatch.setattr(mod, "OUT_DIR", tmp_path)
+    tx = tmp_path / "transactions.csv"
+    _write_transactions(tx, n=20_000, seed=1)
+    monkeypatch.setattr(mod, "TX_IN", tx)
+    return mod
+
+
+@pytest.mark.parametrize("chunksize", [997, 5000, 50_000])
+def test_chunked_matches_in_memory(validation, capsys, tmp_path, chunksize):
+    validation.clean_transactions()
+    expected_counts = _printed_counts(capsys.readouterr().out)
+    expected = (tmp_path / "transactions_clean.csv").read_bytes()
+
+    out = validation.clean_transactions(chunksize=chunksize)
+    assert _printed_counts(capsys.readouterr().out) == expected_counts
+    assert out.read_bytes() == expected
+
+
+def test_chunked_empty_file(validation, capsys, tmp_path):
+    validation.TX_IN.write_text("transaction_id,amount,currency,notes\n", encoding="utf-8")
+    out = validation.clean_transactions(chunksize=100)
+    assert _printed_counts(capsys.readouterr().out) == [0, 0, 0, 0, 0]
+    assert list(pd.read_csv(out).columns) == ["transaction_id", "amount", "currency", "notes"]
+
+
+def test_seen_ids_matches_python_set():
+    rng = np.random.default_rng(0)
+    seen, ref = SeenIds(), set()
+    for size in rng.integers(1, 3000, 40):
+        ids = pd.Series(rng.integers(0, 20_000, size).astype(str))
+        mask = seen.filter_new(ids)
+        expected = []
+        for x in ids:
+            expected.append(x not in ref)
+            ref.add(x)
+        assert mask.tolist() == expected
+    assert len(seen) == len(ref)
+    assert len(seen._runs) <= int(np.log2(len(ref))) + 1
@@ -0,0 +1,117 @@
+import csv
+import datetime as dt
+import importlib
+import re
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from test_personnummer import reference_stage
+
+DATA = Path(__file__).resolve().parents[1] / "data"
+CUSTOMER_FILES = sorted(DATA.glob("sebank_customers_with_accounts*.csv"))
+
+
+# ---------- Gamla radvisa filter (orakel) ----------
+
+def _old_customer_counts(path):
+    df = pd.read_csv(path, dtype=str, keep_default_na=False)
+    counts = [len(df)]
+    df = df[(df["Customer"].str.strip() != "") & (df["BankAccount"].str.strip() != "")]
+    counts.append(len(df))
+
+    def valid_phone(x):
+        x = str(x).strip()
+        return (x == "") or (len(x) >= 7)
+
+    df = df[df["Phone"].apply(valid_phone)]
+    counts.append(len(df))
+
+    # Personnummer: radvis referens för format, datum och kontrollsiffra
+    stage = df["Personnummer"].apply(lambda x: reference_stage(x, dt.date.today()))
+    counts += [int((stage >= 1).sum()), int((stage >= 2).sum()), int((stage >= 3).sum())]
+    df = df[stage == 3]
+    df = df.drop_duplicates(subset=["BankAccount"], keep="first")
+    counts.append(len(df))
+    return counts, df
+
+
+def _old_transaction_counts(path):
+    df = pd.read_csv(path, dtype=str, keep_default_na=False)
+    counts = [len(df)]
+
+    def to_float_ok(x):
+        try:
+            return float(x)
+        except Exception:
+            return None
+
+    df["amount"] = df["amount"].apply(to_float_ok)
+    df = df[df["amount"].apply(lambda v: isinstance(v, float) and v >= 0.01)]
+    counts.append(len(df))
+    df = df[df["currency"].isin({"SEK", "USD", "EUR", "GBP", "NOK", "DKK"})]
+    counts.append(len(df))
+    counts.append(len(df))
+    df = df.drop_duplicates(subset=["transaction_id"], keep="first")
+    counts.append(len(df))
+    return counts, df
+
+
+def _printed_counts(out):
+    return [int(m) for m in re.findall(r"^(?:Totalt|Efter)[^:]*: (\d+)$", out, flags=re.M)]
+
+
+@pytest.fixture
+def validation(tmp_path, monkeypatch):
+    mod = importlib.import_module("validation")
+    monkeypatch.setattr(mod, "OUT_DIR", tmp_path)
+    return mod
+
+
+@pytest.mark.parametrize("path", CUSTOMER_FILES, ids=lambda p: p.name)
+def test_customer_counts_match_old_filters(validation, monkeypatch, capsys, tmp_path, path):
+    monkeypatch.setattr(validation, "CUSTOMERS_IN", path)
+    validation.clean_customers()
+    expected, old_df = _old_customer_counts(path)
+
+    assert _printed_counts(capsys.readouterr().out) == expected
+    new_df = pd.read_csv(tmp_path / "customers_clean.csv", dtype=str, keep_default_na=False)
+    assert new_df["BankAccount"].tolist() == old_df["BankAccount"].tolist()
+
+
+def _write_transactions(path, n=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    odd_amounts = ["", " ", "abc", "1,5", "1_000", " 12.5 ", "1e3", "nan", "NaN", "inf",
+                   "-inf", "0.01", "0.009", "0", "-5", "+7", ".5", "5.", "0x10", "١٢", "1e400"]
+    amounts = np.round(rng.lognormal(6, 1.5, n), 2).astype(str).astype(object)
+    pick = rng.random(n) < 0.1
+    amounts[pick] = rng.choice(odd_amounts, int(pick.sum()))
+    currencies = rng.choice(["SEK", "USD", "EUR", "GBP", "NOK", "DKK", "JPY", ""], n)
+    ids = rng.integers(0, int(n * 0.9), n)
+    with path.open("w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["transaction_id", "amount", "currency", "notes"])
+        for i in range(n):
+            w.writerow([f"T{ids[i]}", amounts[i], currencies[i], "" if i % 7 else "urgent"])
+
+
+def test_transaction_counts_match_old_filters(validation, monkeypatch, capsys, tmp_path):
+    tx = tmp_path / "transactions.csv"
+    _write_transactions(tx)
+    monkeypatch.setattr(validation, "TX_IN", tx)
+    df = validation.clean_transactions()
+    expected, old_df = _old_transaction_counts(tx)
+
+    assert _printed_counts(capsys.readouterr().out) == expected
+    assert df["transaction_id"].tolist() == old_df["transaction_id"].tolist()
+    assert np.array_equal(df["amount"].to_numpy(float), old_df["amount"].to_numpy(float))
+
+
+@pytest.mark.skipif(not (DATA / "transactions.csv").exists(), reason="data/transactions.csv saknas")
+def test_transaction_counts_match_old_filters_on_sample(validation, monkeypatch, capsys):
+    monkeypatch.setattr(validation, "TX_IN", DATA / "transactions.csv")
+    validation.clean_transactions()
+    expected, _ = _old_transaction_counts(DATA / "transactions.csv")
+    assert _printed_counts(capsys.readouterr().out) == expected
@@ -0,0 +1,175 @@
+# threshold_store.py
+from __future__ import annotations
+import argparse
+import json
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import pandas as pd
+
+from quantile_sketch import CurrencySketches
+import schema
+
+STORE_VERSION = 1
+DEFAULT_STORE = "data/state/risk_thresholds.json"
+
+# Laddade lager per sökväg, (mtime, lager); läses om bara när filen ändrats
+_CACHE: Dict[str, Tuple[float, "ThresholdStore"]] = {}
+
+
+class ThresholdStore:
+    """
+    Percentilbaslinjer per valuta och period (t.ex. månad), lagrade som kvantilskisser i en JSON-fil.
+      build():      en gång över historiken
+      refresh():    lägger bara till rader nyare än watermark (skisserna är sammanfogbara)
+      thresholds(): percentil per valuta över de senaste 'lookback' perioderna
+    Rader utan giltig timestamp eller amount räknas inte in.
+    """
+
+    def __init__(self, period: str = "M", lookback: int = 12, rank_error: float = 0.001):
+        self.period = period
+        self.lookback = lookback
+        self.rank_error = rank_error
+        self.periods: Dict[str, CurrencySketches] = {}
+        self.watermark: pd.Timestamp | None = None
+        self._thr_cache: Dict[tuple, dict] = {}
+
+    # ---------- Uppdatering ----------
+
+    @classmethod
+    def build(cls, history: pd.DataFrame, **kwargs) -> "ThresholdStore":
+        store = cls(**kwargs)
+        store.update(history)
+        return store
+
+    def refresh(self, df: pd.DataFrame) -> int:
+        """Lägger in rader med timestamp > watermark. Returnerar antal inlästa rader."""
+        return self.update(df, after=self.watermark)
+
+    def update(self, df: pd.DataFrame, after: pd.Timestamp | None = None) -> int:
+        """
+        Lägger in rader med timestamp > after (None = alla). Vid chunkad inläsning skickas
+        samma 'after' för alla chunkar, eftersom watermark flyttas fram under tiden.
+        """
+        ts = pd.to_datetime(df["timestamp"], errors="coerce", utc=True)
+        amount = pd.to_numeric(df["amount"], errors="coerce")
+        keep = ts.notna() & amount.notna()
+        if after is not None:
+            keep &= ts > after
+        if not keep.any():
+            return 0
+        part = pd.DataFrame({"currency": df["currency"][keep], "amount": amount[keep]})
+        keys = ts[keep].dt.tz_convert("UTC").dt.tz_localize(None).dt.to_period(self.period).astype(str)
+        for key, rows in part.groupby(keys.to_numpy(), sort=False):
+            sketches = self.periods.get(key)
+            if sketches is None:
+                sketches = self.periods[key] = CurrencySketches(rank_error=self.rank_error)
+            sketches.update(rows)
+        self.watermark = ts[keep].max() if self.watermark is None else max(self.watermark, ts[keep].max())
+        self._thr_cache.clear()
+        return int(keep.sum())
+
+    # ---------- Uppslag ----------
+
+    def _window(self, as_of=None) -> CurrencySketches:
+        keys = sorted(self.periods)
+        if as_of is not None:
+            as_of = pd.Timestamp(as_of)
+            if as_of.tzinfo is not None:
+                as_of = as_of.tz_convert("UTC").tz_localize(None)
+            limit = str(as_of.to_period(self.period))
+            keys = [k for k in keys if k <= limit]
+        merged = CurrencySketches(rank_error=self.rank_error)
+        for key in keys[-self.lookback:]:
+            merged.merge(self.periods[key])
+        return merged
+
+    def thresholds(self, p: float, as_of=None) -> dict:
+        """Percentil p per valuta över de senaste 'lookback' perioderna (till och med as_of)."""
+        key = (p, None if as_of is None else str(as_of))
+        if key not in self._thr_cache:
+            self._thr_cache[key] = self._window(as_of).thresholds(p)
+        return dict(self._thr_cache[key])
+
+    # ---------- Persistens ----------
+
+    def to_dict(self) -> dict:
+        return {
+            "version": STORE_VERSION,
+            "period": self.period,
+            "lookback": self.lookback,
+            "rank_error": self.rank_error,
+            "watermark": None if self.watermark is None else self.watermark.isoformat(),
+            "periods": {key: sk.to_dict() for key, sk in self.periods.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "ThresholdStore":
+        if d.get("version") != STORE_VERSION:
+            raise ValueError(f"Okänd version på tröskellager: {d.get('version')!r} (förväntade {STORE_VERSION}).")
+        store = cls(period=d["period"], lookback=d["lookback"], rank_error=d["rank_error"])
+        store.watermark = None if d["watermark"] is None else pd.Timestamp(d["watermark"])
+        store.periods = {key: CurrencySketches.from_dict(sk) for key, sk in d["periods"].items()}
+        return store
+
+    def save(self, path: str | Path = DEFAULT_STORE) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(json.dumps(self.to_dict()), encoding="utf-8")
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: str | Path = DEFAULT_STORE) -> "ThresholdStore":
+        path = Path(path)
+        if not path.exists():
+            raise FileNotFoundError(f"Hittar inte tröskellagret {path} (skapa med: python threshold_store.py build).")
+        mtime = path.stat().st_mtime
+        cached = _CACHE.get(str(path))
+        if cached and cached[0] == mtime:
+            return cached[1]
+        store = cls.from_dict(json.loads(path.read_text(encoding="utf-8")))
+        _CACHE[str(path)] = (mtime, store)
+        return store
+
+
+def _read_history(path: Path, chunksize: Optional[int]):
+    cols = ["timestamp", "amount", "currency"]
+    if chunksize:
+        yield from schema.read_csv(path, usecols=cols, typed=False, categories=False, chunksize=chunksize)
+    else:
+        yield schema.read_csv(path, usecols=cols, typed=False, categories=False)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Bygg eller uppdatera percentilbaslinjer per valuta och period.")
+    ap.add_argument("command", choices=["build", "refresh", "show"])
+    ap.add_argument("--in", dest="inp", default="data/clean/transactions_clean.csv", help="Historik (CSV)")
+    ap.add_argument("--store", default=DEFAULT_STORE, help="Tröskellager (JSON)")
+    ap.add_argument("--period", default="M", help="Periodlängd (pandas period, t.ex. M eller W)")
+    ap.add_argument("--lookback", type=int, default=12, help="Antal perioder som ingår i trösklarna")
+    ap.add_argument("--rank-error", dest="rank_error", type=float, default=0.001, help="Skissernas rangfel")
+    ap.add_argument("--p", type=float, default=0.98, help="Percentil för 'show'")
+    ap.add_argument("--chunksize", type=int, default=500_000, help="Läs historiken i bitar")
+    args = ap.parse_args()
+
+    if args.command == "build":
+        store = ThresholdStore(period=args.period, lookback=args.lookback, rank_error=args.rank_error)
+    else:
+        store = ThresholdStore.load(args.store)
+
+    if args.command in ("build", "refresh"):
+        in_path = Path(args.inp)
+        if not in_path.exists():
+            raise SystemExit(f"Hittar inte {in_path}.")
+        since = store.watermark
+        added = sum(store.update(chunk, after=since) for chunk in _read_history(in_path, args.chunksize))
+        store.save(args.store)
+        print(f"✅ Tröskellager sparat i {args.store} (nya rader={added}, perioder={len(store.periods)}, "
+              f"watermark={store.watermark})")
+    else:
+        for cur, thr in sorted(store.thresholds(args.p).items()):
+            print(f"{cur}: p{args.p * 100:g} = {thr:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,13 @@
 # validation.py
+import argparse
 import pandas as pd
 from pathlib import Path
+from typing import Optional
 from risk_rules import score_and_flag, RiskConfig
+from seen_ids import SeenIds
+from personnummer import check_personnummer, valid_personnummer
+import schema
+from clean_io import CleanWriter, clean_path, write_clean, SUFFIXES, CLEAN_FORMAT
 
 # Infilernas faktiska namn i ditt projekt
 CUSTOMERS_IN = Path("data/sebank_customers_with_accounts.csv")
@@ -13,12 +19,53 @@ TX_IN = Path("data/transactions.csv")
 OUT_DIR = Path("data/clean")
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 
+ALLOWED_CURRENCIES = {"SEK", "USD", "EUR", "GBP", "NOK", "DKK"}
 
-def clean_customers():
+
+# ---------- Vektoriserade predikat ----------
+
+def valid_phone_mask(phone: pd.Series) -> pd.Series:
+    """Telefon — tillåt tomt, annars minst 7 tecken (enkelt krav)."""
+    s = phone.astype(str).str.strip()
+    return (s == "") | (s.str.len() >= 7)
+
+
+def valid_pnr_mask(pnr: pd.Series) -> pd.Series:
+    """Personnummer: format, datum och kontrollsiffra (se personnummer.check_personnummer)."""
+    return pd.Series(valid_personnummer(pnr), index=pnr.index)
+
+
+def parse_amount(amount: pd.Series) -> pd.Series:
+    """
+    Belopp som float (NaN om det inte går att tolka), med samma regler som float().
+    Snabbväg: astype(float) när hela kolumnen går att tolka. Annars pd.to_numeric, och de
+    få icke-tomma värden som då blir NaN (t.ex. "1_000") provas med float().
+    """
+    s = amount.astype(str)
+    try:
+        return s.astype(float)
+    except ValueError:
+        pass
+    out = pd.to_numeric(s, errors="coerce").astype(float)
+    retry = out.isna()
+    retry[retry] = s[retry].str.strip() != ""
+    if retry.any():
+        out[retry] = s[retry].map(_to_float_or_nan)
+    return out
+
+
+def _to_float_or_nan(x) -> float:
+    try:
+        return float(x)
+    except Exception:
+        return float("nan")
+
+
+def clean_customers(fmt: Optional[str] = None, write: bool = True) -> pd.DataFrame:
     if not CUSTOMERS_IN.exists():
         raise FileNotFoundError(f"Hittar inte kundfilen: {CUSTOMERS_IN}")
 
-    df = pd.read_csv(CUSTOMERS_IN, dtype=str, keep_default_na=False)
+    df = schema.read_csv(CUSTOMERS_IN, typed=False)
     print(f"Totalt kunder innan validering: {len(df)}")
 
     # Säkerställ kolumnnamn (de finns redan så detta är mest explicit)
@@ -35,78 +82,121 @@ def clean_customers():
     print(f"Efter dropna på Customer och BankAccount: {len(df)}")
 
     # Telefon — tillåt tomt, annars minst 7 tecken (enkelt krav)
-    def valid_phone(x: str) -> bool:
-        x = str(x).strip()
-        return (x == "") or (len(x) >= 7)
-
-    df = df[df["Phone"].apply(valid_phone)]
+    df = df[valid_phone_mask(df["Phone"])]
     print(f"Efter telefonfilter: {len(df)}")
 
-    # Personnummer: enkelt format XXXXXX-XXXX
-    def valid_pnr(x: str) -> bool:
-        x = str(x).strip()
-        return len(x) == 11 and x[6] == "-"
-
-    df = df[df["Personnummer"].apply(valid_pnr)]
-    print(f"Efter personnummerfilter: {len(df)}")
+    # Personnummer: format (ÅÅMMDD-NNNK, ÅÅMMDD+NNNK, 10/12 siffror), datum och Luhn-kontrollsiffra
+    pnr = check_personnummer(df["Personnummer"])
+    print(f"Efter personnummerfilter: {int(pnr.format_ok.sum())}")
+    print(f"Efter datumkontroll av personnummer: {int(pnr.date_ok.sum())}")
+    print(f"Efter kontrollsiffra (Luhn) för personnummer: {int(pnr.luhn_ok.sum())}")
+    df = df[pnr.luhn_ok]
 
     # En kund per konto
     df = df.drop_duplicates(subset=["BankAccount"], keep="first")
     print(f"Efter drop_duplicates på BankAccount: {len(df)}")
 
-    out = OUT_DIR / "customers_clean.csv"
-    df.to_csv(out, index=False)
-    print(f"\nKunddata sparad i {out}\n")
+    if write:
+        out = write_clean(df, clean_path(OUT_DIR / "customers_clean.csv", fmt))
+        print(f"\nKunddata sparad i {out}\n")
+    return df
 
 
-def clean_transactions():
-    if not TX_IN.exists():
-        raise FileNotFoundError(f"Hittar inte transaktionsfilen: {TX_IN}")
+_TX_STEPS = ("Efter filter på amount >= 0.01", "Efter valutafilter", "Efter dropna på notes")
 
-    df = pd.read_csv(TX_IN, dtype=str, keep_default_na=False)
-    print(f"Totalt transaktioner innan validering: {len(df)}")
 
-    # amount -> float och >= 0.01
-    def to_float_ok(x):
-        try:
-            return float(x)
-        except Exception:
-            return None
+def _tx_key(columns) -> str:
+    key = "transaction_id" if "transaction_id" in columns else ("id" if "id" in columns else None)
+    if key is None:
+        raise ValueError("Hittar varken 'transaction_id' eller 'id' i transaktionsfilen.")
+    return key
+
 
-    df["amount"] = df["amount"].apply(to_float_ok)
-    df = df[df["amount"].apply(lambda v: isinstance(v, float) and v >= 0.01)]
-    print(f"Efter filter på amount >= 0.01: {len(df)}")
+def _filter_transactions(df: pd.DataFrame):
+    """Radfiltren före dedup. Returnerar (df, antal rader efter varje steg i _TX_STEPS)."""
+    counts = []
+
+    # amount -> float och >= 0.01 (NaN klarar aldrig jämförelsen)
+    df["amount"] = parse_amount(df["amount"])
+    df = df[df["amount"] >= 0.01]
+    counts.append(len(df))
 
     # Begränsa valutor (justera vid behov)
-    allowed = {"SEK", "USD", "EUR", "GBP", "NOK", "DKK"}
     if "currency" in df.columns:
-        df = df[df["currency"].isin(allowed)]
-    print(f"Efter valutafilter: {len(df)}")
+        df = df[df["currency"].isin(ALLOWED_CURRENCIES)]
+    counts.append(len(df))
 
     # notes aldrig NaN
     if "notes" in df.columns:
         df["notes"] = df["notes"].fillna("")
-    print(f"Efter dropna på notes: {len(df)}")
+    counts.append(len(df))
+    return df, counts
+
+
+def clean_transactions(chunksize: Optional[int] = None, fmt: Optional[str] = None, write: bool = True):
+    """
+    Validerar TX_IN och skriver OUT_DIR/transactions_clean.csv (eller .parquet med fmt="parquet").
+    Returnerar den städade DataFrame:n.
+    Med chunksize läses och skrivs filen i bitar i stället (se _clean_transactions_chunked)
+    och sökvägen till den städade filen returneras. write=False hoppar över utfilen (ej chunkat läge).
+    """
+    if not TX_IN.exists():
+        raise FileNotFoundError(f"Hittar inte transaktionsfilen: {TX_IN}")
+    if chunksize:
+        return _clean_transactions_chunked(chunksize, fmt)
+
+    # Råtext (beloppen valideras här), men valutor/länder/konton som kategorier
+    df = schema.read_csv(TX_IN, typed=False)
+    print(f"Totalt transaktioner innan validering: {len(df)}")
+
+    df, counts = _filter_transactions(df)
+    for label, n in zip(_TX_STEPS, counts):
+        print(f"{label}: {n}")
 
     # unika transaktioner
-    key = "transaction_id" if "transaction_id" in df.columns else ("id" if "id" in df.columns else None)
-    if key is None:
-        raise ValueError("Hittar varken 'transaction_id' eller 'id' i transaktionsfilen.")
+    key = _tx_key(df.columns)
     df = df.drop_duplicates(subset=[key], keep="first")
     print(f"Efter drop_duplicates på {key}: {len(df)}")
 
-    out = OUT_DIR / "transactions_clean.csv"
-    df.to_csv(out, index=False)
-    print(f"\nTransaktionsdata sparad i {out}\n")
+    if write:
+        out = write_clean(df, clean_path(OUT_DIR / "transactions_clean.csv", fmt))
+        print(f"\nTransaktionsdata sparad i {out}\n")
 
     return df
 
 
-def flag_suspected_transactions(df_tx: pd.DataFrame):
+def _clean_transactions_chunked(chunksize: int, fmt: Optional[str] = None) -> Path:
+    """
+    Strömmande variant: chunkar om chunksize rader valideras och skrivs löpande. Dubbletter över
+    chunkgränserna fångas med en SeenIds-mängd (8 byte per unikt id), så minnet beror på
+    chunkstorleken och antalet unika id:n, inte på filens storlek. Samma antal per filter
+    skrivs ut i slutet som i minnesläget.
+    """
+    columns = pd.read_csv(TX_IN, dtype=str, nrows=0).columns
+    key = _tx_key(columns)
+    writer = CleanWriter(clean_path(OUT_DIR / "transactions_clean.csv", fmt))
+    seen = SeenIds()
+    total, counts = 0, [0] * len(_TX_STEPS)
+    for chunk in schema.read_csv(TX_IN, typed=False, chunksize=chunksize):
+        total += len(chunk)
+        chunk, step_counts = _filter_transactions(chunk)
+        counts = [a + b for a, b in zip(counts, step_counts)]
+        chunk = chunk[seen.filter_new(chunk[key])]
+        writer.write(chunk)
+    out = writer.close(columns)
+
+    print(f"Totalt transaktioner innan validering: {total}")
+    for label, n in zip(_TX_STEPS, counts):
+        print(f"{label}: {n}")
+    print(f"Efter drop_duplicates på {key}: {len(seen)}")
+    print(f"\nTransaktionsdata sparad i {out} (chunkad, {chunksize} rader per chunk, "
+          f"sedda id:n {seen.nbytes / 1024 ** 2:.1f} MB)\n")
+    return out
+
+
+def flag_config() -> RiskConfig:
     # Konfig som matchar din nuvarande risk_rules.RiskConfig
-    from risk_rules import RiskConfig, score_and_flag
-
-    cfg = RiskConfig(
+    return RiskConfig(
         # Bas
         high_amount_p=0.98,
         crossborder_p=0.98,
@@ -134,18 +224,42 @@ def flag_suspected_transactions(df_tx: pd.DataFrame):
         # cap_per_reason=3000,
     )
 
-    flagged = score_and_flag(df_tx, cfg=cfg)
-    out = OUT_DIR / "flagged_transactions.csv"
-    flagged.to_csv(out, index=False)
 
-    print("\nFlaggade transaktioner sparade i data/clean/flagged_transactions.csv")
+def flag_suspected_transactions(df_tx, max_memory: str = "2G", fmt: Optional[str] = None, write: bool = True):
+    """
+    df_tx: DataFrame, eller sökväg till städad fil (chunkat läge, flaggas out-of-core).
+    Returnerar de flaggade raderna (i chunkat läge bara antalet).
+    """
+    cfg = flag_config()
+    out = clean_path(OUT_DIR / "flagged_transactions.csv", fmt)
+    if isinstance(df_tx, Path):
+        from risk_chunked import score_and_flag_chunked
+        n = score_and_flag_chunked(df_tx, out, cfg, max_memory=max_memory)
+        print(f"\nFlaggade transaktioner sparade i {out}")
+        print(f"Antal flaggade: {n}")
+        return n
+
+    flagged = score_and_flag(df_tx, cfg=cfg)
+    if write:
+        write_clean(flagged, out)
+        print(f"\nFlaggade transaktioner sparade i {out}")
     print(f"Antal flaggade: {len(flagged)}")
     if len(flagged):
         print("Exempel (topp 5):")
         print(flagged.head(5).to_string(index=False))
+    return flagged
 
 
 if __name__ == "__main__":
-    clean_customers()
-    tx = clean_transactions()
-    flag_suspected_transactions(tx)
+    ap = argparse.ArgumentParser(description="Validera kunder och transaktioner och flagga misstänkta transaktioner.")
+    ap.add_argument("--chunksize", type=int, default=None,
+                    help="Läs transaktionerna i bitar om N rader (t.ex. 500000); minnet hålls konstant")
+    ap.add_argument("--max-memory", dest="max_memory", default="2G",
+                    help="Minnesbudget för flaggningen i chunkat läge (t.ex. 2G)")
+    ap.add_argument("--format", dest="fmt", choices=sorted(SUFFIXES), default=CLEAN_FORMAT,
+                    help="Format för filerna i data/clean (standard SPBANK_CLEAN_FORMAT eller csv)")
+    args = ap.parse_args()
+
+    clean_customers(fmt=args.fmt)
+    tx = clean_transactions(chunksize=args.chunksize, fmt=args.fmt)
+    flag_suspected_transactions(tx, max_memory=args.max_memory, fmt=args.fmt)